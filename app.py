@@ -1,24 +1,368 @@
-from flask import Flask, render_template, request, g, flash, redirect, url_for
+from flask import Flask, render_template, request, g, flash, redirect, url_for, jsonify, Response, make_response, session
+from flask import before_render_template, template_rendered
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import is_resource_modified
+from markupsafe import Markup
 import database_functions as db
+import columnar
+import metrics
+import replica
+import warmer
 import sqlite3
+import logging
+import os
+import io
+import csv
+import json
+import functools
+import threading
+import time
+import concurrent.futures
+import cProfile
+import pstats
+from datetime import datetime, timezone
+
+logging.basicConfig(level=os.environ.get('NFL_LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_for_flash_messages'  # Required for flash messaging
 
 DATABASE = 'nfl_stats.sqlite'
+app.config['DB_POOL_SIZE'] = int(os.environ.get('NFL_DB_POOL_SIZE', 8))
+# Serve leaderboards from the in-memory columnar engine (needs numpy)
+app.config['COLUMNAR'] = os.environ.get('NFL_COLUMNAR', '0') == '1'
+# Precompute the /stats dashboard tables in the background at startup
+app.config['WARM_CACHE'] = os.environ.get('NFL_WARM_CACHE', '1') == '1'
+app.config['WARM_WORKERS'] = int(os.environ.get('NFL_WARM_WORKERS', 2))
+# Seconds between background WAL checkpoints (0 leaves them to SQLite)
+app.config['CHECKPOINT_SECONDS'] = float(os.environ.get('NFL_CHECKPOINT_SECONDS', 30))
+# Serve reads from a per-worker in-memory copy of the database, checked
+# for other processes' writes every REPLICA_SECONDS
+app.config['REPLICA'] = os.environ.get('NFL_REPLICA', '0') == '1'
+app.config['REPLICA_SECONDS'] = float(os.environ.get('NFL_REPLICA_SECONDS', 1))
+# Threads running /dashboard panels, shared by all requests; each holds a
+# read connection while its panel runs
+app.config['DASHBOARD_WORKERS'] = int(os.environ.get('NFL_DASHBOARD_WORKERS', 7))
+# One JSON line per request on the 'access' logger, with its timings
+app.config['ACCESS_LOG'] = os.environ.get('NFL_ACCESS_LOG', '1') == '1'
+# Lets a request ask for its own cProfile stats with ?profile=1
+app.config['PROFILING'] = os.environ.get('NFL_PROFILING', '0') == '1'
+# Reuse rendered tab partials while the data they show has not changed
+app.config['FRAGMENT_CACHE'] = os.environ.get('NFL_FRAGMENT_CACHE', '1') == '1'
+# Longest /api/changes long poll, in seconds; each one holds a worker thread
+app.config['CHANGES_MAX_WAIT'] = float(os.environ.get('NFL_CHANGES_MAX_WAIT', 30))
+
+# Default season for demo
+DEFAULT_SEASON = 2024
+
+# Rows per page for the paginated game-log / schedule APIs
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+_pool = None
+_analytics = None
+_warmer = None
+_checkpointer = None
+_replica = None
+_dashboard_executor = None
+
+def get_pool():
+    """Creates the shared connection pool on first use."""
+    global _pool
+    if _pool is None:
+        _pool = db.ConnectionPool(DATABASE, size=app.config['DB_POOL_SIZE'])
+    return _pool
+
+def get_read_pool():
+    """Where reads get their connections: the in-memory replica when enabled, else the pool."""
+    if app.config['REPLICA']:
+        return start_replica()
+    return get_pool()
 
 def get_db():
-    """Opens a new database connection if there is none yet for the current application context."""
+    """Checks a connection for reads out for the current application context."""
     if 'db' not in g:
-        g.db = db.openConnection(DATABASE)
+        g.db = get_read_pool().acquire()
     return g.db
 
+def get_write_db():
+    """Checks a pooled connection to the database file out, for routes that write."""
+    if not app.config['REPLICA']:
+        return get_db()
+    if 'write_db' not in g:
+        g.write_db = get_pool().acquire()
+    return g.write_db
+
+def stats_source():
+    """
+    Where the leaderboard queries run: the columnar engine when enabled and
+    numpy is available, otherwise database_functions. Both take the same
+    arguments and return the same rows.
+    """
+    global _analytics
+    if not (app.config['COLUMNAR'] and columnar.AVAILABLE):
+        return db
+    if _analytics is None:
+        _analytics = columnar.ColumnarStats()
+        _analytics.attach()
+    return _analytics
+
 @app.teardown_appcontext
 def close_db(error):
-    """Closes the database again at the end of the request."""
+    """Returns the connections to their pools at the end of the request."""
     db_conn = g.pop('db', None)
     if db_conn is not None:
-        db.closeConnection(db_conn, DATABASE)
+        get_read_pool().release(db_conn)
+    write_conn = g.pop('write_db', None)
+    if write_conn is not None:
+        get_pool().release(write_conn)
+
+@app.route('/health')
+def health():
+    """Connection pool status; 503 if the database does not answer."""
+    status = get_pool().healthCheck()
+    return jsonify(status), (200 if status['ok'] else 503)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Hit / miss / eviction counters of the query result and profile caches, writer lock and WAL numbers, the fragment cache, plus replica, columnar engine and cache warmer status when enabled."""
+    stats = {**db.resultCache.stats(), 'profiles': db.profileCache.stats(), 'writes': db.writerStats()}
+    if _checkpointer is not None:
+        stats['checkpointer'] = _checkpointer.stats()
+    if _replica is not None:
+        stats['replica'] = _replica.stats()
+    if _analytics is not None:
+        stats['columnar'] = _analytics.stats()
+    if _warmer is not None:
+        stats['warmer'] = _warmer.stats()
+    stats['fragments'] = fragmentCache.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Per-function latency, cache and pool numbers for Prometheus."""
+    cache = db.resultCache.stats()
+    counters = {
+        'nfl_db_cache_hits_total': cache['hits'],
+        'nfl_db_cache_misses_total': cache['misses'],
+        'nfl_db_cache_evictions_total': cache['evictions'],
+    }
+    gauges = {'nfl_db_cache_entries': cache['entries']}
+    if _pool is not None:
+        pool = _pool.stats()
+        gauges['nfl_db_pool_open'] = pool['open']
+        gauges['nfl_db_pool_in_use'] = pool['in_use']
+    return Response(metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+def slow_calls():
+    """The most recent calls slower than metrics.SLOW_CALL_SECONDS, with their SQL."""
+    return jsonify(list(metrics.slowCalls))
+
+# ---------------------------------------------------------------------
+# REQUEST TIMING
+# ---------------------------------------------------------------------
+# Every response carries a Server-Timing header splitting its time into
+# database_functions calls (db), template rendering (render), form
+# parsing (form, POSTs only) and the whole request (total), and the same
+# numbers go to the access log. Streamed bodies are sent after the
+# header, so exports only count the time until the first chunk.
+
+access_log = logging.getLogger('access')
+
+# Lines and sort orders of the ?profile=1 report
+PROFILE_LINES = 40
+PROFILE_SORTS = ('cumulative', 'tottime', 'calls')
+
+@app.before_request
+def start_timing():
+    """Starts the request's clocks, and its profiler for ?profile=1 when PROFILING is on."""
+    g.request_start = time.perf_counter()
+    g.render_seconds = 0.0
+    g.timings = metrics.startCollecting()
+    if app.config['PROFILING'] and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    if request.method == 'POST':
+        # Parsed here rather than wherever the view first reads it, so its cost shows on its own
+        start = time.perf_counter()
+        request.form
+        g.form_seconds = time.perf_counter() - start
+
+def _render_started(sender, template, context, **extra):
+    g.setdefault('render_starts', []).append(time.perf_counter())
+
+def _render_finished(sender, template, context, **extra):
+    starts = g.get('render_starts')
+    if not starts:
+        return
+    start = starts.pop()
+    # A template rendered while rendering another is part of the outer one's time
+    if not starts and 'render_seconds' in g:
+        g.render_seconds += time.perf_counter() - start
+
+before_render_template.connect(_render_started, app)
+template_rendered.connect(_render_finished, app)
+
+def _server_timing(parts):
+    entries = []
+    for name, seconds, desc in parts:
+        entry = f'{name};dur={seconds * 1000:.3f}'
+        entries.append(f'{entry};desc="{desc}"' if desc else entry)
+    return ', '.join(entries)
+
+def _profile_response(profiler, response):
+    """The request's cProfile report as plain text, in place of its response."""
+    sort = request.args.get('sort', 'cumulative')
+    out = io.StringIO()
+    out.write(f"{request.method} {request.full_path} -> {response.status}\n")
+    out.write(f"Server-Timing: {response.headers.get('Server-Timing')}\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(sort if sort in PROFILE_SORTS else 'cumulative').print_stats(PROFILE_LINES)
+    profiled = Response(out.getvalue(), mimetype='text/plain')
+    profiled.headers['Server-Timing'] = response.headers.get('Server-Timing')
+    profiled.cache_control.no_store = True
+    return profiled
+
+@app.after_request
+def emit_timing(response):
+    """Adds the Server-Timing header, writes the access log line and swaps in the profile report."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+    timings = metrics.stopCollecting()
+    if timings is None or 'request_start' not in g:
+        return response
+    total = time.perf_counter() - g.request_start
+    form = g.get('form_seconds')
+    parts = [('db', timings.seconds, f'{timings.calls} calls'), ('render', g.render_seconds, None)]
+    if form is not None:
+        parts.append(('form', form, None))
+    parts.append(('total', total, None))
+    response.headers['Server-Timing'] = _server_timing(parts)
+
+    if app.config['ACCESS_LOG']:
+        access_log.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('latin-1'),
+            'status': response.status_code,
+            'bytes': response.calculate_content_length(),
+            'total_ms': round(total * 1000, 3),
+            'db_ms': round(timings.seconds * 1000, 3),
+            'db_calls': timings.calls,
+            'render_ms': round(g.render_seconds * 1000, 3),
+            'form_ms': round(form * 1000, 3) if form is not None else None,
+            'functions': {name: {'calls': calls, 'ms': round(seconds * 1000, 3)}
+                          for name, (calls, seconds) in sorted(timings.functions.items())},
+        }))
+    if profiler is not None:
+        response = _profile_response(profiler, response)
+    return response
+
+def conditional(view):
+    """
+    Conditional GET for a read-only view: its responses carry an ETag and
+    Last-Modified taken from the database's write counter, and a request
+    whose If-None-Match / If-Modified-Since still matches gets a 304
+    without the view (or its queries) running at all. The version is read
+    before the view runs, so a write that lands in between only ever makes
+    the tag older than the data, never newer.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # A pending flash message is one-off page content, not data
+        if '_flashes' in session:
+            return view(*args, **kwargs)
+        tag, modified_at = db.getDataVersion(get_db())
+        if tag is None:
+            return view(*args, **kwargs)
+        modified_at = datetime.fromtimestamp(modified_at, timezone.utc)
+        if not is_resource_modified(request.environ, etag=tag, last_modified=modified_at):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(tag)
+        response.last_modified = modified_at
+        # Caches may keep the copy but must check back every time
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+# ---------------------------------------------------------------------
+# PAGE FRAGMENTS
+# ---------------------------------------------------------------------
+# index.html is a shell (navigation, flash messages, tab buttons) around
+# one partial per tab in templates/partials. A page renders only its own
+# tab's partial with data; the others render without any, which never
+# changes. Rendered partials are cached on the route, its arguments and
+# the data version, so a repeat view of unchanged data renders nothing
+# but the shell. The /fragment routes send just the one panel.
+
+TAB_PARTIALS = {tab: f'partials/{tab}.html' for tab in ('stats', 'team', 'player', 'admin')}
+
+fragmentCache = db.ResultCache(max_entries=512, ttl=3600.0)
+fragmentCache.enabled = app.config['FRAGMENT_CACHE']
+
+def load_templates():
+    """Compiles index.html and every partial up front, instead of on the first request for each."""
+    for name in ('index.html',) + tuple(TAB_PARTIALS.values()):
+        app.jinja_env.get_template(name)
+
+def render_fragment(tab, key=(), build=dict):
+    """
+    One tab's partial, rendered with the context build() returns (None if
+    build() does). `key` must hold whatever else the context depends on,
+    usually the route and its arguments; the data version is added to it.
+    A partial rendered with no key and no build has no data and is cached
+    for good.
+    """
+    version = db.getDataVersion(get_db())[0] if key else None
+    cache_key = (tab, key, version)
+    cacheable = not key or version is not None
+    if cacheable:
+        hit, html = fragmentCache.get(cache_key)
+        if hit:
+            return Markup(html)
+    generation = fragmentCache.generation
+    context = build()
+    if context is None:
+        return None
+    html = render_template(TAB_PARTIALS[tab], **context)
+    if cacheable:
+        fragmentCache.put(cache_key, html, generation)
+    return Markup(html)
+
+def render_page(active_tab=None, panel=None):
+    """index.html with `panel` (from render_fragment) in the active tab and the other tabs empty."""
+    panels = {tab: render_fragment(tab) for tab in TAB_PARTIALS}
+    if panel is not None:
+        panels[active_tab] = panel
+    return render_template('index.html', active_tab=active_tab, panels=panels)
+
+def stats_context(stat_type, args):
+    data, title, headers, value_key, season = dashboard_stats(get_db(), stat_type, args)
+    return dict(stats_data=data, stats_title=title, stats_headers=headers, season=season,
+                stat_type=stat_type, stats_value_key=value_key)
+
+def team_context(team, season):
+    conn = get_db()
+    return dict(schedule=db.getTeamSchedule(conn, team, season), record=db.get_team_record(conn, team, season),
+                team_searched=team, season_searched=season)
+
+def player_context(player_id):
+    profile = db.getPlayerProfile(get_db(), player_id)
+    if profile is None:
+        return None
+    return dict(player_search_result=profile['bio'], career_stats=profile['career_stats'],
+                player_teams=profile['teams'], matchup_history=profile['matchups'],
+                matchup_next=profile['matchups_next'], matchup_page_size=PAGE_SIZE)
+
+def _args_key(args):
+    return tuple(sorted(args.items(multi=True)))
 
 # ---------------------------------------------------------------------
 # ROUTES
@@ -27,41 +371,43 @@ def close_db(error):
 @app.route('/')
 def index():
     """Renders the main dashboard."""
-    return render_template('index.html')
+    return render_page()
 
-@app.route('/stats/<stat_type>')
-def view_stats(stat_type):
-    """Handles fetching and displaying various statistics tables."""
-    conn = get_db()
+def build_stats(conn, stat_type, args):
+    """
+    Runs the query behind /stats/<stat_type> for the given query args.
+    Returns (data, title, headers, value_key, season); raises ValueError
+    for an invalid request. An unknown stat_type gives an empty table.
+    """
+    season = args.get('season', default=DEFAULT_SEASON, type=int)
+    source = stats_source()
     data = []
     title = ""
     headers = []
-    
-    # Default season for demo
-    season = request.args.get('season', default=2024, type=int)
+    value_key = None
 
     if stat_type == 'top_qbs':
-        data = db.getTop5QBsByPassingYards(conn, season)
+        data = source.getTop5QBsByPassingYards(conn, season)
         title = f"Top 5 QBs by Passing Yards ({season})"
         headers = ["ID", "Player Name", "Passing Yards"]
         
     elif stat_type == 'top_rbs':
-        data = db.getTop5RBsByRushingYards(conn, season)
+        data = source.getTop5RBsByRushingYards(conn, season)
         title = f"Top 5 RBs by Rushing Yards ({season})"
         headers = ["ID", "Player Name", "Rushing Yards"]
 
     elif stat_type == 'top_wrs':
-        data = db.getTop5WRsByReceivingYards(conn, season)
+        data = source.getTop5WRsByReceivingYards(conn, season)
         title = f"Top 5 WRs by Receiving Yards ({season})"
         headers = ["ID", "Player Name", "Receiving Yards"]
 
     elif stat_type == 'all_time_tds':
-        data = db.getTopPlayersAllTimeByTouchdowns(conn)
+        data = source.getTopPlayersAllTimeByTouchdowns(conn)
         title = "Top Players All-Time by Touchdowns"
         headers = ["ID", "Player Name", "Total TDs"]
 
     elif stat_type == 'lowest_int':
-        data = db.getQBsLowestInterceptionAvgMinTD(conn)
+        data = source.getQBsLowestInterceptionAvgMinTD(conn)
         title = "QBs with Lowest Interception Avg (Min 10 TDs)"
         headers = ["ID", "Player Name", "Avg Int/Game", "Total TDs"]
 
@@ -75,76 +421,463 @@ def view_stats(stat_type):
         title = f"Best Coaching Record in the past 7 Seasons"
         headers = ["Coach Name", "Team", "Wins", "Losses", "Super Bowl Wins"]
 
-    return render_template('index.html', stats_data=data, stats_title=title, stats_headers=headers, active_tab='stats', season=season, stat_type=stat_type)
+    elif stat_type == 'leaders':
+        # Any leaderboard: /stats/leaders?stat=receptions&position=TE&season_from=2020&season_to=2024
+        stat = args.get('stat', default='passing_yards')
+        if stat not in db.LEADER_STATS:
+            raise ValueError(f"Unknown stat '{stat}'. Choose one of: {', '.join(db.LEADER_STATS)}")
+
+        season_from = args.get('season_from', type=int)
+        season_to = args.get('season_to', type=int)
+        if season_from is None and season_to is None and 'all_time' not in args:
+            season_from = season_to = season
+        top_n = args.get('top_n', default=5, type=int)
+        position = args.get('position') or None
+
+        data = source.getLeaders(conn, stat,
+                                 season_from=season_from,
+                                 season_to=season_to,
+                                 position=position.upper() if position else None,
+                                 conference=args.get('conference') or None,
+                                 division=args.get('division') or None,
+                                 top_n=top_n,
+                                 min_games=args.get('min_games', default=0, type=int),
+                                 ascending=args.get('order') == 'asc')
+
+        label = stat.replace('_', ' ').title()
+        if season_from is not None and season_from == season_to:
+            span = str(season_from)
+        else:
+            span = f"{season_from or 'first'}-{season_to or 'latest'}"
+        title = f"Top {top_n} {position.upper() + 's' if position else 'Players'} by {label} ({span})"
+        headers = ["ID", "Player Name", label]
+        value_key = db.LEADER_STATS[stat][1]
+
+    return data, title, headers, value_key, season
+
+# The /stats tables the cache warmer keeps precomputed: one per season,
+# and ones that do not depend on the season
+SEASON_STATS = ('top_qbs', 'top_rbs', 'top_wrs', 'division_winners')
+GLOBAL_STATS = ('all_time_tds', 'lowest_int', 'best_coach')
+
+def _warm_stats(conn, stat_type, season):
+    args = MultiDict({'season': season} if season is not None else {})
+    return build_stats(conn, stat_type, args)[:4]
+
+def start_warmer():
+    """Starts the background cache warmer (once)."""
+    global _warmer
+    if _warmer is None:
+        _warmer = warmer.CacheWarmer(get_read_pool(), _warm_stats, SEASON_STATS, GLOBAL_STATS,
+                                     workers=app.config['WARM_WORKERS'])
+        _warmer.start()
+    return _warmer
+
+def start_replica():
+    """Copies the database into memory and starts following its writes (once)."""
+    global _replica
+    if _replica is None:
+        _replica = replica.Replica(DATABASE, size=app.config['DB_POOL_SIZE'],
+                                   interval=app.config['REPLICA_SECONDS'])
+        _replica.start()
+    return _replica
+
+def start_checkpointer():
+    """Starts the background WAL checkpointer (once)."""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = db.Checkpointer(DATABASE, interval=app.config['CHECKPOINT_SECONDS'])
+        _checkpointer.start()
+    return _checkpointer
+
+_background_started = False
+_background_lock = threading.Lock()
+
+@app.before_request
+def start_background():
+    """
+    Starts the enabled background work -- replica, cache warmer, WAL
+    checkpointer -- when this process serves its first request. Not at
+    import, so importing app.py opens no database and starts no thread,
+    and the debug reloader's watcher process, which serves nothing,
+    starts none of it.
+    """
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        # The replica first: it has to follow a write before the warmer recomputes from it
+        if app.config['REPLICA']:
+            start_replica()
+        if app.config['WARM_CACHE']:
+            start_warmer()
+        if app.config['CHECKPOINT_SECONDS'] > 0:
+            start_checkpointer()
+        _background_started = True
+
+def stop_background():
+    """Stops whatever start_background() and the first reads started, and closes the pool."""
+    global _background_started, _warmer, _checkpointer, _replica, _pool
+    with _background_lock:
+        if _warmer is not None:
+            _warmer.stop()
+        if _checkpointer is not None:
+            _checkpointer.stop()
+        if _replica is not None:
+            _replica.stop()
+        if _pool is not None:
+            _pool.close()
+        _warmer = _checkpointer = _replica = _pool = None
+        _background_started = False
+
+def dashboard_stats(conn, stat_type, args):
+    """build_stats, answered by the cache warmer for the plain dashboard tables."""
+    if _warmer is not None and stat_type in SEASON_STATS + GLOBAL_STATS and set(args) <= {'season'}:
+        season = args.get('season', default=DEFAULT_SEASON, type=int)
+        hit, value = _warmer.lookup(conn, stat_type, season)
+        if hit:
+            data, title, headers, value_key = value
+            return list(data), title, headers, value_key, season
+    return build_stats(conn, stat_type, args)
+
+# The panels of /dashboard/<season>, in display order
+DASHBOARD_PANELS = ('top_qbs', 'top_rbs', 'top_wrs', 'all_time_tds', 'lowest_int', 'division_winners', 'best_coach')
+
+def get_dashboard_executor():
+    """Creates the thread pool the /dashboard panels run on, on first use."""
+    global _dashboard_executor
+    if _dashboard_executor is None:
+        _dashboard_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=app.config['DASHBOARD_WORKERS'], thread_name_prefix='dashboard')
+    return _dashboard_executor
+
+def _dashboard_panel(stat_type, season):
+    """One /dashboard panel, on a read-only connection of its own."""
+    start = time.perf_counter()
+    pool = get_read_pool()
+    conn = pool.acquire()
+    try:
+        with db.readOnly(conn), metrics.collecting() as timings:
+            data, title, headers, value_key, _ = dashboard_stats(conn, stat_type, MultiDict({'season': season}))
+    finally:
+        pool.release(conn)
+    panel = {'title': title, 'headers': headers, 'value_key': value_key,
+             'rows': [dict(row) for row in data],
+             'ms': round((time.perf_counter() - start) * 1000, 3)}
+    return panel, timings
+
+@app.route('/dashboard/<int:season>')
+@conditional
+def season_dashboard(season):
+    """
+    Every /stats dashboard table for a season in one JSON response. The
+    panels run at the same time on the dashboard thread pool, so the
+    response takes as long as the slowest one; each reports its own 'ms'.
+    A panel that fails carries an 'error' instead of rows.
+    """
+    start = time.perf_counter()
+    executor = get_dashboard_executor()
+    futures = {stat_type: executor.submit(_dashboard_panel, stat_type, season) for stat_type in DASHBOARD_PANELS}
+    panels = {}
+    for stat_type, future in futures.items():
+        try:
+            panels[stat_type], timings = future.result()
+            # Server-Timing's db then adds up the panels' threads, so it can exceed total
+            g.timings.merge(timings)
+        except Exception as e:
+            app.logger.error("Error in dashboard panel %s: %s", stat_type, e)
+            panels[stat_type] = {'error': str(e)}
+    return jsonify({'season': season, 'panels': panels,
+                    'ms': round((time.perf_counter() - start) * 1000, 3)})
+
+@app.route('/fragment/stats/<stat_type>')
+@conditional
+def stats_fragment(stat_type):
+    """Just the statistics panel of /stats/<stat_type>, same query args."""
+    try:
+        return render_fragment('stats', ('stats', stat_type, _args_key(request.args)),
+                               lambda: stats_context(stat_type, request.args))
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+
+@app.route('/fragment/team/<team>/<season>')
+@conditional
+def team_fragment(team, season):
+    """Just the Team Center panel for a team and season."""
+    team = team.upper()
+    return render_fragment('team', ('team', team, season), lambda: team_context(team, season))
+
+@app.route('/fragment/player/<player_id>')
+@conditional
+def player_fragment(player_id):
+    """Just the Player Lookup panel for one player."""
+    panel = render_fragment('player', ('player', player_id), lambda: player_context(player_id))
+    if panel is None:
+        return Response(f"No player with id '{player_id}'", status=404, mimetype='text/plain')
+    return panel
+
+@app.route('/stats/<stat_type>')
+@conditional
+def view_stats(stat_type):
+    """Handles fetching and displaying various statistics tables."""
+    try:
+        panel = render_fragment('stats', ('stats', stat_type, _args_key(request.args)),
+                                lambda: stats_context(stat_type, request.args))
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('index'))
+
+    return render_page('stats', panel)
 
 @app.route('/team_lookup', methods=['POST'])
 def team_lookup():
     """Handles fetching team schedule and record."""
-    conn = get_db()
     team = request.form.get('team_ticker').upper()
     season = request.form.get('season')
     
     if not season:
         season = 2024
     
-    schedule = db.getTeamSchedule(conn, team, season)
-    record = db.get_team_record(conn, team, season)
-    
-    return render_template('index.html', 
-                           schedule=schedule, 
-                           record=record, 
-                           team_searched=team, 
-                           season_searched=season,
-                           active_tab='team')
+    panel = render_fragment('team', ('team', team, season), lambda: team_context(team, season))
+    return render_page('team', panel)
 
 @app.route('/player_lookup', methods=['POST'])
 def player_lookup():
-    """Handles searching for a player and showing their details using getPlayerCareerDetails."""
+    """Handles searching for a player and showing their profile."""
     conn = get_db()
     search_term = request.form.get('player_name')
     
     # 1. Find the ID and basic info
     players = db.getPlayerIdByName(conn, search_term)
+    if not players:
+        # No exact match: take the best partial / closest spelling instead
+        players = db.searchPlayers(conn, search_term, top_k=1)
+        if players:
+            flash(f"Showing results for '{players[0]['player_name']}'", "info")
     
     if not players:
         flash(f"No player found with name '{search_term}'", "danger")
         return redirect(url_for('index'))
     
-    # Take the first match
-    player_data = players[0]
-    player_id = player_data['player_id']
-    position = player_data['position']
-    
-    # 2. Determine which stats to fetch based on Position
-    # Default flags
-    inc_pass = False
-    inc_rush = True     # Most positions can record a rush
-    inc_rec = False
-    inc_turn = True     # Fumbles happen to everyone
-    
-    if position == 'QB':
-        inc_pass = True
-        inc_rec = False # QBs rarely catch, but you can set True if you want
-    elif position in ['RB', 'WR', 'TE']:
-        inc_rec = True
-        
-    # 3. Get Detailed Career Stats (New Function Usage)
-    # Returns dict: {'bio': {...}, 'teams': [...], 'career_stats': {...}}
-    details = db.getPlayerCareerDetails(conn, player_id, 
-                                        include_passing=inc_pass, 
-                                        include_rushing=inc_rush, 
-                                        include_receiving=inc_rec, 
-                                        include_turnovers=inc_turn)
-    
-    # 4. Get Matchup History
-    history = db.get_player_matchup_history(conn, player_id)
+    # 2. The whole profile (bio, teams, career totals, matchups) in one
+    # query, or straight from its snapshot if the player has not changed
+    player_id = players[0]['player_id']
+    panel = render_fragment('player', ('player', player_id), lambda: player_context(player_id))
+    if panel is None:
+        flash(f"Could not load player '{players[0]['player_name']}'", "danger")
+        return redirect(url_for('index'))
     
-    return render_template('index.html', 
-                           player_search_result=details['bio'], # <--- FIX: Use the full bio
-                           career_stats=details['career_stats'] if details else None,
-                           player_teams=details['teams'] if details else [],
-                           matchup_history=history,
-                           active_tab='player')
+    return render_page('player', panel)
+
+@app.route('/api/player/<player_id>')
+@conditional
+def api_player_profile(player_id):
+    """The cached profile snapshot of one player (JSON)."""
+    profile = db.getPlayerProfile(get_db(), player_id, as_json=True)
+    if profile is None:
+        return jsonify({'error': f"No player with id '{player_id}'"}), 404
+    return Response(profile, mimetype='application/json')
+
+@app.route('/api/player/<player_id>/games')
+@conditional
+def api_player_games(player_id):
+    """One page of a player's game log, newest first; ?before=SEASON-WEEK&limit=N."""
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    before = request.args.get('before')
+    if before:
+        try:
+            season, week = (int(part) for part in before.split('-'))
+        except ValueError:
+            return jsonify({'error': "before must look like SEASON-WEEK, e.g. 2023-14"}), 400
+        before = (season, week)
+    games = db.get_player_matchup_history(get_db(), player_id, before=before, limit=limit)
+    # limit counts games; a game can span two rows (two opposing coaches that season)
+    full_page = len({(game['season'], game['week']) for game in games}) == limit
+    next_cursor = f"{games[-1]['season']}-{games[-1]['week']}" if full_page else None
+    return jsonify({'games': [dict(game) for game in games], 'next': next_cursor})
+
+@app.route('/api/team/<team>/schedule/<int:season>')
+@conditional
+def api_team_schedule(team, season):
+    """One page of a team's regular-season schedule; ?after=WEEK&limit=N."""
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    after = request.args.get('after', type=int)
+    games = db.getTeamSchedule(get_db(), team.upper(), season, after_week=after, limit=limit)
+    next_cursor = games[-1]['week'] if len(games) == limit else None
+    return jsonify({'games': [dict(game) for game in games], 'next': next_cursor})
+
+@app.route('/api/players/search')
+@conditional
+def api_player_search():
+    """Typeahead: ranked players matching the partial name in ?q= (JSON)."""
+    conn = get_db()
+    limit = request.args.get('limit', 10, type=int)
+    players = db.searchPlayers(conn, request.args.get('q', ''), top_k=limit)
+    return jsonify([dict(player) for player in players])
+
+# ---------------------------------------------------------------------
+# JSON API
+# ---------------------------------------------------------------------
+# Read-only JSON twins of the HTML views. Every route is @conditional,
+# so pollers that send back the ETag get 304s until the data changes.
+
+@app.route('/api/stats/<stat_type>')
+@conditional
+def api_stats(stat_type):
+    """The table behind /stats/<stat_type>, same query args, as JSON."""
+    try:
+        data, title, headers, value_key, season = dashboard_stats(get_db(), stat_type, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not title:
+        return jsonify({'error': f"Unknown stats table '{stat_type}'"}), 404
+    return jsonify({'title': title, 'headers': headers, 'value_key': value_key,
+                    'rows': [dict(row) for row in data]})
+
+@app.route('/api/team/<team>/record/<int:season>')
+@conditional
+def api_team_record(team, season):
+    """A team's win/loss record for a season."""
+    return jsonify(db.get_team_record(get_db(), team.upper(), season))
+
+@app.route('/api/player/<player_id>/vs/<team>')
+@conditional
+def api_player_vs_team(player_id, team):
+    """A QB's per-game averages against one opponent."""
+    rows = db.get_qb_stats_vs_opponent(get_db(), player_id, team.upper())
+    return jsonify([dict(row) for row in rows])
+
+@app.route('/api/player/<player_id>/totals')
+@conditional
+def api_player_totals(player_id):
+    """A player's totals over ?season_from=&season_to= (either may be left open)."""
+    totals = db.getPlayerRangeTotals(get_db(), player_id,
+                                     request.args.get('season_from', type=int),
+                                     request.args.get('season_to', type=int))
+    if totals is None:
+        return jsonify({'error': f"No games for player '{player_id}' in that range"}), 404
+    return jsonify(dict(totals))
+
+@app.route('/api/version')
+def api_version():
+    """The current data version, for clients that poll it directly."""
+    tag, modified_at = db.getDataVersion(get_db())
+    return jsonify({'etag': tag, 'modified_at': modified_at})
+
+# ---------------------------------------------------------------------
+# CHANGE FEED
+# ---------------------------------------------------------------------
+# /api/changes serves change_log to incremental consumers. A request with
+# nothing to return yet waits for up to ?wait= seconds: writes made through
+# this worker wake it at once, other processes' within CHANGES_POLL_SECONDS.
+# It holds no connection while it waits.
+
+CHANGES_POLL_SECONDS = 0.5
+
+_changes = threading.Condition()
+_changes_listening = False
+
+def _notify_changes(func, args, kwargs):
+    with _changes:
+        _changes.notify_all()
+
+def _listen_for_changes():
+    """Wakes waiting /api/changes requests on every write (registered once)."""
+    global _changes_listening
+    with _changes:
+        if not _changes_listening:
+            db.addWriteListener(_notify_changes)
+            _changes_listening = True
+
+def _read_changes(since, limit):
+    pool = get_read_pool()
+    conn = pool.acquire()
+    try:
+        return db.getChangesSince(conn, since, limit), db.getChangeSeq(conn)
+    finally:
+        pool.release(conn)
+
+@app.route('/api/changes')
+def api_changes():
+    """
+    Long poll of the change log: the changes after ?since=SEQ, at most
+    ?limit=N, waiting up to ?wait=SECONDS for one to happen. Ask again with
+    since=next. A consumer starting from scratch loads what it needs first,
+    then follows from the 'head' it saw before loading.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', db.CHANGE_BATCH_SIZE, type=int), db.CHANGE_BATCH_SIZE)
+    wait = min(max(request.args.get('wait', 0, type=float), 0.0), app.config['CHANGES_MAX_WAIT'])
+    if since < 0 or limit < 1:
+        return jsonify({'error': "since must be 0 or more and limit at least 1"}), 400
+    _listen_for_changes()
+    deadline = time.monotonic() + wait
+    while True:
+        changes, head = _read_changes(since, limit)
+        if head is None:
+            return jsonify({'error': "The change log could not be read"}), 503
+        if since > head:
+            # Not this database's sequence (e.g. it was rebuilt): start over
+            return jsonify({'error': f"since={since} is past the end of the log", 'head': head}), 409
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        with _changes:
+            _changes.wait(min(remaining, CHANGES_POLL_SECONDS))
+    return jsonify({'changes': changes, 'next': changes[-1]['seq'] if changes else since, 'head': head})
+
+# ---------------------------------------------------------------------
+# STREAMING EXPORTS
+# ---------------------------------------------------------------------
+
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+def _encode_rows(rows, fmt, batch_size=db.EXPORT_BATCH_SIZE):
+    """Turns a row iterator into CSV / JSON Lines text, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = None
+    for count, row in enumerate(rows, 1):
+        if fmt == 'jsonl':
+            buffer.write(json.dumps(dict(row)) + '\n')
+        else:
+            if writer is None:
+                writer = csv.writer(buffer)
+                writer.writerow(row.keys())
+            writer.writerow(tuple(row))
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _export(filename, iter_rows, *args):
+    """
+    Streams iter_rows(conn, *args) as ?format=csv (default) or jsonl. The
+    response holds a pooled connection of its own until the last chunk is
+    sent, since the request's connection is released before streaming.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_MIMETYPES)}"}), 400
+    pool = get_read_pool()
+    conn = pool.acquire()
+    response = Response(_encode_rows(iter_rows(conn, *args), fmt), mimetype=EXPORT_MIMETYPES[fmt],
+                        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'})
+    response.call_on_close(lambda: pool.release(conn))
+    return response
+
+@app.route('/export/player/<player_id>')
+def export_player_log(player_id):
+    """A player's full game log, streamed."""
+    return _export(f'{player_id}_games', db.iterPlayerGameLog, player_id)
+
+@app.route('/export/season/<int:season>')
+def export_season_stats(season):
+    """Every player_game_stats row of a season, streamed."""
+    return _export(f'player_game_stats_{season}', db.iterSeasonGameStats, season)
 
 # ---------------------------------------------------------------------
 # MANAGEMENT ACTIONS (Add/Update/Delete)
@@ -153,7 +886,7 @@ def player_lookup():
 @app.route('/add_game', methods=['POST'])
 def add_game_route():
     """Handles adding a new game record to the GAME table."""
-    conn = get_db()
+    conn = get_write_db()
     data = request.form
     
     try:
@@ -193,7 +926,7 @@ def add_game_route():
 
 @app.route('/add_player', methods=['POST'])
 def add_player_route():
-    conn = get_db()
+    conn = get_write_db()
     try:
         # Extract form data
         pid = request.form['player_id']
@@ -222,7 +955,7 @@ def add_player_route():
 
 @app.route('/delete_player', methods=['POST'])
 def delete_player_route():
-    conn = get_db()
+    conn = get_write_db()
     pid = request.form['player_id']
     
     success = db.deletePlayer(conn, pid)
@@ -235,7 +968,7 @@ def delete_player_route():
 
 @app.route('/update_player', methods=['POST'])
 def update_player_route():
-    conn = get_db()
+    conn = get_write_db()
     pid = request.form['player_id']
     action = request.form['update_action'] # 'team', 'position', 'weight'
     
@@ -258,5 +991,7 @@ def update_player_route():
         
     return redirect(url_for('index'))
 
+load_templates()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""
+Benchmark suite for every function in database_functions.
+
+Builds synthetic databases at a multiple of the real data set, times each
+query and write function against them and writes the timings as JSON. A
+second run can be compared against a saved one to catch regressions.
+
+    python benchmark.py run                      # scales 1, 10, 100 -> benchmark.json
+    python benchmark.py run --scales 1 10 --repeats 3 --out before.json
+    python benchmark.py generate 10 nfl_x10.sqlite
+    python benchmark.py compare before.json after.json --threshold 0.25
+
+A synthetic database at scale N holds N copies of the source data, each
+copy shifted back by the number of seasons in the source and given its
+own player ids, so N = 10 is 70 seasons of history with the same
+per-season shape (rosters, schedules, stat distributions) as the real
+2018-2024 data. Generated files are kept in --data-dir and reused.
+
+Timings per read function, in seconds (median of --repeats):
+    cold    fresh connection, empty result cache, empty SQLite page cache
+    warm    same connection, result cache disabled
+    cached  same connection, result cache enabled (served from memory)
+Write functions run once each, in probe order, on a scratch copy, and
+then all together inside one db.transaction() on a fresh copy.
+"""
+import argparse
+import inspect
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+import database_functions as db
+import migrations
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DB = "nfl_stats.sqlite"
+DEFAULT_SCALES = (1, 10, 100)
+
+# Tables copied from the source; indexes and derived tables come from
+# migrations when the generated file is first opened.
+BASE_TABLES = migrations.BASE_TABLES
+
+# Differences below this are timer noise, whatever the ratio.
+MIN_REGRESSION_SECONDS = 0.001
+
+# ==========================================
+# DATA GENERATION
+# ==========================================
+
+def generateDatabase(_sourceFile, _targetFile, scale):
+    """
+    Writes a database holding `scale` season-shifted copies of the base
+    tables in _sourceFile to _targetFile (replacing it), then migrates it.
+    Copy 0 is the source data unchanged.
+    """
+    if os.path.exists(_targetFile):
+        os.remove(_targetFile)
+    source = sqlite3.connect(_sourceFile)
+    schema = dict(source.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+        f"AND name IN ({', '.join('?' * len(BASE_TABLES))});", BASE_TABLES))
+    first, last = source.execute("SELECT MIN(season), MAX(season) FROM games;").fetchone()
+    source.close()
+    span = last - first + 1
+
+    conn = sqlite3.connect(_targetFile)
+    conn.execute("PRAGMA journal_mode = OFF;")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("ATTACH DATABASE ? AS src;", (_sourceFile,))
+    for table in BASE_TABLES:
+        conn.execute(schema[table])
+
+    conn.execute("BEGIN;")
+    conn.execute("INSERT INTO teams SELECT * FROM src.teams;")
+    conn.execute("INSERT INTO coaches SELECT * FROM src.coaches;")
+    for copy in range(scale):
+        shift = copy * span
+        # Copy 0 keeps the real ids and names so lookups by name still work.
+        pid = "player_id" if copy == 0 else f"player_id || '.{copy}'"
+        pname = "player_name" if copy == 0 else f"player_name || ' {copy}'"
+        conn.execute(f"""
+            INSERT INTO players
+            SELECT {pid}, season - {shift}, {pname}, team, birth_year - {shift},
+                   draft_year - {shift}, draft_ovr, height, weight, position
+            FROM src.players;
+        """)
+        conn.execute(f"""
+            INSERT INTO coach_history (season, coach_id, name, team)
+            SELECT season - {shift}, coach_id, name, team FROM src.coach_history;
+        """)
+        conn.execute(f"""
+            INSERT INTO games
+            SELECT (season - {shift}) || substr(game_id, 5), season - {shift}, week,
+                   season_type, away_team, home_team, home_win
+            FROM src.games;
+        """)
+        conn.execute(f"""
+            INSERT INTO player_history
+            SELECT {pid}, season - {shift}, week, team FROM src.player_history;
+        """)
+        conn.execute(f"""
+            INSERT INTO player_game_stats
+            SELECT season - {shift}, {pid}, {pname}, week, team,
+                   {', '.join(migrations.STAT_COLUMNS)}
+            FROM src.player_game_stats;
+        """)
+    conn.commit()
+    conn.execute("DETACH DATABASE src;")
+    conn.execute("PRAGMA user_version = 0;")
+    conn.close()
+
+    # openConnection builds the indexes and derived tables and runs ANALYZE.
+    conn = db.openConnection(_targetFile)
+    db.closeConnection(conn, _targetFile)
+
+
+def rowCounts(_dbFile):
+    conn = sqlite3.connect(_dbFile)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+              for table in BASE_TABLES}
+    conn.close()
+    return counts
+
+
+def syntheticDatabase(_dataDir, scale, _sourceFile=SOURCE_DB):
+    """Path of the scale-N database in _dataDir, generating it if missing."""
+    os.makedirs(_dataDir, exist_ok=True)
+    path = os.path.join(_dataDir, f"nfl_x{scale}.sqlite")
+    if not os.path.exists(path):
+        logger.info("Generating %s", path)
+        start = time.perf_counter()
+        generateDatabase(_sourceFile, path, scale)
+        logger.info("Generated %s in %.1fs", path, time.perf_counter() - start)
+    return path
+
+# ==========================================
+# TIMING
+# ==========================================
+
+def _probeKeys(probes):
+    """Unique result keys: the function name, suffixed when probed twice."""
+    keys, seen = [], {}
+    for name, _ in probes:
+        seen[name] = seen.get(name, 0) + 1
+        keys.append(name if seen[name] == 1 else f"{name}#{seen[name]}")
+    return keys
+
+
+def _timeCall(func, conn, args):
+    start = time.perf_counter()
+    result = func(conn, *args)
+    if inspect.isgenerator(result):
+        # Streaming functions only do their work as they are consumed
+        for _ in result:
+            pass
+    return time.perf_counter() - start
+
+
+def _openQuiet(_dbFile):
+    conn = db.openConnection(_dbFile)
+    # Statement tracing only feeds slow-call reports; keep it out of timings.
+    conn.set_trace_callback(None)
+    return conn
+
+
+def _setCaches(caches, enabled=None, clear=False):
+    """Switches the result caches on or off, and empties them if asked."""
+    for cache in caches:
+        if enabled is not None:
+            cache.enabled = enabled
+        if clear:
+            cache.clear()
+
+
+def benchmarkDatabase(_dbFile, repeats=5):
+    """Times every probed database function against _dbFile."""
+    conn = _openQuiet(_dbFile)
+    probes = migrations.probeCalls(conn)
+    conn.close()
+    reads, writes = [], []
+    for key, (name, args) in zip(_probeKeys(probes), probes):
+        func = getattr(db, name)
+        (writes if getattr(func, "invalidatesCache", False) else reads).append((key, func, args))
+
+    # getPlayerProfile keeps its own snapshots, so both caches are switched together
+    caches = (db.resultCache, db.profileCache)
+    results = {}
+    cache_enabled = [cache.enabled for cache in caches]
+    try:
+        for key, func, args in reads:
+            cold = []
+            for _ in range(repeats):
+                _setCaches(caches, clear=True)
+                conn = _openQuiet(_dbFile)
+                cold.append(_timeCall(func, conn, args))
+                conn.close()
+
+            conn = _openQuiet(_dbFile)
+            _setCaches(caches, enabled=False)
+            func(conn, *args)
+            warm = [_timeCall(func, conn, args) for _ in range(repeats)]
+            _setCaches(caches, enabled=True, clear=True)
+            func(conn, *args)
+            cached = [_timeCall(func, conn, args) for _ in range(repeats)]
+            conn.close()
+
+            results[key] = {"kind": "read",
+                            "cold": statistics.median(cold),
+                            "warm": statistics.median(warm),
+                            "cached": statistics.median(cached)}
+
+        # Writes change the data, so they get a scratch copy and one run each:
+        # first call by call, then all together as one transaction().
+        scratch = _dbFile + ".scratch"
+        _setCaches(caches, enabled=False)
+        for unit in (False, True):
+            shutil.copyfile(_dbFile, scratch)
+            conn = _openQuiet(scratch)
+            if unit:
+                start = time.perf_counter()
+                with db.transaction(conn):
+                    for key, func, args in writes:
+                        func(conn, *args)
+                results[f"transaction({len(writes)} writes)"] = {
+                    "kind": "write", "seconds": time.perf_counter() - start}
+            else:
+                for key, func, args in writes:
+                    results[key] = {"kind": "write", "seconds": _timeCall(func, conn, args)}
+            conn.close()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(scratch + suffix):
+                    os.remove(scratch + suffix)
+    finally:
+        for cache, enabled in zip(caches, cache_enabled):
+            cache.enabled = enabled
+    return results
+
+
+def runBenchmarks(scales=DEFAULT_SCALES, repeats=5, _dataDir="benchmark_data", _sourceFile=SOURCE_DB):
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "repeats": repeats,
+        "scales": {},
+    }
+    for scale in scales:
+        path = syntheticDatabase(_dataDir, scale, _sourceFile)
+        logger.info("Benchmarking scale %d", scale)
+        report["scales"][str(scale)] = {
+            "rows": rowCounts(path),
+            "functions": benchmarkDatabase(path, repeats),
+        }
+    return report
+
+# ==========================================
+# COMPARISON
+# ==========================================
+
+def _timings(entry):
+    if entry["kind"] == "write":
+        return {"seconds": entry["seconds"]}
+    return {mode: entry[mode] for mode in ("cold", "warm", "cached")}
+
+
+def compareReports(before, after, threshold=0.25):
+    """
+    Returns (scale, function, mode, before, after) for every timing that got
+    more than `threshold` slower (as a fraction) and at least
+    MIN_REGRESSION_SECONDS slower. Functions missing from either run are
+    skipped.
+    """
+    regressions = []
+    for scale, run in after["scales"].items():
+        old_run = before["scales"].get(scale)
+        if old_run is None:
+            continue
+        for name, entry in run["functions"].items():
+            old_entry = old_run["functions"].get(name)
+            if old_entry is None or old_entry["kind"] != entry["kind"]:
+                continue
+            old_times = _timings(old_entry)
+            for mode, seconds in _timings(entry).items():
+                old = old_times[mode]
+                if seconds > old * (1 + threshold) and seconds - old >= MIN_REGRESSION_SECONDS:
+                    regressions.append((scale, name, mode, old, seconds))
+    return regressions
+
+
+def printReport(report):
+    for scale, run in report["scales"].items():
+        rows = run["rows"]
+        print(f"\nScale {scale}x: {rows['player_game_stats']:,} player_game_stats, {rows['games']:,} games")
+        print(f"  {'function':<36} {'cold ms':>10} {'warm ms':>10} {'cached ms':>10}")
+        for name, entry in run["functions"].items():
+            if entry["kind"] == "write":
+                print(f"  {name:<36} {entry['seconds'] * 1000:>10.2f} {'(write)':>10}")
+            else:
+                print(f"  {name:<36} {entry['cold'] * 1000:>10.2f} "
+                      f"{entry['warm'] * 1000:>10.2f} {entry['cached'] * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database_functions on synthetic data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="time every function at each scale")
+    run.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+    run.add_argument("--repeats", type=int, default=5)
+    run.add_argument("--source", default=SOURCE_DB)
+    run.add_argument("--data-dir", default="benchmark_data")
+    run.add_argument("--out", default="benchmark.json")
+
+    generate = commands.add_parser("generate", help="build one synthetic database")
+    generate.add_argument("scale", type=int)
+    generate.add_argument("target")
+    generate.add_argument("--source", default=SOURCE_DB)
+
+    compare = commands.add_parser("compare", help="flag regressions between two runs")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.add_argument("--threshold", type=float, default=0.25,
+                         help="fractional slowdown that counts as a regression")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Per-call "Connected to" / write success lines would drown the report.
+    logging.getLogger(db.__name__).setLevel(logging.WARNING)
+
+    if args.command == "generate":
+        generateDatabase(args.source, args.target, args.scale)
+        print(json.dumps(rowCounts(args.target), indent=2))
+
+    elif args.command == "run":
+        report = runBenchmarks(args.scales, args.repeats, args.data_dir, args.source)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        printReport(report)
+        print(f"\nWrote {args.out}")
+
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        regressions = compareReports(before, after, args.threshold)
+        for scale, name, mode, old, new in regressions:
+            ratio = f" ({new / old:.1f}x)" if old else ""
+            print(f"REGRESSION {scale}x {name} [{mode}]: {old * 1000:.2f} ms -> {new * 1000:.2f} ms{ratio}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == '__main__':
+    main()
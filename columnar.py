@@ -0,0 +1,622 @@
+"""
+In-memory columnar copy of player_game_stats for the analytic queries.
+
+Leaderboards, career totals and averages scan and group thousands of game rows
+per request. ColumnarStats keeps those rows as one numpy array per column
+(player, team and position dictionary-encoded to integer codes) and
+answers the same questions with bincount / argpartition over the arrays
+instead of a GROUP BY. Its query methods take the same arguments as the
+database_functions versions and return the same columns, row for row, so
+a caller can use either (see stats_source in app.py).
+
+The copy follows writes made through database_functions in this process
+by reloading just the players, week or table a write touched, and falls
+back to a full reload whenever data_generation shows a write it did not
+see (another process, or a write made behind database_functions' back).
+
+numpy is optional: without it AVAILABLE is False and nothing here is used.
+
+    python columnar.py verify [db]   # compare every query with the SQL
+    python columnar.py bench [db]    # time SQL against the arrays
+"""
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+
+import database_functions as db
+import migrations
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = migrations.STAT_COLUMNS
+
+# How each database_functions mutator changes the data the engine holds:
+# "player" reloads the player named by player_id, "rows" the players of a
+# bulk load, "week" one (season, week) slice, "teams" the teams table,
+# None means nothing held here changed. Anything else forces a full reload.
+WRITE_SCOPES = {
+    "addPlayer": "player",
+    "updatePlayerTeam": "player",
+    "updatePlayerPosition": "player",
+    "updatePlayerWeight": None,
+    "updatePlayerName": "player",
+    "deletePlayer": "player",
+    "addPlayerGameStats": "player",
+    "addPlayerGameStatsBulk": "rows",
+    "deletePlayerGameStats": "week",
+    "addGame": None,
+    "deleteGame": None,
+    "addGamesBulk": None,
+    "addCoach": None,
+    "deleteCoach": None,
+    "updateTeamCity": None,
+    "updateTeamName": "teams",
+}
+
+# playerQBCareerStats columns, in its SQL's order
+CAREER_COLUMNS = (
+    ("passing_yards", "total_passing_yards"),
+    ("rushing_yards", "total_rushing_yards"),
+    ("pass_touchdown", "total_pass_touchdowns"),
+    ("rush_touchdown", "total_rush_touchdowns"),
+    ("receiving_yards", "total_receiving_yards"),
+    ("receiving_touchdown", "total_receiving_touchdowns"),
+    ("interception", "total_interceptions"),
+)
+
+_ROW_SQL = f"""
+SELECT season, week, player_id, team, {", ".join(f"COALESCE({c}, 0)" for c in STAT_COLUMNS)}
+FROM player_game_stats_all
+"""
+
+
+class _Codes:
+    """Dictionary encoding: value <-> dense integer code, in first-seen order."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ColumnarStats:
+    """
+    Structure-of-arrays copy of player_game_stats plus the player and team
+    attributes the analytic queries filter on.
+
+    Game rows live in preallocated column arrays with a `live` mask:
+    replacing a player's rows marks the old ones dead and appends the new
+    ones, and the arrays are compacted once half the rows are dead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.version = None
+        self.full_loads = 0
+        self.partial_syncs = 0
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def load(self, _conn):
+        """(Re)builds every array from the database."""
+        with self._lock:
+            start = time.perf_counter()
+            self.version = db.getDataVersion(_conn)[0]
+            self._players = _Codes()
+            self._teams = _Codes()
+            self._positions = _Codes()
+            self._p_exists = np.zeros(0, dtype=bool)
+            self._p_position = np.zeros(0, dtype=np.int32)
+            self._p_name = []
+            self._id_rank = None
+            self._t_info = []
+            self._size = 0
+            self._dead = 0
+            self._allocate(1024)
+            self._loadTeams(_conn)
+            self._loadPlayers(_conn, None)
+            self._append(_conn.execute(_ROW_SQL).fetchall())
+            self.loaded = True
+            self.full_loads += 1
+            logger.info("Loaded %d game rows for %d players into columnar arrays in %.3fs",
+                        self._size, len(self._players), time.perf_counter() - start)
+
+    def _allocate(self, capacity):
+        self._season = np.zeros(capacity, dtype=np.int32)
+        self._week = np.zeros(capacity, dtype=np.int32)
+        self._player = np.zeros(capacity, dtype=np.int32)
+        self._team = np.zeros(capacity, dtype=np.int32)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._stats = np.zeros((len(STAT_COLUMNS), capacity), dtype=np.float64)
+
+    def _grow(self, needed):
+        capacity = len(self._live)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        old = (self._season, self._week, self._player, self._team, self._live, self._stats)
+        self._allocate(capacity)
+        n = self._size
+        for new, prev in zip((self._season, self._week, self._player, self._team, self._live),
+                             old[:5]):
+            new[:n] = prev[:n]
+        self._stats[:, :n] = old[5][:, :n]
+
+    def _append(self, rows):
+        if not rows:
+            return
+        start, end = self._size, self._size + len(rows)
+        self._grow(end)
+        columns = list(zip(*rows))
+        self._season[start:end] = columns[0]
+        self._week[start:end] = columns[1]
+        self._player[start:end] = [self._playerCode(p) for p in columns[2]]
+        self._team[start:end] = [self._teamCode(t) for t in columns[3]]
+        self._stats[:, start:end] = np.array(columns[4:], dtype=np.float64)
+        self._live[start:end] = True
+        self._size = end
+
+    def _kill(self, mask):
+        """Marks the live rows selected by `mask` (over [0, size)) dead."""
+        mask &= self._live[:self._size]
+        self._live[:self._size][mask] = False
+        self._dead += int(mask.sum())
+        if self._dead * 2 > self._size:
+            self._compact()
+
+    def _compact(self):
+        keep = np.nonzero(self._live[:self._size])[0]
+        n = len(keep)
+        for column in (self._season, self._week, self._player, self._team, self._live):
+            column[:n] = column[keep]
+        self._stats[:, :n] = self._stats[:, keep]
+        self._live[n:self._size] = False
+        self._size, self._dead = n, 0
+
+    def _playerCode(self, player_id):
+        if player_id not in self._players.index:
+            self._id_rank = None
+        code = self._players.code(player_id)
+        if code >= len(self._p_exists):
+            grow = max(code + 1, 2 * len(self._p_exists)) - len(self._p_exists)
+            self._p_exists = np.concatenate([self._p_exists, np.zeros(grow, dtype=bool)])
+            self._p_position = np.concatenate([self._p_position, np.full(grow, -1, dtype=np.int32)])
+            self._p_name.extend([None] * grow)
+        return code
+
+    def _teamCode(self, team):
+        code = self._teams.index.get(team)
+        if code is None:
+            code = self._teams.code(team)
+            self._t_info.append(None)
+        return code
+
+    def _loadPlayers(self, _conn, player_ids):
+        if player_ids is None:
+            rows = _conn.execute("SELECT player_id, player_name, position FROM players").fetchall()
+            self._p_exists[:] = False
+        else:
+            marks = ",".join("?" * len(player_ids))
+            rows = _conn.execute(f"SELECT player_id, player_name, position FROM players "
+                                 f"WHERE player_id IN ({marks})", list(player_ids)).fetchall()
+            for player_id in player_ids:
+                self._p_exists[self._playerCode(player_id)] = False
+        for player_id, name, position in rows:
+            code = self._playerCode(player_id)
+            self._p_exists[code] = True
+            self._p_name[code] = name
+            self._p_position[code] = -1 if position is None else self._positions.code(position)
+
+    def _loadTeams(self, _conn):
+        self._t_info = [None] * len(self._teams)
+        for team, name, conference, division in _conn.execute(
+                "SELECT team, team_name, conference, division FROM teams"):
+            code = self._teamCode(team)
+            self._t_info[code] = (name, conference, division)
+
+    def _idRank(self):
+        """Rank of each player code in player_id order, for SQL-identical tiebreaks."""
+        if self._id_rank is None or len(self._id_rank) != len(self._p_exists):
+            # Codes past the last player (spare capacity) never hold rows
+            rank = np.full(len(self._p_exists), len(self._p_exists), dtype=np.int64)
+            order = sorted(range(len(self._players)), key=self._players.values.__getitem__)
+            rank[order] = np.arange(len(order))
+            self._id_rank = rank
+        return self._id_rank
+
+    # ------------------------------------------------------------------
+    # Following writes
+    # ------------------------------------------------------------------
+
+    def attach(self):
+        """Starts following writes made through database_functions."""
+        db.addWriteListener(self._onWrite)
+
+    def detach(self):
+        db.removeWriteListener(self._onWrite)
+
+    def _onWrite(self, func, args, kwargs):
+        with self._lock:
+            if not self.loaded:
+                return
+            call = inspect.signature(func).bind(*args, **kwargs).arguments
+            _conn = next(iter(call.values()))
+            scope = WRITE_SCOPES.get(func.__name__, "all")
+            if scope == "all":
+                self.load(_conn)
+                return
+            elif scope == "player":
+                self._syncPlayers(_conn, [call["player_id"]])
+            elif scope == "rows":
+                self._syncPlayers(_conn, sorted({row["player_id"] for row in call["rows"]}))
+            elif scope == "week":
+                self._syncWeek(_conn, call["season"], call["week"])
+            elif scope == "teams":
+                self._loadTeams(_conn)
+            # Best effort: a write from another process landing between this
+            # one and the version read below goes unseen until the next one
+            self.version = db.getDataVersion(_conn)[0]
+            self.partial_syncs += 1
+
+    def _syncPlayers(self, _conn, player_ids):
+        codes = [self._playerCode(p) for p in player_ids]
+        self._kill(np.isin(self._player[:self._size], codes))
+        self._loadPlayers(_conn, player_ids)
+        marks = ",".join("?" * len(player_ids))
+        self._append(_conn.execute(_ROW_SQL + f"WHERE player_id IN ({marks})",
+                                   list(player_ids)).fetchall())
+
+    def _syncWeek(self, _conn, season, week):
+        n = self._size
+        self._kill((self._season[:n] == season) & (self._week[:n] == week))
+        self._append(_conn.execute(_ROW_SQL + "WHERE season = ? AND week = ?",
+                                   (season, week)).fetchall())
+
+    def _ensureCurrent(self, _conn):
+        """Loads on first use and reloads after writes this process did not see."""
+        if not self.loaded or db.getDataVersion(_conn)[0] != self.version:
+            self.load(_conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "rows": self._size - self._dead if self.loaded else 0,
+                "players": len(self._players) if self.loaded else 0,
+                "bytes": int(sum(a.nbytes for a in (self._season, self._week, self._player, self._team,
+                                                    self._live, self._stats))) if self.loaded else 0,
+                "full_loads": self.full_loads,
+                "partial_syncs": self.partial_syncs,
+            }
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _rows(self, season_from, season_to):
+        """Indexes of the live rows in the season range whose player exists."""
+        n = self._size
+        mask = self._live[:n] & (self._season[:n] >= season_from) & (self._season[:n] <= season_to)
+        mask &= self._p_exists[self._player[:n]]
+        return mask
+
+    def _top(self, candidates, values, top_n, ascending):
+        """The top_n candidates by value, ties broken by player_id like the SQL."""
+        if not len(candidates):
+            return candidates
+        key = values if ascending else -values
+        if len(candidates) > top_n:
+            # Everything up to the top_n-th value, including all of its ties
+            cutoff = np.partition(key, top_n - 1)[top_n - 1]
+            keep = key <= cutoff
+            candidates, key = candidates[keep], key[keep]
+        order = np.lexsort((self._idRank()[candidates], key))
+        return candidates[order[:top_n]]
+
+    def getLeaders(self, _conn, stat, season=None, season_from=None, season_to=None,
+                   position=None, conference=None, division=None,
+                   top_n=5, min_games=0, ascending=False):
+        """Same arguments and rows as database_functions.getLeaders."""
+        if stat not in db.LEADER_STATS:
+            logger.error("Error in getLeaders: unknown stat %r", stat)
+            return []
+        expr, alias = db.LEADER_STATS[stat]
+        if season is not None:
+            season_from = season_to = season
+        by_team = bool(conference or division)
+        top_n = max(1, min(int(top_n), db.MAX_LEADERS))
+
+        with self._lock:
+            self._ensureCurrent(_conn)
+            mask = self._rows(season_from if season_from is not None else 0,
+                              season_to if season_to is not None else 9999)
+            if position is not None:
+                code = self._positions.index.get(position, -2)
+                mask &= self._p_position[self._player[:self._size]] == code
+            if by_team:
+                team_ok = np.array([info is not None
+                                    and (conference is None or info[1] == conference)
+                                    and (division is None or info[2] == division)
+                                    for info in self._t_info], dtype=bool)
+                mask &= team_ok[self._team[:self._size]]
+            rows = np.nonzero(mask)[0]
+
+            columns = [STAT_COLUMNS.index(c.strip()) for c in expr.split("+")]
+            values = self._stats[columns[0], rows]
+            for column in columns[1:]:
+                values = values + self._stats[column, rows]
+            players = self._player[rows]
+            count = len(self._p_exists)
+            totals = np.bincount(players, weights=values, minlength=count)
+            games = np.bincount(players, minlength=count)
+
+            candidates = np.nonzero((games > 0) & (games >= min_games))[0]
+            top = self._top(candidates, totals[candidates], top_n, ascending)
+
+            if by_team:
+                # MAX(team_name) over each leader's matching games
+                names = sorted({info[0] for info in self._t_info if info is not None})
+                rank = {name: i for i, name in enumerate(names)}
+                team_rank = np.array([rank[info[0]] if info is not None else -1
+                                      for info in self._t_info], dtype=np.int64)
+                best = np.full(count, -1, dtype=np.int64)
+                np.maximum.at(best, players, team_rank[self._team[rows]])
+
+            result = []
+            for code in top:
+                row = {"player_id": self._players.values[code], "player_name": self._p_name[code]}
+                if by_team:
+                    row["team_name"] = names[best[code]]
+                row[alias] = float(totals[code])
+                result.append(row)
+            return result
+
+    def _interceptionAverages(self, position):
+        mask = self._rows(0, 9999)
+        if position is not None:
+            mask &= self._p_position[self._player[:self._size]] == self._positions.index.get(position, -2)
+        rows = np.nonzero(mask)[0]
+        players = self._player[rows]
+        count = len(self._p_exists)
+        games = np.bincount(players, minlength=count)
+        interceptions = np.bincount(players, weights=self._stats[STAT_COLUMNS.index("interception"), rows],
+                                    minlength=count)
+        touchdowns = np.zeros(count)
+        for column in ("pass_touchdown", "rush_touchdown", "receiving_touchdown"):
+            touchdowns += np.bincount(players, weights=self._stats[STAT_COLUMNS.index(column), rows],
+                                      minlength=count)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            averages = interceptions / games
+        return games, averages, touchdowns
+
+    def getQBsLowestInterceptionAvgMinTD(self, _conn, min_games=12, min_touchdowns=10, top_n=10):
+        """Same arguments and rows as database_functions.getQBsLowestInterceptionAvgMinTD."""
+        with self._lock:
+            self._ensureCurrent(_conn)
+            games, averages, touchdowns = self._interceptionAverages("QB")
+            candidates = np.nonzero((games > 0) & (games >= min_games) & (touchdowns >= min_touchdowns))[0]
+            top = self._top(candidates, averages[candidates], top_n, ascending=True)
+            return [{"player_id": self._players.values[c], "player_name": self._p_name[c],
+                     "avg_interceptions": float(averages[c]), "total_touchdowns": float(touchdowns[c])}
+                    for c in top]
+
+    def getPlayersLowestInterceptionsAvg(self, _conn, min_games=1, top_n=5):
+        """Same arguments and rows as database_functions.getPlayersLowestInterceptionsAvg."""
+        with self._lock:
+            self._ensureCurrent(_conn)
+            games, averages, _ = self._interceptionAverages(None)
+            candidates = np.nonzero((games > 0) & (games >= min_games))[0]
+            top = self._top(candidates, averages[candidates], top_n, ascending=True)
+            return [{"player_id": self._players.values[c], "player_name": self._p_name[c],
+                     "avg_interceptions": float(averages[c])}
+                    for c in top]
+
+    def playerQBCareerStats(self, _conn, player_id):
+        """Same arguments and row as database_functions.playerQBCareerStats."""
+        with self._lock:
+            self._ensureCurrent(_conn)
+            code = self._players.index.get(player_id)
+            n = self._size
+            rows = (np.nonzero(self._live[:n] & (self._player[:n] == code))[0]
+                    if code is not None else [])
+            row = {}
+            for column, alias in CAREER_COLUMNS:
+                # SUM over no rows is NULL
+                row[alias] = float(self._stats[STAT_COLUMNS.index(column), rows].sum()) if len(rows) else None
+            return [row]
+
+    # The fixed leaderboards, as in database_functions
+
+    def getTop5QBsByPassingYards(self, _conn, season_year):
+        return self.getLeaders(_conn, "passing_yards", season=season_year)
+
+    def getTop5RBsByRushingYards(self, _conn, season_year):
+        return self.getLeaders(_conn, "rushing_yards", season=season_year, position="RB")
+
+    def getTop5WRsByReceivingYards(self, _conn, season_year):
+        return self.getLeaders(_conn, "receiving_yards", season=season_year, position="WR")
+
+    def getTopPlayersAllTimeByTouchdowns(self, _conn, top_n=5):
+        return self.getLeaders(_conn, "touchdowns", top_n=top_n)
+
+    def get_conference_passing_leaders(self, _conn, season, conference, division, top_n=5):
+        leaders = self.getLeaders(_conn, "passing_yards", season=season, position="QB",
+                                  conference=conference, division=division, top_n=top_n)
+        return [{"player_name": row["player_name"], "team_name": row["team_name"],
+                 "total_yards": row["total_passing_yards"]} for row in leaders]
+
+
+# ==========================================
+# VERIFICATION / BENCHMARK
+# ==========================================
+
+def verificationCalls(_conn):
+    """(name, kwargs) for every query shape the engine answers, over the data in _conn."""
+    seasons = [row["season"] for row in db.getSeasons(_conn)]
+    teams = _conn.execute("SELECT DISTINCT conference, division FROM teams ORDER BY 1, 2").fetchall()
+    calls = []
+    for stat in db.LEADER_STATS:
+        calls.append(("getLeaders", dict(stat=stat, top_n=25)))
+        calls.append(("getLeaders", dict(stat=stat, top_n=10, ascending=True, min_games=8)))
+        for season in seasons:
+            calls.append(("getLeaders", dict(stat=stat, season=season, top_n=10)))
+        calls.append(("getLeaders", dict(stat=stat, season_from=seasons[1], season_to=seasons[-2],
+                                         position="WR", min_games=10, top_n=15)))
+        calls.append(("getLeaders", dict(stat=stat, season=seasons[-1], conference=teams[0][0])))
+    for conference, division in teams:
+        calls.append(("get_conference_passing_leaders",
+                      dict(season=seasons[-1], conference=conference, division=division)))
+    for season in seasons:
+        calls += [("getTop5QBsByPassingYards", dict(season_year=season)),
+                  ("getTop5RBsByRushingYards", dict(season_year=season)),
+                  ("getTop5WRsByReceivingYards", dict(season_year=season))]
+    calls += [("getTopPlayersAllTimeByTouchdowns", dict(top_n=50)),
+              ("getQBsLowestInterceptionAvgMinTD", {}),
+              ("getQBsLowestInterceptionAvgMinTD", dict(min_games=1, min_touchdowns=0, top_n=100)),
+              ("getPlayersLowestInterceptionsAvg", {}),
+              ("getPlayersLowestInterceptionsAvg", dict(min_games=20, top_n=100)),
+              ("playerQBCareerStats", dict(player_id="NO_SUCH_PLAYER"))]
+    for (player_id,) in _conn.execute("SELECT player_id FROM player_season_totals "
+                                      "GROUP BY player_id ORDER BY SUM(passing_yards) DESC LIMIT 5"):
+        calls.append(("playerQBCareerStats", dict(player_id=player_id)))
+    return calls
+
+def _rowsOf(rows):
+    return [tuple(dict(row).items()) for row in rows]
+
+def verify(_conn, engine):
+    """Runs every verificationCalls() query both ways; returns the names that differ."""
+    enabled, db.resultCache.enabled = db.resultCache.enabled, False
+    try:
+        failed = []
+        for name, kwargs in verificationCalls(_conn):
+            expected = _rowsOf(getattr(db, name)(_conn, **kwargs))
+            actual = _rowsOf(getattr(engine, name)(_conn, **kwargs))
+            if actual != expected:
+                logger.error("Mismatch in %s(%s):\n  sql:      %s\n  columnar: %s",
+                             name, kwargs, expected[:3], actual[:3])
+                failed.append(name)
+        return failed
+    finally:
+        db.resultCache.enabled = enabled
+
+def verifyWrites(_conn, engine):
+    """
+    Applies a few writes of each kind through database_functions to
+    `_conn` (use a scratch copy) with the engine attached, checking after
+    each that the incrementally synced arrays still agree with the SQL.
+    """
+    player_id, season, week, team = _conn.execute(
+        "SELECT player_id, season, week, team FROM player_game_stats "
+        "ORDER BY passing_yards DESC LIMIT 1").fetchone()
+    writes = [
+        ("addPlayer", lambda: db.addPlayer(_conn, "COLUMNAR_TEST", "Columnar Test", team, 2000, 2022, 1,
+                                           72, 200, "QB", season, week)),
+        ("addPlayerGameStats", lambda: db.addPlayerGameStats(_conn, season, "COLUMNAR_TEST", "Columnar Test",
+                                                             week, team, passing_yards=9999.0,
+                                                             pass_touchdown=9)),
+        ("addPlayerGameStatsBulk", lambda: db.addPlayerGameStatsBulk(_conn, [
+            {"season": season, "player_id": player_id, "player_name": None, "week": week, "team": team,
+             "passing_yards": 1.0},
+            {"season": season, "player_id": "COLUMNAR_TEST", "player_name": "Columnar Test",
+             "week": week + 1, "team": team, "interception": 3.0},
+        ], upsert=True)),
+        ("updatePlayerPosition", lambda: db.updatePlayerPosition(_conn, player_id, "WR")),
+        ("updatePlayerName", lambda: db.updatePlayerName(_conn, player_id, "Renamed Player")),
+        ("deletePlayerGameStats", lambda: db.deletePlayerGameStats(_conn, "Columnar Test", week, season)),
+        ("deletePlayer", lambda: db.deletePlayer(_conn, "COLUMNAR_TEST")),
+    ]
+    engine.attach()
+    try:
+        failed = []
+        for label, write in writes:
+            loads = engine.full_loads
+            write()
+            if engine.full_loads != loads:
+                logger.error("%s forced a full reload", label)
+                failed.append(label)
+            failed += [f"{label}: {name}" for name in verify(_conn, engine)]
+        return failed
+    finally:
+        engine.detach()
+
+def bench(_conn, engine, repeats=5):
+    """Best-of-`repeats` seconds for the whole verificationCalls() set, SQL vs arrays."""
+    calls = verificationCalls(_conn)
+    enabled, db.resultCache.enabled = db.resultCache.enabled, False
+    try:
+        timings = {}
+        for label, source in (("sql", db), ("columnar", engine)):
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for name, kwargs in calls:
+                    getattr(source, name)(_conn, **kwargs)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[label] = best
+        return len(calls), timings
+    finally:
+        db.resultCache.enabled = enabled
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not AVAILABLE:
+        print("numpy is not installed; the columnar engine is unavailable.")
+        sys.exit(1)
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    dbFile = sys.argv[2] if len(sys.argv) > 2 else "nfl_stats.sqlite"
+    source = db.openConnection(dbFile)
+    if not source:
+        sys.exit(1)
+    # Work on an in-memory copy so verifyWrites never touches the file
+    conn = db._connect(":memory:")
+    source.backup(conn)
+    db.closeConnection(source, dbFile)
+    # Archived seasons stay in their files; read them from there
+    conn.archiveDir = os.path.dirname(os.path.abspath(dbFile))
+    db._refreshPartitions(conn)
+    engine = ColumnarStats()
+    engine.load(conn)
+
+    if command == "verify":
+        failed = verify(conn, engine) + verifyWrites(conn, engine)
+        if failed:
+            print(f"{len(failed)} mismatches: {', '.join(failed)}")
+            sys.exit(1)
+        print(f"All {len(verificationCalls(conn))} queries match the SQL, before and after writes.")
+    elif command == "bench":
+        count, timings = bench(conn, engine)
+        print(f"{count} queries: sql {timings['sql'] * 1000:.1f} ms, "
+              f"columnar {timings['columnar'] * 1000:.1f} ms "
+              f"({timings['sql'] / timings['columnar']:.1f}x)")
+        print(engine.stats())
+    else:
+        print(f"Unknown command {command!r}; use verify or bench.")
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
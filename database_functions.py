@@ -1,35 +1,728 @@
+import contextlib
+import difflib
+import functools
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from sqlite3 import Error
 
+import metrics
+import migrations
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the writer lock is per process there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The WAL file is cut back to this size after a checkpoint, and the
+# Checkpointer truncates it outright once it grows past it.
+WAL_SIZE_LIMIT = 64 * 1024 * 1024
+
+# Applied once to every connection when it is opened.
+PRAGMAS = (
+    ("journal_mode", "WAL"),       # readers no longer block the writer
+    ("synchronous", "NORMAL"),     # safe with WAL, one fsync per checkpoint
+    ("temp_store", "MEMORY"),      # sorts / GROUP BY temp b-trees stay in RAM
+    ("cache_size", -65536),        # 64 MB page cache (negative = KiB)
+    ("mmap_size", 268435456),      # 256 MB memory-mapped reads
+    ("journal_size_limit", WAL_SIZE_LIMIT),
+)
+
+# SQLite's own busy handler waits up to BUSY_TIMEOUT seconds for a lock.
+# A statement that still fails with SQLITE_BUSY / SQLITE_LOCKED before its
+# transaction got going is retried up to BUSY_RETRIES times, sleeping
+# BUSY_BACKOFF seconds doubled per retry (with jitter, at most 1s).
+BUSY_TIMEOUT = 5.0
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+# How long a write waits for its turn at the writer lock before failing.
+WRITER_LOCK_TIMEOUT = 30.0
+
+# Prepared statements kept per connection (sqlite3 default is 128).
+STATEMENT_CACHE_SIZE = 512
+
+class Connection(sqlite3.Connection):
+    """
+    sqlite3 connection that knows about transaction(): while a unit of work
+    is open, the commit() every mutating function ends with is deferred to
+    the unit, and a rollback() undoes only the failed call's work. Its
+    statements retry SQLITE_BUSY (see _retryBusy).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unitDepth = 0
+        self.pendingWrites = []
+        # archived_seasons as of the last _refreshPartitions(), and where
+        # the archive files live when not next to the main file (:memory:),
+        # or what to ATTACH for each one instead (replica.py's copies)
+        self.partitionLayout = None
+        self.archiveDir = None
+        self.archivePaths = None
+        self.writerLock = None
+        # What the result caches key this connection's database on
+        self.database = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or _Cursor)
+
+    # sqlite3.Connection.execute* would bypass cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.unitDepth:
+            super().commit()
+
+    def rollback(self):
+        if self.unitDepth:
+            self.execute(f"ROLLBACK TO unit_{self.unitDepth};")
+        else:
+            super().rollback()
+
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return _retryBusy(self.connection, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            # A generator cannot be replayed, so no retries
+            return super().executemany(sql, seq_of_parameters)
+        return _retryBusy(self.connection, super().executemany, sql, seq_of_parameters)
+
+def _connect(_dbFile, check_same_thread=True, archivePaths=None):
+    """
+    Opens a sqlite3.Row connection with the tuned PRAGMAs applied. _dbFile
+    may be a file: URI; archivePaths maps archive file names to what to
+    ATTACH in their place.
+    """
+    conn = sqlite3.connect(_dbFile, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=check_same_thread, factory=Connection,
+                           uri=_dbFile.startswith("file:"))
+    # This is crucial for Flask/Web Apps:
+    conn.row_factory = sqlite3.Row
+    # Lets metrics attach the SQL of a slow call to its log line
+    conn.set_trace_callback(metrics.traceStatement)
+    # Used by searchPlayers to rank candidate names
+    conn.create_function("name_similarity", 2, _nameSimilarity, deterministic=True)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value};")
+    conn.database = _databaseKey(conn, _dbFile)
+    # Archived seasons and the <table>_all views over them
+    conn.archivePaths = archivePaths
+    _refreshPartitions(conn)
+    return conn
+
 def openConnection(_dbFile):
     """
     Opens a connection and sets the row_factory to sqlite3.Row.
     This allows accessing columns by name: row['column_name'].
     """
-    print(f"--- Connecting to: {_dbFile} ---")
     conn = None
     try:
-        conn = sqlite3.connect(_dbFile)
-        # This is crucial for Flask/Web Apps:
-        conn.row_factory = sqlite3.Row 
-        print("Connection successful")
+        conn = _connect(_dbFile)
+        logger.info("Connected to %s", _dbFile)
+        # Bring the schema (indexes etc.) up to date before first use; one
+        # process at a time, or two workers starting together both apply it
+        with _writerLock(conn):
+            migrations.migrate(conn)
+        _refreshPartitions(conn)
     except Error as e:
-        print(f"Connection Error: {e}")
+        logger.error("Connection error for %s: %s", _dbFile, e)
 
     return conn
 
 def closeConnection(_conn, _dbFile):
-    print(f"--- Closing connection: {_dbFile} ---")
     try:
         _conn.close()
-        print("Connection closed")
+        logger.info("Closed connection to %s", _dbFile)
     except Error as e:
-        print(f"Close Error: {e}")
+        logger.error("Close error for %s: %s", _dbFile, e)
+
+class ConnectionPool:
+    """
+    A fixed-size pool of configured connections to one database file.
+
+    Connections are opened lazily up to `size`, handed out one caller at a
+    time and reused (most recently used first, so its page cache is warm).
+    Schema migrations run once, when the first connection is opened.
+    """
+
+    def __init__(self, dbFile, size=8, timeout=5.0):
+        self.dbFile = dbFile
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._migrated = False
+
+    def _open(self):
+        conn = _connect(self.dbFile, check_same_thread=False)
+        if not self._migrated:
+            with _writerLock(conn):
+                migrations.migrate(conn)
+            self._migrated = True
+        return conn
+
+    def acquire(self):
+        """
+        Returns a healthy connection, opening a new one if the pool is not
+        full yet. Blocks up to `timeout` seconds when every connection is
+        in use and raises sqlite3.OperationalError if none frees up.
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    conn = self._open()
+                    self._opened += 1
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"connection pool exhausted ({self.size} in use)")
+
+        if not _ping(conn):
+            conn = self._replace(conn)
+        # Picks up seasons archived or restored since this connection's last use
+        _refreshPartitions(conn)
+        return conn
+
+    def release(self, conn):
+        """Returns a connection to the pool, discarding any uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            conn = self._replace(conn)
+        self._idle.put(conn)
+
+    def _replace(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+        return self._open()
+
+    def healthCheck(self):
+        """Pool occupancy plus a round trip on a pooled connection."""
+        try:
+            conn = self.acquire()
+        except Error:
+            ok = False
+        else:
+            ok = _ping(conn)
+            self.release(conn)
+        return {**self.stats(), "ok": ok}
+
+    def stats(self):
+        """Pool occupancy, without touching the database."""
+        idle = self._idle.qsize()
+        return {
+            "database": self.dbFile,
+            "size": self.size,
+            "open": self._opened,
+            "idle": idle,
+            "in_use": self._opened - idle,
+        }
+
+    def close(self):
+        """Closes every idle connection."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+def _ping(_conn):
+    try:
+        _conn.execute("SELECT 1;").fetchone()
+        return True
+    except Error:
+        return False
+
+# ==========================================
+# CONCURRENCY
+# ==========================================
+
+_SQLITE_BUSY = 5
+_SQLITE_LOCKED = 6
+
+# Statements retried by _retryBusy, for /cache/stats
+busyRetries = 0
+
+def _isBusy(e):
+    code = getattr(e, "sqlite_errorcode", None)
+    if code is None:
+        return "locked" in str(e) or "busy" in str(e)
+    return code & 0xFF in (_SQLITE_BUSY, _SQLITE_LOCKED)
+
+def _retryBusy(_conn, run, *args):
+    """
+    Runs one statement, retrying SQLITE_BUSY with bounded backoff. Only a
+    statement that opens its transaction (or runs outside one) is retried:
+    what it started is rolled back first, so the retry reads a fresh
+    snapshot. Later statements already hold their locks; a BUSY there is
+    raised for the caller to roll back.
+    """
+    global busyRetries
+    attempt = 0
+    while True:
+        started = _conn.in_transaction
+        try:
+            return run(*args)
+        except sqlite3.OperationalError as e:
+            if started or not _isBusy(e):
+                raise
+            # Undo the implicit BEGIN, so neither the retry nor the caller
+            # carries on in a transaction that lost the race
+            if _conn.in_transaction:
+                sqlite3.Connection.rollback(_conn)
+            if attempt >= BUSY_RETRIES:
+                raise
+            delay = min(BUSY_BACKOFF * 2 ** attempt, 1.0) * random.uniform(0.5, 1.0)
+            attempt += 1
+            busyRetries += 1
+            logger.warning("Database busy (%s), retry %d in %.0f ms", e, attempt, delay * 1000)
+            time.sleep(delay)
+
+class _WriterLock:
+    """
+    One writer at a time for a database file: an RLock between the threads
+    of this process and, where fcntl exists, an flock on <file>-writer
+    between processes (e.g. the app's workers). Writers queue here instead
+    of racing for SQLite's lock, which hands the loser SQLITE_BUSY.
+    Re-entrant, so a write inside transaction() does not wait on itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, timeout=WRITER_LOCK_TIMEOUT):
+        start = time.perf_counter()
+        if not self._lock.acquire(timeout=timeout):
+            raise sqlite3.OperationalError(f"timed out waiting for the writer lock on {self.path}")
+        if not self._depth and self.path and fcntl is not None:
+            try:
+                self._lockFile(start + timeout)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        if self._depth == 1:
+            self.acquired += 1
+            self.waited += time.perf_counter() - start
+
+    def _lockFile(self, deadline):
+        if self._file is None:
+            self._file = open(self.path + "-writer", "a")
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.perf_counter() >= deadline:
+                    raise sqlite3.OperationalError(f"timed out waiting for the writer lock on {self.path}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
+
+    def release(self):
+        self._depth -= 1
+        if not self._depth and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def stats(self):
+        return {"acquired": self.acquired, "waited_seconds": round(self.waited, 6)}
+
+_writerLocks = {}
+_writerLocksGuard = threading.Lock()
+
+def _writerLock(_conn):
+    """The _WriterLock of the connection's main database file."""
+    lock = getattr(_conn, "writerLock", None)
+    if lock is None:
+        path = _mainFile(_conn) or None  # None: an in-memory database
+        with _writerLocksGuard:
+            lock = _writerLocks.setdefault(path, _WriterLock(path))
+        if isinstance(_conn, Connection):
+            _conn.writerLock = lock
+    return lock
+
+def writerStats():
+    """Writer lock use per database file plus busy retries, for /cache/stats."""
+    with _writerLocksGuard:
+        locks = {path or ":memory:": lock.stats() for path, lock in _writerLocks.items()}
+    return {"writer_locks": locks, "busy_retries": busyRetries}
+
+class Checkpointer:
+    """
+    Keeps the WAL of one database file bounded, from a background thread.
+
+    Every `interval` seconds it runs a PASSIVE checkpoint, which copies
+    what it can back into the database without waiting on anybody. Once
+    the WAL is over `max_bytes` it runs a TRUNCATE checkpoint instead,
+    holding the writer lock so writers queue there meanwhile: that waits
+    (up to BUSY_TIMEOUT) for readers still on old pages, then empties the
+    file.
+    """
+
+    def __init__(self, dbFile, interval=30.0, max_bytes=WAL_SIZE_LIMIT):
+        self.dbFile = dbFile
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.runs = 0
+        self.truncations = 0
+        self.busy = 0
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="wal-checkpointer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        conn = _connect(self.dbFile, check_same_thread=False)
+        try:
+            while not self._stop.wait(self.interval):
+                self.checkpoint(conn)
+        finally:
+            conn.close()
+
+    def walBytes(self):
+        try:
+            return os.path.getsize(self.dbFile + "-wal")
+        except OSError:
+            return 0
+
+    def checkpoint(self, _conn):
+        """Runs one checkpoint; returns SQLite's (busy, WAL pages, pages checkpointed)."""
+        try:
+            if self.walBytes() > self.max_bytes:
+                with _writerLock(_conn):
+                    row = _conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE);").fetchone()
+                self.truncations += 1
+            else:
+                row = _conn.execute("PRAGMA main.wal_checkpoint(PASSIVE);").fetchone()
+        except Error as e:
+            logger.error("Error in checkpoint: %s", e)
+            return None
+        self.runs += 1
+        self.busy += row[0]
+        self.last = tuple(row)
+        return self.last
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "truncations": self.truncations,
+            "busy": self.busy,
+            "last": self.last,
+            "wal_bytes": self.walBytes(),
+        }
+
+# ==========================================
+# RESULT CACHE
+# ==========================================
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results with a TTL.
+
+    Entries are tagged with the write generation they were computed at;
+    every mutating function bumps the generation, which makes all older
+    entries stale at once. The generation only sees writes made through
+    this process, so `ttl` bounds how long another worker's writes can go
+    unnoticed.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = True
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (True, value) on a fresh hit, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                generation, expires_at, value = entry
+                if generation == self.generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation):
+        """Stores a result computed at `generation` (dropped if already stale)."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bumpGeneration(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+resultCache = ResultCache()
+
+_memoryDatabases = itertools.count(1)
+
+def _databaseKey(_conn, _dbFile=None):
+    """
+    Identifies the connection's database in cache keys, so results never
+    cross from one database to another: the main file's path, the URI of
+    a shared in-memory database (replica.py's copies), or a number of its
+    own for a private in-memory one.
+    """
+    key = getattr(_conn, "database", None)
+    if key is None:
+        if _dbFile and _dbFile.startswith("file:"):
+            key = _dbFile
+        else:
+            key = _mainFile(_conn) or f":memory:{next(_memoryDatabases)}"
+        if isinstance(_conn, Connection):
+            _conn.database = key
+    return key
+
+def _copyResult(value):
+    # Hand out a fresh container so callers cannot mutate the cached one
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+def cachedQuery(func):
+    """
+    Serves a query function from resultCache, keyed on its database and
+    arguments. Reads inside an open transaction bypass the cache: they can
+    see writes other threads must not until the commit.
+    """
+    @functools.wraps(func)
+    def wrapper(_conn, *args, **kwargs):
+        if not resultCache.enabled or getattr(_conn, "unitDepth", 0) or _conn.in_transaction:
+            return func(_conn, *args, **kwargs)
+        key = (_databaseKey(_conn), func.__name__, args, tuple(sorted(kwargs.items())))
+        hit, value = resultCache.get(key)
+        if hit:
+            return _copyResult(value)
+        generation = resultCache.generation
+        value = func(_conn, *args, **kwargs)
+        resultCache.put(key, value, generation)
+        return _copyResult(value)
+    return wrapper
+
+# Called as listener(func, args, kwargs) after every mutating function, so
+# in-process copies of the data (see columnar.py) can follow the writes.
+_writeListeners = []
+
+def addWriteListener(listener):
+    _writeListeners.append(listener)
+
+def removeWriteListener(listener):
+    if listener in _writeListeners:
+        _writeListeners.remove(listener)
+
+def _notifyWrite(func, args, kwargs):
+    _conn = args[0] if args else kwargs.get("_conn")
+    if getattr(_conn, "unitDepth", 0):
+        # Listeners read the database: hold the call until the unit commits
+        _conn.pendingWrites.append((func, args, kwargs))
+        return
+    for listener in list(_writeListeners):
+        try:
+            listener(func, args, kwargs)
+        except Exception as e:
+            logger.error("Error in write listener for %s: %s", func.__name__, e)
+
+def invalidatesCache(func):
+    """
+    Marks a mutating function: every call holds the writer lock and bumps
+    the write generation. Inside transaction() a call that fails raises
+    TransactionError instead of returning False, so the unit does not
+    carry on without it.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _conn = args[0] if args else kwargs.get("_conn")
+        lock = _writerLock(_conn)
+        try:
+            lock.acquire()
+        except Error as e:
+            logger.error("Error in %s: %s", func.__name__, e)
+            return False
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            lock.release()
+            resultCache.bumpGeneration()
+            _notifyWrite(func, args, kwargs)
+        if result is False and getattr(_conn, "unitDepth", 0):
+            raise TransactionError(f"{func.__name__} failed inside a transaction")
+        return result
+    wrapper.invalidatesCache = True
+    return wrapper
+
+# ==========================================
+# TRANSACTIONS
+# ==========================================
+
+class TransactionError(Error):
+    """A mutating function failed inside transaction(); the unit was rolled back."""
+
+@contextlib.contextmanager
+def transaction(_conn):
+    """
+    Runs the mutating functions called inside the block as one unit of work:
+
+        with db.transaction(conn):
+            db.addPlayer(conn, ...)
+            db.addPlayerGameStats(conn, ...)
+
+    Their own commits are deferred, so the whole block commits once (one
+    fsync instead of one per call) and is atomic. A function that fails
+    raises TransactionError; that, or any other exception, rolls the unit
+    back and propagates. Units nest as savepoints: an inner unit that fails
+    rolls back only its own work, and the outer one carries on if the
+    exception is caught. Write listeners and the result cache hear about
+    the writes when the outermost unit commits.
+
+    The outermost unit holds the writer lock throughout and takes SQLite's
+    write lock up front (BEGIN IMMEDIATE), so it cannot fail half way on a
+    lock upgrade.
+    """
+    if not isinstance(_conn, Connection):
+        raise TypeError("transaction() needs a connection from openConnection() or ConnectionPool")
+    outermost = not _conn.unitDepth
+    if outermost:
+        _writerLock(_conn).acquire()
+    try:
+        if not _conn.unitDepth and not _conn.in_transaction:
+            _conn.execute("BEGIN IMMEDIATE;")
+        _conn.unitDepth += 1
+        savepoint = f"unit_{_conn.unitDepth}"
+        _conn.execute(f"SAVEPOINT {savepoint};")
+        held = len(_conn.pendingWrites)
+        try:
+            yield _conn
+            _conn.execute(f"RELEASE {savepoint};")
+        except BaseException:
+            try:
+                _conn.execute(f"ROLLBACK TO {savepoint};")
+                _conn.execute(f"RELEASE {savepoint};")
+            except Error:
+                pass  # SQLite already rolled the whole transaction back
+            # The listeners must not hear about the writes just undone
+            del _conn.pendingWrites[held:]
+            _conn.unitDepth -= 1
+            if not _conn.unitDepth:
+                _conn.pendingWrites.clear()
+                sqlite3.Connection.rollback(_conn)
+                # Reads on this connection may have cached the undone writes
+                resultCache.bumpGeneration()
+                profileCache.clear()
+            raise
+        _conn.unitDepth -= 1
+        if not _conn.unitDepth:
+            sqlite3.Connection.commit(_conn)
+            resultCache.bumpGeneration()
+            writes, _conn.pendingWrites = _conn.pendingWrites, []
+            for func, args, kwargs in writes:
+                _notifyWrite(func, args, kwargs)
+    finally:
+        if outermost:
+            _writerLock(_conn).release()
+
+@contextlib.contextmanager
+def readOnly(_conn):
+    """
+    Makes the connection refuse writes for the block (PRAGMA query_only),
+    so a mutating function called by mistake fails instead of writing.
+    """
+    previous = _conn.execute("PRAGMA query_only;").fetchone()[0]
+    _conn.execute("PRAGMA query_only = ON;")
+    try:
+        yield _conn
+    finally:
+        _conn.execute(f"PRAGMA query_only = {previous};")
 
 # ==========================================
 # PLAYER MANAGEMENT
 # ==========================================
 
+@metrics.timed
+@invalidatesCache
 def addGame(_conn, game_id, season, week, season_type, away_team, home_team, home_win):
     """
     Inserts a record into the 'games' table.
@@ -45,12 +738,14 @@ def addGame(_conn, game_id, season, week, season_type, away_team, home_team, hom
         cur = _conn.cursor()
         cur.execute(sql, (game_id, season, week, season_type, away_team, home_team, home_win))
         _conn.commit()
-        print(f"Success: Added game {game_id}")
+        logger.info("Added game %s", game_id)
         return True
     except Error as e:
-        print(f"Error in addGame: {e}")
+        logger.error("Error in addGame: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def addPlayer(_conn, player_id, player_name, team, birth_year, draft_year, draft_ovr, height, weight, position, season_year, week=1):
     # Split into two separate executions to use parameterized queries safely
     sql_player = """
@@ -66,12 +761,14 @@ def addPlayer(_conn, player_id, player_name, team, birth_year, draft_year, draft
         cur.execute(sql_player, (player_id, player_name, birth_year, draft_year, draft_ovr, height, weight, position, season_year, team))
         cur.execute(sql_history, (player_id, season_year, week, team))
         _conn.commit()
-        print(f"Success: Added player {player_name}")
+        logger.info("Added player %s", player_name)
         return True
     except Error as e:
-        print(f"Error in addPlayer: {e}")
+        logger.error("Error in addPlayer: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def updatePlayerTeam(_conn, player_id, new_team, season_year, week=1):
     sql_update = "UPDATE players SET team = ? WHERE player_id = ?;"
     sql_insert = "INSERT INTO player_history (player_id, season, week, team) VALUES (?, ?, ?, ?);"
@@ -80,12 +777,14 @@ def updatePlayerTeam(_conn, player_id, new_team, season_year, week=1):
         cur.execute(sql_update, (new_team, player_id))
         cur.execute(sql_insert, (player_id, season_year, week, new_team))
         _conn.commit()
-        print(f"Success: Moved player {player_id} to {new_team}")
+        logger.info("Moved player %s to %s", player_id, new_team)
         return True
     except Error as e:
-        print(f"Error in updatePlayerTeam: {e}")
+        logger.error("Error in updatePlayerTeam: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def updatePlayerPosition(_conn, player_id, new_position):
     sql = "UPDATE players SET position = ? WHERE player_id = ?;"
     try:
@@ -94,9 +793,11 @@ def updatePlayerPosition(_conn, player_id, new_position):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in updatePlayerPosition: {e}")
+        logger.error("Error in updatePlayerPosition: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def updatePlayerWeight(_conn, player_id, new_weight):
     sql = "UPDATE players SET weight = ? WHERE player_id = ?;"
     try:
@@ -105,9 +806,11 @@ def updatePlayerWeight(_conn, player_id, new_weight):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in updatePlayerWeight: {e}")
+        logger.error("Error in updatePlayerWeight: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def updatePlayerName(_conn, player_id, new_name):
     sql = "UPDATE players SET player_name = ? WHERE player_id = ?;"
     try:
@@ -116,9 +819,11 @@ def updatePlayerName(_conn, player_id, new_name):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in updatePlayerName: {e}")
+        logger.error("Error in updatePlayerName: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def deletePlayer(_conn, player_id): 
     # Using parameterized queries for deletion
     sql1 = "DELETE FROM player_history WHERE player_id = ?;"
@@ -131,12 +836,14 @@ def deletePlayer(_conn, player_id):
         cur.execute(sql2, (player_id,))
         cur.execute(sql3, (player_id,))
         _conn.commit()
-        print(f"Success: Deleted player {player_id}")
+        logger.info("Deleted player %s", player_id)
         return True
     except Error as e:
-        print(f"Error in deletePlayer: {e}")
+        logger.error("Error in deletePlayer: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def deletePlayerGameStats(_conn, player_name, week, season):
     sql = "DELETE FROM player_game_stats WHERE player_name = ? AND week = ? AND season = ?;"
     try:
@@ -145,9 +852,11 @@ def deletePlayerGameStats(_conn, player_name, week, season):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in deletePlayerGameStats: {e}")
+        logger.error("Error in deletePlayerGameStats: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def addPlayerGameStats(_conn, season, player_id, player_name, week, team,
                        receptions=0.0, interception=0.0, rush_touchdown=0.0,
                        pass_touchdown=0.0, receiving_touchdown=0.0,
@@ -171,13 +880,61 @@ def addPlayerGameStats(_conn, season, player_id, player_name, week, team,
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in addPlayerGameStats: {e}")
+        logger.error("Error in addPlayerGameStats: %s", e)
+        return False
+
+PLAYER_GAME_STATS_KEYS = ("season", "player_id", "player_name", "week", "team")
+
+@metrics.timed
+@invalidatesCache
+def addPlayerGameStatsBulk(_conn, rows, upsert=True):
+    """
+    Inserts many player_game_stats rows with one executemany and a single
+    commit. Each row is a dict with the PLAYER_GAME_STATS_KEYS plus any of
+    the stat columns (missing stats default to 0.0).
+
+    upsert: replace the stat line when (season, week, player_id) already
+            exists instead of failing the whole batch.
+
+    A player_history row is added whenever a player shows up for a team
+    other than the last one on record, in input order.
+    """
+    columns = PLAYER_GAME_STATS_KEYS + migrations.STAT_COLUMNS
+    sql = f"""
+    INSERT INTO player_game_stats ({", ".join(columns)})
+    VALUES ({", ".join(f":{c}" for c in columns)})
+    """
+    if upsert:
+        sql += f"""
+    ON CONFLICT (season, week, player_id) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in columns if c not in ("season", "week", "player_id"))}
+    """
+    sql_history = """
+    INSERT OR IGNORE INTO player_history (player_id, season, week, team)
+    SELECT :player_id, :season, :week, :team
+    WHERE COALESCE((SELECT team FROM player_history
+                    WHERE player_id = :player_id AND (season, week) <= (:season, :week)
+                    ORDER BY season DESC, week DESC
+                    LIMIT 1), '') <> :team;
+    """
+    params = [{**dict.fromkeys(migrations.STAT_COLUMNS, 0.0), **row} for row in rows]
+    try:
+        cur = _conn.cursor()
+        cur.executemany(sql, params)
+        cur.executemany(sql_history, params)
+        _conn.commit()
+        return True
+    except Error as e:
+        _conn.rollback()
+        logger.error("Error in addPlayerGameStatsBulk: %s", e)
         return False
 
 # ==========================================
 # COACH MANAGEMENT
 # ==========================================
 
+@metrics.timed
+@invalidatesCache
 def addCoach(_conn, coach_name, coach_id, team, hire_year):
     sql1 = "UPDATE coaches SET coach_id = ?, name = ? WHERE team = ?;"
     sql2 = "INSERT INTO coach_history (season, coach_id, name, team) VALUES (?, ?, ?, ?);"
@@ -188,9 +945,11 @@ def addCoach(_conn, coach_name, coach_id, team, hire_year):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in addCoach: {e}")
+        logger.error("Error in addCoach: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def deleteCoach(_conn, coach_id):
     sql1 = "DELETE FROM coach_history WHERE coach_id = ?;"
     sql2 = "UPDATE coaches SET coach_id = (SELECT MIN(coach_id)-1 FROM coaches), name = 'Vacant' WHERE coach_id = ?;"
@@ -201,13 +960,15 @@ def deleteCoach(_conn, coach_id):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in deleteCoach: {e}")
+        logger.error("Error in deleteCoach: %s", e)
         return False
 
 # ==========================================
 # TEAM MANAGEMENT
 # ==========================================
 
+@metrics.timed
+@invalidatesCache
 def updateTeamCity(_conn, team_id, new_city):
     sql = "UPDATE teams SET city = ? WHERE team = ?;"
     try:
@@ -216,9 +977,11 @@ def updateTeamCity(_conn, team_id, new_city):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in updateTeamCity: {e}")
+        logger.error("Error in updateTeamCity: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def updateTeamName(_conn, team_id, new_name):
     sql = "UPDATE teams SET team_name = ? WHERE team = ?;"
     try:
@@ -227,13 +990,15 @@ def updateTeamName(_conn, team_id, new_name):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in updateTeamName: {e}")
+        logger.error("Error in updateTeamName: %s", e)
         return False
 
 # ==========================================
 # GAME MANAGEMENT
 # ==========================================
 
+@metrics.timed
+@invalidatesCache
 def addGame(_conn, game_id, season, week, season_type, away_team, home_team, home_win):
     sql = """
     INSERT INTO games (game_id, season, week, season_type, away_team, home_team, home_win)
@@ -245,9 +1010,11 @@ def addGame(_conn, game_id, season, week, season_type, away_team, home_team, hom
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in addGame: {e}")
+        logger.error("Error in addGame: %s", e)
         return False
 
+@metrics.timed
+@invalidatesCache
 def deleteGame(_conn, game_id):
     sql = "DELETE FROM games WHERE game_id = ?;"
     try:
@@ -256,13 +1023,55 @@ def deleteGame(_conn, game_id):
         _conn.commit()
         return True
     except Error as e:
-        print(f"Error in deleteGame: {e}")
+        logger.error("Error in deleteGame: %s", e)
+        return False
+
+GAME_COLUMNS = ("game_id", "season", "week", "season_type", "away_team", "home_team", "home_win")
+
+@metrics.timed
+@invalidatesCache
+def addGamesBulk(_conn, rows, upsert=True):
+    """
+    Inserts many games rows with one executemany and a single commit.
+    Each row is a dict of GAME_COLUMNS; game_id may be left out and is then
+    built as SEASON_WEEK_AWAY_HOME, and home_win may be replaced by
+    home_score / away_score.
+
+    upsert: overwrite a game whose game_id already exists.
+    """
+    sql = f"""
+    INSERT INTO games ({", ".join(GAME_COLUMNS)})
+    VALUES ({", ".join(f":{c}" for c in GAME_COLUMNS)})
+    """
+    if upsert:
+        sql += f"""
+    ON CONFLICT (game_id) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in GAME_COLUMNS[1:])}
+    """
+    params = []
+    for row in rows:
+        row = dict(row)
+        if row.get("home_win") is None and "home_score" in row:
+            row["home_win"] = 1 if int(row["home_score"]) > int(row["away_score"]) else 0
+        if not row.get("game_id"):
+            row["game_id"] = f"{row['season']}_{str(row['week']).zfill(2)}_{row['away_team']}_{row['home_team']}"
+        params.append({c: row.get(c) for c in GAME_COLUMNS})
+    try:
+        cur = _conn.cursor()
+        cur.executemany(sql, params)
+        _conn.commit()
+        return True
+    except Error as e:
+        _conn.rollback()
+        logger.error("Error in addGamesBulk: %s", e)
         return False
 
 # ==========================================
 # QUERIES (Updated to return data)
 # ==========================================
 
+@metrics.timed
+@cachedQuery
 def getPlayerIdByName(_conn, player_name):
     sql = """
     SELECT player_id, player_name, position
@@ -277,95 +1086,22 @@ def getPlayerIdByName(_conn, player_name):
         rows = cur.fetchall()
         return rows # Returns a list of sqlite3.Row objects
     except Error as e:
-        print(f"Error in getPlayerIdByName: {e}")
-        return []
-
-def getTop5QBsByPassingYards(_conn, season_year):
-    sql = """
-    SELECT player_id, player_name, SUM(passing_yards) AS total_passing_yards
-    FROM player_game_stats
-    WHERE season = ?
-    GROUP BY player_id, player_name
-    ORDER BY total_passing_yards DESC
-    LIMIT 5;
-    """
-    try:
-        cur = _conn.cursor()
-        cur.execute(sql, (season_year,))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print(f"Error in getTop5QBsByPassingYards: {e}")
-        return []
-
-def getTop5RBsByRushingYards(_conn, season_year):
-    sql = """
-    SELECT p.player_id, p.player_name, SUM(s.rushing_yards) AS total_rushing_yards
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
-    WHERE s.season = ? AND p.position = 'RB'
-    GROUP BY p.player_id, p.player_name
-    ORDER BY total_rushing_yards DESC
-    LIMIT 5;
-    """
-    try:
-        cur = _conn.cursor()
-        cur.execute(sql, (season_year,))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print(f"Error in getTop5RBsByRushingYards: {e}")
-        return []
-
-def getTop5WRsByReceivingYards(_conn, season_year):
-    sql = """
-    SELECT p.player_id, p.player_name, SUM(s.receiving_yards) AS total_receiving_yards
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
-    WHERE s.season = ? AND p.position = 'WR'
-    GROUP BY p.player_id, p.player_name
-    ORDER BY total_receiving_yards DESC
-    LIMIT 5;
-    """
-    try:
-        cur = _conn.cursor()
-        cur.execute(sql, (season_year,))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print(f"Error in getTop5WRsByReceivingYards: {e}")
-        return []
-
-def getTopPlayersAllTimeByTouchdowns(_conn, top_n=5):
-    sql = """
-    SELECT p.player_id, p.player_name,
-           SUM(s.rush_touchdown + s.pass_touchdown + s.receiving_touchdown) AS total_touchdowns
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
-    GROUP BY p.player_id, p.player_name
-    ORDER BY total_touchdowns DESC
-    LIMIT ?
-    """
-    try:
-        cur = _conn.cursor()
-        cur.execute(sql, (top_n,))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print(f"Error in getTopPlayersAllTimeByTouchdowns: {e}")
+        logger.error("Error in getPlayerIdByName: %s", e)
         return []
 
+@metrics.timed
+@cachedQuery
 def getQBsLowestInterceptionAvgMinTD(_conn, min_games=12, min_touchdowns=10, top_n=10):
     sql = """
     SELECT p.player_id, p.player_name,
-           SUM(s.interception) * 1.0 / COUNT(s.week) AS avg_interceptions,
-           SUM(s.pass_touchdown + s.rush_touchdown + s.receiving_touchdown) AS total_touchdowns
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
+           SUM(t.interception) * 1.0 / SUM(t.games_played) AS avg_interceptions,
+           SUM(t.pass_touchdown + t.rush_touchdown + t.receiving_touchdown) AS total_touchdowns
+    FROM player_season_totals t
+    JOIN players p ON t.player_id = p.player_id
     WHERE p.position = 'QB'
     GROUP BY p.player_id, p.player_name
-    HAVING COUNT(s.week) >= ? AND total_touchdowns >= ?
-    ORDER BY avg_interceptions ASC
+    HAVING SUM(t.games_played) >= ? AND total_touchdowns >= ?
+    ORDER BY avg_interceptions ASC, p.player_id
     LIMIT ?
     """
     try:
@@ -374,18 +1110,20 @@ def getQBsLowestInterceptionAvgMinTD(_conn, min_games=12, min_touchdowns=10, top
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in getQBsLowestInterceptionAvgMinTD: {e}")
+        logger.error("Error in getQBsLowestInterceptionAvgMinTD: %s", e)
         return []
 
+@metrics.timed
+@cachedQuery
 def getPlayersLowestInterceptionsAvg(_conn, min_games=1, top_n=5):
     sql = """
     SELECT p.player_id, p.player_name,
-           SUM(s.interception) * 1.0 / COUNT(s.player_id) AS avg_interceptions
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
+           SUM(t.interception) * 1.0 / SUM(t.games_played) AS avg_interceptions
+    FROM player_season_totals t
+    JOIN players p ON t.player_id = p.player_id
     GROUP BY p.player_id, p.player_name
-    HAVING COUNT(s.player_id) >= ?
-    ORDER BY avg_interceptions ASC
+    HAVING SUM(t.games_played) >= ?
+    ORDER BY avg_interceptions ASC, p.player_id
     LIMIT ?
     """
     try:
@@ -394,9 +1132,11 @@ def getPlayersLowestInterceptionsAvg(_conn, min_games=1, top_n=5):
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in getPlayersLowestInterceptionsAvg: {e}")
+        logger.error("Error in getPlayersLowestInterceptionsAvg: %s", e)
         return []
 
+@metrics.timed
+@cachedQuery
 def getPlayerNameById(_conn, player_id):
     sql = "SELECT player_name FROM players WHERE player_id = ?;"
     try:
@@ -405,203 +1145,207 @@ def getPlayerNameById(_conn, player_id):
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in getPlayerNameById: {e}")
+        logger.error("Error in getPlayerNameById: %s", e)
         return []
 
+# A player's latest player_career_totals row, i.e. the career to date, in
+# one primary-key lookup. Joined onto a single dummy row so a player with
+# no games still gets a row (of NULLs), as the SUM()s it replaced did.
+_CAREER_ROW = """
+    FROM (SELECT 1) LEFT JOIN player_career_totals c
+        ON c.player_id = :player_id
+        AND c.season = (SELECT MAX(season) FROM player_career_totals WHERE player_id = :player_id)
+"""
+
+@metrics.timed
+@cachedQuery
 def playerQBCareerStats(_conn, player_id):
-    sql = """
+    sql = f"""
     SELECT 
-        SUM(passing_yards) AS total_passing_yards,
-        SUM(rushing_yards) AS total_rushing_yards,
-        SUM(pass_touchdown) AS total_pass_touchdowns,
-        SUM(rush_touchdown) AS total_rush_touchdowns,
-        sum(receiving_yards) AS total_receiving_yards,
-        SUM(receiving_touchdown) AS total_receiving_touchdowns,
-        SUM(interception) AS total_interceptions
-    FROM player_game_stats
-    WHERE player_id = ?;
+        c.passing_yards AS total_passing_yards,
+        c.rushing_yards AS total_rushing_yards,
+        c.pass_touchdown AS total_pass_touchdowns,
+        c.rush_touchdown AS total_rush_touchdowns,
+        c.receiving_yards AS total_receiving_yards,
+        c.receiving_touchdown AS total_receiving_touchdowns,
+        c.interception AS total_interceptions
+    {_CAREER_ROW};
     """
     try:
         cur = _conn.cursor()
-        cur.execute(sql, (player_id,))
+        cur.execute(sql, {"player_id": player_id})
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in playerQBCareerStats: {e}")
+        logger.error("Error in playerQBCareerStats: %s", e)
         return []
 
-def getTeamSchedule(_conn, team, season):
+@metrics.timed
+@cachedQuery
+def getTeamSchedule(_conn, team, season, after_week=None, limit=None):
     # Renamed from 'printTeamSchedule' to 'getTeamSchedule'
+    # Pages by keyset: limit games per page, the last row's week as after_week
     sql = """
     SELECT week, season_type, away_team, home_team
-    FROM games
+    FROM games_all
     WHERE (away_team = ? OR home_team = ?) AND (season = ? AND season_type = 'REG')
-    ORDER BY week ASC;
+      AND week > ?
+    ORDER BY week ASC
+    LIMIT ?;
+    """
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, (team, team, season, after_week or 0, limit if limit is not None else -1))
+        rows = cur.fetchall()
+        return rows
+    except Error as e:
+        logger.error("Error in getTeamSchedule: %s", e)
+        return []
+
+@metrics.timed
+@cachedQuery
+def getSeasons(_conn):
+    """Every season with games, oldest first, archived ones included."""
+    # One index seek per season (a loose index scan) rather than reading
+    # every game just to find the few distinct seasons
+    sql = """
+    WITH RECURSIVE seasons(season) AS (
+        SELECT MIN(season) FROM games
+        UNION ALL
+        SELECT (SELECT MIN(season) FROM games WHERE season > seasons.season)
+        FROM seasons WHERE seasons.season IS NOT NULL
+    )
+    SELECT season FROM seasons WHERE season IS NOT NULL
+    UNION
+    SELECT season FROM archived_seasons
+    ORDER BY season;
     """
     try:
         cur = _conn.cursor()
-        cur.execute(sql, (team, team, season))
+        cur.execute(sql)
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in getTeamSchedule: {e}")
+        logger.error("Error in getSeasons: %s", e)
         return []
 
+@metrics.timed
+@cachedQuery
 def get_team_record(conn, team, season):
     """ Returns a dictionary with wins and losses """
     sql = """
-        SELECT
-            SUM(
-                CASE
-                    WHEN home_team = ? AND home_win = 1 THEN 1     -- Home win
-                    WHEN away_team = ? AND home_win = 0 THEN 1     -- Away win
-                    ELSE 0
-                END
-            ) AS wins,
-            SUM(
-                CASE
-                    WHEN home_team = ? AND home_win = 0 THEN 1     -- Home loss
-                    WHEN away_team = ? AND home_win = 1 THEN 1     -- Away loss
-                    ELSE 0
-                END
-            ) AS losses
-        FROM games
-        WHERE season = ?;
+        SELECT COALESCE(SUM(wins), 0) AS wins, COALESCE(SUM(losses), 0) AS losses
+        FROM team_season_records
+        WHERE team = ? AND season = ?;
     """
     try:
         cur = conn.cursor()
-        cur.execute(sql, (team, team, team, team, season))
+        cur.execute(sql, (team, season))
         row = cur.fetchone()
         return {'wins': row['wins'], 'losses': row['losses']}
     except Error as e:
-        print(f"Error in get_team_record: {e}")
+        logger.error("Error in get_team_record: %s", e)
         return {'wins': 0, 'losses': 0}
 
-def get_conference_passing_leaders(_conn, season, conference, division, top_n=5):
-    sql = """
-    SELECT p.player_name, t.team_name, SUM(s.passing_yards) as total_yards
-    FROM player_game_stats s
-    JOIN players p ON s.player_id = p.player_id
-    JOIN teams t ON s.team = t.team
-    WHERE s.season = ? 
-      AND t.conference = ? 
-      AND t.division = ?
-      AND p.position = 'QB'
-    GROUP BY p.player_id, p.player_name
-    ORDER BY total_yards DESC
-    LIMIT ?;
-    """
-    try:
-        cur = _conn.cursor()
-        cur.execute(sql, (season, conference, division, top_n))
-        rows = cur.fetchall()
-        return rows
-    except Error as e:
-        print(f"Error in get_conference_passing_leaders: {e}")
-        return []
-
+@metrics.timed
+@cachedQuery
 def get_qb_stats_vs_opponent(_conn, player_id, opponent_team_ticker):
     sql = """
     SELECT 
         p.player_name,
-        COUNT(g.game_id) as games_played,
+        COUNT(gp.game_id) as games_played,
         AVG(s.passing_yards) as avg_pass_yards,
         AVG(s.pass_touchdown) as avg_pass_tds,
         AVG(s.interception) as avg_ints
-    FROM player_game_stats s
+    FROM player_game_stats_all s
     JOIN players p ON s.player_id = p.player_id
-    JOIN games g ON s.season = g.season AND s.week = g.week
+    JOIN game_participants gp ON gp.season = s.season AND gp.week = s.week AND gp.team = s.team
     WHERE s.player_id = ?
-      AND (
-          (g.home_team = s.team AND g.away_team = ?) 
-          OR 
-          (g.away_team = s.team AND g.home_team = ?)
-      );
+      AND gp.opponent = ?;
     """
     try:
         cur = _conn.cursor()
-        cur.execute(sql, (player_id, opponent_team_ticker, opponent_team_ticker))
+        cur.execute(sql, (player_id, opponent_team_ticker))
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in get_qb_stats_vs_opponent: {e}")
+        logger.error("Error in get_qb_stats_vs_opponent: %s", e)
         return []
 
-def get_player_matchup_history(_conn, player_id):
+@metrics.timed
+@cachedQuery
+def get_player_matchup_history(_conn, player_id, before=None, limit=None):
     """
-    Returns a detailed game log for a player.
+    Returns a detailed game log for a player, newest game first.
+
+    Pages by keyset: pass limit for a page of that many games and the last
+    row's (season, week) as `before` to get the next one.
     """
-    sql = """
+    page_filter = "AND (season, week) < (?, ?)" if before else ""
+    sql = f"""
     SELECT 
         s.season,
         s.week,
         opp_t.team_name AS opponent,
         c.name AS opposing_coach,
-        CASE 
-            WHEN (s.team = g.home_team AND g.home_win = 1) OR (s.team = g.away_team AND g.home_win = 0) 
-            THEN 'Win'
-            ELSE 'Loss'
-        END AS game_result,
+        CASE WHEN gp.won = 1 THEN 'Win' ELSE 'Loss' END AS game_result,
         s.passing_yards,
         s.rushing_yards,
         s.receiving_yards
-    FROM player_game_stats s
-    -- 1. Join Games to get schedule info (Home/Away logic)
-    JOIN games g 
-        ON s.season = g.season 
-        AND s.week = g.week 
-        AND (s.team = g.home_team OR s.team = g.away_team)
-    -- 2. Join Teams to get the Opponent's details
+    -- 1. The page of the player's games
+    FROM (
+        SELECT season, week, team, passing_yards, rushing_yards, receiving_yards
+        FROM player_game_stats_all
+        WHERE player_id = ? {page_filter}
+        ORDER BY season DESC, week DESC
+        LIMIT ?
+    ) s
+    -- 2. Join the player's side of the game (opponent and result)
+    JOIN game_participants gp
+        ON gp.season = s.season
+        AND gp.week = s.week
+        AND gp.team = s.team
+    -- 3. Join Teams to get the Opponent's details
     JOIN teams opp_t 
-        ON opp_t.team = (CASE WHEN s.team = g.home_team THEN g.away_team ELSE g.home_team END)
-    -- 3. Join Coach History to find who coached the opponent that year
+        ON opp_t.team = gp.opponent
+    -- 4. Join Coach History to find who coached the opponent that year
     LEFT JOIN coach_history ch 
         ON ch.team = opp_t.team 
         AND ch.season = s.season
-    -- 4. Join Coaches to get the coach's name
+    -- 5. Join Coaches to get the coach's name
     LEFT JOIN coaches c 
         ON ch.coach_id = c.coach_id
-    WHERE s.player_id = ?
     ORDER BY s.season DESC, s.week DESC;
     """
+    params = (player_id, *(before or ()), limit if limit is not None else -1)
     try:
         cur = _conn.cursor()
-        cur.execute(sql, (player_id,))
+        cur.execute(sql, params)
         rows = cur.fetchall()
         return rows
     except Error as e:
-        print(f"Error in get_player_matchup_history: {e}")
+        logger.error("Error in get_player_matchup_history: %s", e)
         return []
     
+@metrics.timed
+@cachedQuery
 def getDivisionWinners(conn, season):
     sql = """
     WITH team_wins AS (
-        SELECT
-            t.team,
-            t.division,
-            t.conference,
-            SUM(
-                CASE 
-                    WHEN g.home_team = t.team AND g.home_win = 1 THEN 1
-                    WHEN g.away_team = t.team AND g.home_win = 0 THEN 1
-                    ELSE 0
-                END
-            ) AS wins
-        FROM teams t
-        JOIN games g ON t.team IN (g.home_team, g.away_team)
-        WHERE g.season = ?
-        GROUP BY t.team, t.division, t.conference
+        SELECT team, SUM(wins) AS wins
+        FROM team_season_records
+        WHERE season = ?
+        GROUP BY team
     ),
 
     team_stats AS (
         SELECT 
-            t.team,
+            s.team,
             SUM(s.passing_yards + s.rushing_yards + s.receiving_yards) AS total_yards,
             SUM(s.pass_touchdown + s.rush_touchdown + s.receiving_touchdown) AS total_tds
-        FROM teams t
-        JOIN player_game_stats s ON t.team = s.team
+        FROM player_game_stats_all s
         WHERE s.season = ?
-        GROUP BY t.team
+        GROUP BY s.team
     ),
 
     team_info AS (
@@ -613,24 +1357,20 @@ def getDivisionWinners(conn, season):
             c.name AS coach_name,
             COALESCE(w.wins, 0) AS wins,
             COALESCE(s.total_yards, 0) AS total_yards,
-            COALESCE(s.total_tds, 0) AS total_tds
+            COALESCE(s.total_tds, 0) AS total_tds,
+            RANK() OVER (
+                PARTITION BY t.conference, t.division
+                ORDER BY COALESCE(w.wins, 0) DESC, COALESCE(s.total_yards, 0) DESC
+            ) AS div_rank
         FROM teams t
         LEFT JOIN team_wins w ON t.team = w.team
         LEFT JOIN team_stats s ON t.team = s.team
         LEFT JOIN coaches c ON t.team = c.team
     )
 
-    SELECT *
-    FROM team_info i
-    WHERE (i.team, i.division) IN (
-        SELECT team, division
-        FROM (
-            SELECT team, division, 
-                   RANK() OVER (PARTITION BY conference, division ORDER BY wins DESC, total_yards DESC) AS div_rank
-            FROM team_info
-        ) ranked
-        WHERE div_rank = 1
-    )
+    SELECT team, team_name, division, conference, coach_name, wins, total_yards, total_tds
+    FROM team_info
+    WHERE div_rank = 1
     ORDER BY conference, division;
     """
 
@@ -641,23 +1381,19 @@ def getDivisionWinners(conn, season):
     
     return rows
 
+@metrics.timed
+@cachedQuery
 def best_coach(conn):
     sql = """
     SELECT
         c.name AS coach_name,
         ch.team AS team,
-        SUM(CASE WHEN g.team = ch.team AND g.win = 1 THEN 1 ELSE 0 END) AS total_wins,
-        SUM(CASE WHEN g.team = ch.team AND g.win = 0 THEN 1 ELSE 0 END) AS total_losses,
-        SUM(CASE WHEN g.week = 22 AND g.team = ch.team AND g.win = 1 THEN 1 ELSE 0 END) AS super_bowl_wins
+        SUM(r.wins) AS total_wins,
+        SUM(r.losses) AS total_losses,
+        SUM(r.super_bowl_wins) AS super_bowl_wins
     FROM coach_history ch
     JOIN coaches c ON ch.coach_id = c.coach_id
-    JOIN (
-        SELECT home_team AS team, home_win AS win, week, season
-        FROM games
-        UNION ALL
-        SELECT away_team AS team, CASE WHEN home_win = 0 THEN 1 ELSE 0 END AS win, week, season
-        FROM games
-    ) g ON g.team = ch.team AND g.season = ch.season
+    JOIN team_season_records r ON r.team = ch.team AND r.season = ch.season
     GROUP BY c.name, ch.team
     ORDER BY total_wins DESC
     LIMIT 5;
@@ -666,6 +1402,7 @@ def best_coach(conn):
     cur.execute(sql)
     return cur.fetchall()
 
+@metrics.timed
 def getPlayerCareerDetails(_conn, player_id, include_passing=False, include_rushing=False, include_receiving=False, include_turnovers=False):
     """
     Returns a dictionary containing:
@@ -694,7 +1431,7 @@ def getPlayerCareerDetails(_conn, player_id, include_passing=False, include_rush
             # Convert sqlite3.Row object to a standard dictionary
             result["bio"] = dict(bio_row)
         else:
-            print(f"Player {player_id} not found.")
+            logger.info("Player %s not found", player_id)
             return None
 
         # ---------------------------------------------------------
@@ -703,7 +1440,7 @@ def getPlayerCareerDetails(_conn, player_id, include_passing=False, include_rush
         # [cite_start]Uses player_history to find the earliest season (min) a player appeared for each team [cite: 13, 14, 15]
         sql_teams = """
         SELECT team, MIN(season) as year_signed
-        FROM player_history
+        FROM player_history_all
         WHERE player_id = ?
         GROUP BY team
         ORDER BY year_signed ASC;
@@ -721,27 +1458,27 @@ def getPlayerCareerDetails(_conn, player_id, include_passing=False, include_rush
         # ---------------------------------------------------------
         # 3. GET CAREER TOTALS & GAMES PLAYED
         # ---------------------------------------------------------
-        # [cite_start]Calculates total games and aggregates specific stats from player_game_stats [cite: 19, 20, 21, 22]
+        # Reads the running totals through the player's last season (player_career_totals)
         
         # Base selection for games played
-        select_clause = "COUNT(*) as games_played"
+        select_clause = "COALESCE(c.games_played, 0) as games_played"
         
-        # Dynamically add aggregations based on booleans
+        # Dynamically add the columns based on booleans
         if include_passing:
-            select_clause += ", SUM(passing_yards) as total_passing_yards, SUM(pass_touchdown) as total_pass_tds"
+            select_clause += ", c.passing_yards as total_passing_yards, c.pass_touchdown as total_pass_tds"
         
         if include_rushing:
-            select_clause += ", SUM(rushing_yards) as total_rushing_yards, SUM(rush_touchdown) as total_rush_tds"
+            select_clause += ", c.rushing_yards as total_rushing_yards, c.rush_touchdown as total_rush_tds"
             
         if include_receiving:
-            select_clause += ", SUM(receiving_yards) as total_receiving_yards, SUM(receiving_touchdown) as total_receiving_tds, SUM(receptions) as total_receptions"
+            select_clause += ", c.receiving_yards as total_receiving_yards, c.receiving_touchdown as total_receiving_tds, c.receptions as total_receptions"
             
         if include_turnovers:
-            select_clause += ", SUM(interception) as total_interceptions, SUM(fumble) as total_fumbles, SUM(fumble_lost) as total_fumbles_lost"
+            select_clause += ", c.interception as total_interceptions, c.fumble as total_fumbles, c.fumble_lost as total_fumbles_lost"
 
-        sql_stats = f"SELECT {select_clause} FROM player_game_stats WHERE player_id = ?;"
+        sql_stats = f"SELECT {select_clause} {_CAREER_ROW};"
         
-        cur.execute(sql_stats, (player_id,))
+        cur.execute(sql_stats, {"player_id": player_id})
         stats_row = cur.fetchone()
 
         if stats_row:
@@ -772,10 +1509,954 @@ def getPlayerCareerDetails(_conn, player_id, include_passing=False, include_rush
         return result
 
     except Error as e:
-        print(f"Error in getPlayerCareerDetails: {e}")
+        logger.error("Error in getPlayerCareerDetails: %s", e)
         return None
 
 
+# ==========================================
+# PLAYER SEARCH
+# ==========================================
+
+MAX_SEARCH_RESULTS = 50
+# Index matches reranked by name similarity, and the lowest similarity
+# (0-1) a misspelled query's suggestions may have.
+SEARCH_CANDIDATES = 50
+FUZZY_MIN_SIMILARITY = 0.6
+
+_SEARCH_SQL = """
+    SELECT p.player_id, p.player_name, p.position, p.team, p.season,
+           name_similarity(?, p.player_name) AS score
+    FROM (
+        SELECT rowid, rank FROM {table}
+        WHERE {table} MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ) m
+    JOIN players p ON p.rowid = m.rowid
+    WHERE score >= ?
+    ORDER BY score DESC, m.rank, p.season DESC
+    LIMIT ?;
+"""
+
+def _searchTokens(text):
+    """Lower-case words of a name, punctuation folded as in alt_name."""
+    return re.findall(r"\w+", re.sub(r"[.'’-]", "", (text or "").lower()))
+
+def _nameSimilarity(query, name):
+    return difflib.SequenceMatcher(None, " ".join(_searchTokens(query)),
+                                   " ".join(_searchTokens(name))).ratio()
+
+@metrics.timed
+@cachedQuery
+def searchPlayers(_conn, query, top_k=10, fuzzy=True):
+    """
+    Typeahead search: players whose name words start with the words of
+    `query` ("mah", "pat mah", "ja'marr"), best match first. If nothing
+    matches and `fuzzy` is set, returns the closest spellings instead
+    ("Patrik Mahommes"). Rows carry player_id, player_name, position,
+    team, season and a 0-1 similarity score.
+    """
+    tokens = _searchTokens(query)
+    if not tokens:
+        return []
+    top_k = max(1, min(int(top_k), MAX_SEARCH_RESULTS))
+    prefix = " ".join(f'"{t}"*' for t in tokens)
+    try:
+        cur = _conn.cursor()
+        cur.execute(_SEARCH_SQL.format(table="player_search"),
+                    (query, prefix, SEARCH_CANDIDATES, 0, top_k))
+        rows = cur.fetchall()
+        if rows or not fuzzy:
+            return rows
+
+        # Misspelled: any shared three-letter run makes a candidate
+        grams = {t[i:i + 3] for t in tokens for i in range(len(t) - 2)}
+        if not grams:
+            return []
+        cur.execute(_SEARCH_SQL.format(table="player_trigrams"),
+                    (query, " OR ".join(f'"{g}"' for g in sorted(grams)),
+                     SEARCH_CANDIDATES, FUZZY_MIN_SIMILARITY, top_k))
+        return cur.fetchall()
+    except Error as e:
+        logger.error("Error in searchPlayers: %s", e)
+        return []
+
+# ==========================================
+# PLAYER PROFILES
+# ==========================================
+
+PLAYER_COLUMNS = ("player_id", "season", "player_name", "team", "birth_year", "draft_year",
+                  "draft_ovr", "height", "weight", "position")
+
+# Career total key -> player_season_totals column; the keys match
+# getPlayerCareerDetails so templates can take either.
+CAREER_TOTALS = (
+    ("total_games_played", "games_played"),
+    ("total_passing_yards", "passing_yards"),
+    ("total_pass_tds", "pass_touchdown"),
+    ("total_rushing_yards", "rushing_yards"),
+    ("total_rush_tds", "rush_touchdown"),
+    ("total_receiving_yards", "receiving_yards"),
+    ("total_receiving_tds", "receiving_touchdown"),
+    ("total_receptions", "receptions"),
+    ("total_interceptions", "interception"),
+    ("total_fumbles", "fumble"),
+    ("total_fumbles_lost", "fumble_lost"),
+)
+
+def _jsonPairs(columns, prefix=""):
+    return ", ".join(f"'{c}', {prefix}{c}" for c in columns)
+
+# The snapshot holds the newest PROFILE_MATCHUP_GAMES games of the game
+# log; 'matchups_next' is the (season, week) cursor for the rest, which
+# get_player_matchup_history pages through, or null.
+PROFILE_MATCHUP_GAMES = 50
+
+# The whole profile as one JSON document, read in one statement together
+# with the version it was built at.
+_PROFILE_SQL = f"""
+    SELECT json_object(
+        'bio', json_object({_jsonPairs(PLAYER_COLUMNS, "p.")}),
+        'teams', (
+            SELECT json_group_array(json_object('team', team, 'year_signed', year_signed))
+            FROM (SELECT team, MIN(season) AS year_signed
+                  FROM player_history_all
+                  WHERE player_id = p.player_id
+                  GROUP BY team
+                  ORDER BY year_signed)
+        ),
+        'career_stats', (
+            SELECT json_object({", ".join(f"'{key}', COALESCE(SUM({column}), 0)" for key, column in CAREER_TOTALS)})
+            FROM player_season_totals
+            WHERE player_id = p.player_id
+        ),
+        'seasons', (
+            SELECT json_group_array(json_object({_jsonPairs(("season", "games_played") + migrations.STAT_COLUMNS)}))
+            FROM (SELECT * FROM player_season_totals
+                  WHERE player_id = p.player_id
+                  ORDER BY season)
+        ),
+        'matchups', (
+            SELECT json_group_array(json_object({_jsonPairs(("season", "week", "opponent", "opposing_coach",
+                                                             "game_result", "passing_yards", "rushing_yards",
+                                                             "receiving_yards"))}))
+            FROM (SELECT s.season, s.week, opp_t.team_name AS opponent, c.name AS opposing_coach,
+                         CASE WHEN gp.won = 1 THEN 'Win' ELSE 'Loss' END AS game_result,
+                         s.passing_yards, s.rushing_yards, s.receiving_yards
+                  FROM (SELECT season, week, team, passing_yards, rushing_yards, receiving_yards
+                        FROM player_game_stats_all
+                        WHERE player_id = p.player_id
+                        ORDER BY season DESC, week DESC
+                        LIMIT {PROFILE_MATCHUP_GAMES}) s
+                  JOIN game_participants gp
+                      ON gp.season = s.season AND gp.week = s.week AND gp.team = s.team
+                  JOIN teams opp_t ON opp_t.team = gp.opponent
+                  LEFT JOIN coach_history ch ON ch.team = opp_t.team AND ch.season = s.season
+                  LEFT JOIN coaches c ON ch.coach_id = c.coach_id
+                  ORDER BY s.season DESC, s.week DESC)
+        ),
+        'matchups_next', (
+            SELECT season || '-' || week
+            FROM player_game_stats_all
+            WHERE player_id = p.player_id
+              AND EXISTS (SELECT 1 FROM player_game_stats_all
+                          WHERE player_id = p.player_id
+                          ORDER BY season DESC, week DESC
+                          LIMIT 1 OFFSET {PROFILE_MATCHUP_GAMES})
+            ORDER BY season DESC, week DESC
+            LIMIT 1 OFFSET {PROFILE_MATCHUP_GAMES - 1}
+        )
+    ) AS profile,
+    (SELECT COALESCE(SUM(version), 0) FROM player_versions
+     WHERE player_id IN (p.player_id, '*')) AS version
+    FROM players p
+    WHERE p.player_id = ?;
+"""
+
+_PROFILE_VERSION_SQL = """
+    SELECT COALESCE(SUM(version), 0) FROM player_versions WHERE player_id IN (?, '*');
+"""
+
+# Profile snapshots: (database, player_id, version) -> profile JSON text.
+# Every read looks the current version up first, so a write from any
+# process makes the old snapshot unreachable; LRU and TTL clear those out.
+profileCache = ResultCache(max_entries=2048, ttl=3600.0)
+
+@metrics.timed
+def getPlayerProfile(_conn, player_id, as_json=False):
+    """
+    Everything the profile page shows for one player -- 'bio', 'teams',
+    'career_stats', 'seasons', the first page of 'matchups' and the
+    'matchups_next' cursor past it -- built in one query and kept
+    as a snapshot until that player's data (or the games / teams / coaches
+    it references) changes. Returns None for an unknown player; as_json
+    returns the snapshot's JSON text as stored.
+    """
+    try:
+        cur = _conn.cursor()
+        hit = False
+        # Uncommitted writes bump the version too, so only committed data is cached
+        cached = profileCache.enabled and not _conn.in_transaction
+        if cached:
+            cur.execute(_PROFILE_VERSION_SQL, (player_id,))
+            hit, profile = profileCache.get((_databaseKey(_conn), player_id, cur.fetchone()[0]))
+
+        if not hit:
+            cur.execute(_PROFILE_SQL, (player_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            profile = row["profile"]
+            if cached:
+                profileCache.put((_databaseKey(_conn), player_id, row["version"]), profile,
+                                 profileCache.generation)
+
+        return profile if as_json else json.loads(profile)
+    except Error as e:
+        logger.error("Error in getPlayerProfile: %s", e)
+        return None
+
+# ==========================================
+# DATA VERSION
+# ==========================================
+
+@metrics.timed
+def getDataVersion(_conn):
+    """
+    Returns (tag, modified_at) for the current contents of the database:
+    tag changes on every committed write to a base table, from any process,
+    and modified_at is the unix time of the latest one. (None, None) if the
+    version cannot be read.
+    """
+    sql = "SELECT epoch, generation, modified_at FROM data_generation WHERE id = 1;"
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql)
+        row = cur.fetchone()
+        return f"{row['epoch']}-{row['generation']}", row["modified_at"]
+    except Error as e:
+        logger.error("Error in getDataVersion: %s", e)
+        return None, None
+
+# ==========================================
+# CHANGE LOG
+# ==========================================
+# Triggers append a change_log entry for every row written to the tables
+# in migrations.CHANGE_LOG_KEYS, whichever process or code path wrote it.
+# A consumer of derived data remembers the seq of the last entry it
+# handled, asks for the ones after it and refreshes only those rows.
+
+CHANGE_BATCH_SIZE = 1000
+
+@metrics.timed
+def getChangeSeq(_conn):
+    """
+    The sequence number of the latest change, 0 before the first one; a
+    consumer starting from scratch reads this before its full load. None
+    if it cannot be read.
+    """
+    sql = "SELECT seq FROM sqlite_sequence WHERE name = 'change_log';"
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql)
+        row = cur.fetchone()
+        return row[0] if row else 0
+    except Error as e:
+        logger.error("Error in getChangeSeq: %s", e)
+        return None
+
+@metrics.timed
+def getChangesSince(_conn, seq, limit=CHANGE_BATCH_SIZE):
+    """
+    The changes after sequence number `seq`, oldest first and at most
+    `limit` of them, as dicts {seq, table, key, op, season}: key is the
+    row's CHANGE_LOG_KEYS values as a list, op 'I', 'U' or 'D', season None
+    for players and coaches. Fewer than `limit` means the caller has caught
+    up; otherwise it asks again from the last seq returned.
+    """
+    sql = """
+        SELECT seq, table_name, row_key, op, season
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?;
+    """
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, (seq, limit))
+        return [{"seq": row["seq"], "table": row["table_name"], "key": json.loads(row["row_key"]),
+                 "op": row["op"], "season": row["season"]} for row in cur.fetchall()]
+    except Error as e:
+        logger.error("Error in getChangesSince: %s", e)
+        return []
+
+@metrics.timed
+def compactChangeLog(_conn):
+    """
+    Drops every change_log entry that a later entry for the same row makes
+    redundant (migrations.COMPACT_CHANGE_LOG), so the log stays about as
+    long as the tables it follows. Consumers at any seq still see each row
+    they have to refresh. The data is unchanged, so cached results stay
+    valid. Returns the number of entries removed, None on error.
+    """
+    try:
+        with _writerLock(_conn):
+            cur = _conn.cursor()
+            cur.execute(migrations.COMPACT_CHANGE_LOG)
+            removed = cur.rowcount
+            _conn.commit()
+        logger.info("Compacted change_log (%d entries removed)", removed)
+        return removed
+    except Error as e:
+        if _conn.in_transaction:
+            _conn.rollback()
+        logger.error("Error in compactChangeLog: %s", e)
+        return None
+
+# ==========================================
+# STREAMING EXPORTS
+# ==========================================
+
+# Rows pulled from SQLite per fetchmany() call by the iter* generators.
+EXPORT_BATCH_SIZE = 500
+
+def _iterRows(cur, batch_size):
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+def iterPlayerGameLog(_conn, player_id, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every game of a player's career, oldest first: the full
+    player_game_stats row plus opponent and result. Reads batch_size rows
+    at a time, so memory does not grow with the length of the career.
+    """
+    sql = f"""
+    SELECT s.season, s.week, gp.season_type, s.team, gp.opponent,
+           CASE gp.won WHEN 1 THEN 'Win' WHEN 0 THEN 'Loss' END AS result,
+           {", ".join(f"s.{c}" for c in migrations.STAT_COLUMNS)}
+    FROM player_game_stats_all s
+    LEFT JOIN game_participants gp
+        ON gp.season = s.season AND gp.week = s.week AND gp.team = s.team
+    WHERE s.player_id = ?
+    ORDER BY s.season, s.week;
+    """
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, (player_id,))
+        yield from _iterRows(cur, batch_size)
+    except Error as e:
+        logger.error("Error in iterPlayerGameLog: %s", e)
+
+def iterSeasonGameStats(_conn, season, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields every player_game_stats row of a season in (week, player_id)
+    order -- the primary key order, so nothing is sorted or buffered.
+    """
+    sql = "SELECT * FROM player_game_stats_all WHERE season = ? ORDER BY week, player_id;"
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, (season,))
+        yield from _iterRows(cur, batch_size)
+    except Error as e:
+        logger.error("Error in iterSeasonGameStats: %s", e)
+
+# ==========================================
+# LEADERBOARDS
+# ==========================================
+
+# Whitelisted leaderboard stats: name -> (expression over the stat
+# columns, result column). Only these expressions ever reach the SQL.
+LEADER_STATS = {
+    "passing_yards": ("passing_yards", "total_passing_yards"),
+    "rushing_yards": ("rushing_yards", "total_rushing_yards"),
+    "receiving_yards": ("receiving_yards", "total_receiving_yards"),
+    "scrimmage_yards": ("rushing_yards + receiving_yards", "total_scrimmage_yards"),
+    "receptions": ("receptions", "total_receptions"),
+    "pass_touchdowns": ("pass_touchdown", "total_pass_touchdowns"),
+    "rush_touchdowns": ("rush_touchdown", "total_rush_touchdowns"),
+    "receiving_touchdowns": ("receiving_touchdown", "total_receiving_touchdowns"),
+    "touchdowns": ("rush_touchdown + pass_touchdown + receiving_touchdown", "total_touchdowns"),
+    "interceptions": ("interception", "total_interceptions"),
+    "fumbles": ("fumble", "total_fumbles"),
+    "fumbles_lost": ("fumble_lost", "total_fumbles_lost"),
+}
+
+# One template per data source. The SQL text only varies with the stat and
+# sort direction, so each combination is prepared once and then reused from
+# the connection's statement cache; filters that are not set bind NULL.
+# Ties are broken by player_id so every source (see columnar.py) agrees.
+_LEADER_TEMPLATES = {
+    # A single season: one player_season_totals row per player, walked in
+    # (season, stat) index order when the stat is a plain column.
+    "season": """
+    SELECT t.player_id, p.player_name, {expr} AS {alias}
+    FROM player_season_totals t
+    JOIN players p ON t.player_id = p.player_id
+    WHERE t.season = :season_from
+      AND (:position IS NULL OR p.position = :position)
+      AND t.games_played >= :min_games
+    ORDER BY {alias} {direction}, t.player_id
+    LIMIT :top_n;
+    """,
+    # A season range (or all time): per player, the running totals at the
+    # range's last season minus those before its first (player_career_totals).
+    "range": """
+    SELECT p.player_id, p.player_name, {hi} - COALESCE({lo}, 0) AS {alias}
+    FROM players p
+    JOIN player_career_totals hi ON hi.player_id = p.player_id
+        AND hi.season = (SELECT MAX(season) FROM player_career_totals
+                         WHERE player_id = p.player_id AND season <= :season_to)
+    LEFT JOIN player_career_totals lo ON lo.player_id = p.player_id
+        AND lo.season = (SELECT MAX(season) FROM player_career_totals
+                         WHERE player_id = p.player_id AND season < :season_from)
+    WHERE (:position IS NULL OR p.position = :position)
+      AND hi.games_played > COALESCE(lo.games_played, 0)
+      AND hi.games_played - COALESCE(lo.games_played, 0) >= :min_games
+    ORDER BY {alias} {direction}, p.player_id
+    LIMIT :top_n;
+    """,
+    # Conference / division filters depend on the team of each game, so
+    # these go back to the game rows.
+    "team": """
+    SELECT p.player_id, p.player_name, MAX(tm.team_name) AS team_name, SUM({expr}) AS {alias}
+    FROM player_game_stats_all s
+    JOIN players p ON s.player_id = p.player_id
+    JOIN teams tm ON s.team = tm.team
+    WHERE s.season BETWEEN :season_from AND :season_to
+      AND (:position IS NULL OR p.position = :position)
+      AND (:conference IS NULL OR tm.conference = :conference)
+      AND (:division IS NULL OR tm.division = :division)
+    GROUP BY p.player_id, p.player_name
+    HAVING COUNT(*) >= :min_games
+    ORDER BY {alias} {direction}, p.player_id
+    LIMIT :top_n;
+    """,
+}
+
+MAX_LEADERS = 100
+
+@functools.lru_cache(maxsize=None)
+def _leaderSql(template, stat, ascending):
+    expr, alias = LEADER_STATS[stat]
+    prefix = "s" if template == "team" else "t"
+    columns = r"\b(%s)\b" % "|".join(migrations.STAT_COLUMNS)
+    return _LEADER_TEMPLATES[template].format(
+        expr=re.sub(columns, prefix + r".\1", expr),
+        hi=re.sub(columns, r"hi.\1", expr), lo=re.sub(columns, r"lo.\1", expr),
+        alias=alias, direction="ASC" if ascending else "DESC")
+
+def _leaderParams(season_from, season_to, position, conference, division, top_n, min_games):
+    return {
+        "season_from": season_from if season_from is not None else 0,
+        "season_to": season_to if season_to is not None else 9999,
+        "position": position,
+        "conference": conference,
+        "division": division,
+        "top_n": max(1, min(int(top_n), MAX_LEADERS)),
+        "min_games": min_games,
+    }
+
+@metrics.timed
+@cachedQuery
+def getLeaders(_conn, stat, season=None, season_from=None, season_to=None,
+               position=None, conference=None, division=None,
+               top_n=5, min_games=0, ascending=False):
+    """
+    Returns the top_n players for one of the LEADER_STATS.
+
+    season: a single season; or season_from / season_to for an inclusive
+            range (either end may be left open). No season means all time.
+    position: e.g. 'QB'; conference / division: e.g. 'NFC', 'West'.
+    min_games: minimum games played within the chosen seasons.
+
+    Rows have player_id, player_name (plus team_name when filtering by
+    conference or division) and the stat's result column, e.g.
+    total_passing_yards.
+    """
+    if stat not in LEADER_STATS:
+        logger.error("Error in getLeaders: unknown stat %r", stat)
+        return []
+
+    if season is not None:
+        season_from = season_to = season
+    if conference or division:
+        template = "team"
+    elif season_from is not None and season_from == season_to:
+        template = "season"
+    else:
+        template = "range"
+
+    params = _leaderParams(season_from, season_to, position, conference, division, top_n, min_games)
+    try:
+        cur = _conn.cursor()
+        cur.execute(_leaderSql(template, stat, ascending), params)
+        rows = cur.fetchall()
+        return rows
+    except Error as e:
+        logger.error("Error in getLeaders: %s", e)
+        return []
+
+@metrics.timed
+@cachedQuery
+def getPlayerRangeTotals(_conn, player_id, season_from=None, season_to=None):
+    """
+    A player's games played and stat totals over an inclusive season range
+    (either end may be left open), from two player_career_totals lookups.
+    Returns None when the player has no games in the range.
+    """
+    sql = f"""
+    SELECT hi.player_id, hi.games_played - COALESCE(lo.games_played, 0) AS games_played,
+           {", ".join(f"hi.{c} - COALESCE(lo.{c}, 0) AS {c}" for c in migrations.STAT_COLUMNS)}
+    FROM player_career_totals hi
+    LEFT JOIN player_career_totals lo ON lo.player_id = hi.player_id
+        AND lo.season = (SELECT MAX(season) FROM player_career_totals
+                         WHERE player_id = :player_id AND season < :season_from)
+    WHERE hi.player_id = :player_id
+      AND hi.season = (SELECT MAX(season) FROM player_career_totals
+                       WHERE player_id = :player_id AND season <= :season_to)
+      AND hi.games_played > COALESCE(lo.games_played, 0);
+    """
+    params = {
+        "player_id": player_id,
+        "season_from": season_from if season_from is not None else 0,
+        "season_to": season_to if season_to is not None else 9999,
+    }
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, params)
+        return cur.fetchone()
+    except Error as e:
+        logger.error("Error in getPlayerRangeTotals: %s", e)
+        return None
+
+# The fixed leaderboards. getLeaders times and caches the calls.
+
+def getTop5QBsByPassingYards(_conn, season_year):
+    return getLeaders(_conn, "passing_yards", season=season_year)
+
+def getTop5RBsByRushingYards(_conn, season_year):
+    return getLeaders(_conn, "rushing_yards", season=season_year, position="RB")
+
+def getTop5WRsByReceivingYards(_conn, season_year):
+    return getLeaders(_conn, "receiving_yards", season=season_year, position="WR")
+
+def getTopPlayersAllTimeByTouchdowns(_conn, top_n=5):
+    return getLeaders(_conn, "touchdowns", top_n=top_n)
+
+@metrics.timed
+@cachedQuery
+def get_conference_passing_leaders(_conn, season, conference, division, top_n=5):
+    """
+    A division's top QBs by passing yards in one season, as rows of
+    (player_name, team_name, total_yards): getLeaders' conference query
+    with the columns this function has always returned.
+    """
+    sql = f"""
+    SELECT player_name, team_name, total_passing_yards AS total_yards
+    FROM ({_leaderSql("team", "passing_yards", False).strip().rstrip(";")});
+    """
+    params = _leaderParams(season, season, "QB", conference, division, top_n, 0)
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        return rows
+    except Error as e:
+        logger.error("Error in get_conference_passing_leaders: %s", e)
+        return []
+
+# ==========================================
+# SEASON PARTITIONS
+# ==========================================
+
+def _mainFile(_conn):
+    """Path of the connection's main database file ('' for :memory:)."""
+    return _conn.execute("PRAGMA database_list;").fetchone()[2]
+
+def _archivePath(_conn, name):
+    if _conn.archivePaths is not None:
+        return _conn.archivePaths[name]
+    return os.path.join(_conn.archiveDir or os.path.dirname(_mainFile(_conn)), name)
+
+def _partitionLayout(_conn):
+    try:
+        return tuple(tuple(row) for row in
+                     _conn.execute("SELECT season, file FROM archived_seasons ORDER BY season;"))
+    except Error:
+        return ()  # not migrated yet
+
+def _detachArchives(_conn):
+    for row in _conn.execute("PRAGMA database_list;").fetchall():
+        if row[1].startswith("archive_"):
+            _conn.execute(f"DETACH DATABASE {row[1]};")
+    _conn.partitionLayout = None
+
+def _refreshPartitions(_conn):
+    """
+    ATTACHes every archive file in archived_seasons and (re)creates the
+    <table>_all views over main plus archives, when that list has changed
+    since the connection last looked.
+    """
+    layout = _partitionLayout(_conn)
+    if layout == _conn.partitionLayout:
+        return
+    _detachArchives(_conn)
+    files = {}
+    for season, name in layout:
+        files.setdefault(name, []).append(season)
+    archives = []
+    for i, (name, seasons) in enumerate(files.items()):
+        _conn.execute(f"ATTACH DATABASE ? AS archive_{i};", (_archivePath(_conn, name),))
+        archives.append((f"archive_{i}", seasons))
+    for table in migrations.PARTITIONED_TABLES:
+        columns = [row[1] for row in _conn.execute(f"PRAGMA main.table_info({table});")]
+        _conn.execute(f"DROP VIEW IF EXISTS temp.{table}_all;")
+        _conn.execute(migrations.partitionViewSql(table, columns, archives))
+    _conn.partitionLayout = layout
+
+def _columns(cur, table):
+    return ", ".join(row[1] for row in cur.execute(f"PRAGMA main.table_info({table});").fetchall())
+
+def _copySchema(cur, table, schema):
+    """Creates `table` and its indexes in the attached `schema` if missing."""
+    statements = cur.execute("""
+        SELECT sql FROM main.sqlite_master
+        WHERE tbl_name = ? AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index';""", (table,)).fetchall()
+    for (sql,) in statements:
+        cur.execute(re.sub(r"^CREATE (UNIQUE )?(TABLE|INDEX) (IF NOT EXISTS )?",
+                           lambda m: f"CREATE {m.group(1) or ''}{m.group(2)} IF NOT EXISTS {schema}.", sql))
+
+@contextlib.contextmanager
+def _preservingRows(cur, tables, where, params=()):
+    """
+    Puts the rows of `tables` matching `where` back exactly as they were
+    once the block is done, whatever the triggers did to them meanwhile.
+    """
+    for table in tables:
+        cur.execute(f"DROP TABLE IF EXISTS temp.kept_{table};")
+        cur.execute(f"CREATE TEMP TABLE kept_{table} AS SELECT * FROM main.{table} WHERE {where};", params)
+    yield
+    for table in tables:
+        cur.execute(f"DELETE FROM main.{table} WHERE {where};", params)
+        cur.execute(f"INSERT INTO main.{table} SELECT * FROM temp.kept_{table};")
+        cur.execute(f"DROP TABLE temp.kept_{table};")
+
+@contextlib.contextmanager
+def _unloggedChanges(cur):
+    """
+    Takes back the change_log entries the block's writes add: rows moved
+    between the main file and an archive are still there, read through the
+    <table>_all views, and no consumer should drop or refresh them.
+    """
+    cur.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log;")
+    last = cur.fetchone()[0]
+    yield
+    cur.execute("DELETE FROM change_log WHERE seq > ?;", (last,))
+
+@metrics.timed
+@invalidatesCache
+def archiveSeason(_conn, season, per_season=False):
+    """
+    Moves a closed season's games, player_game_stats and player_history rows
+    out of the main file into an archive file next to it (one per decade,
+    e.g. nfl_stats.2010s.sqlite, or one per season with per_season). Reads
+    still see them through the <table>_all views; the derived tables keep
+    the season's rows as they are. The season is read-only until
+    restoreSeason. Cannot run inside transaction().
+    """
+    archive = None
+    try:
+        if not _mainFile(_conn):
+            raise Error("an in-memory database has nowhere to archive to")
+        if _conn.execute("SELECT 1 FROM archived_seasons WHERE season = ?;", (season,)).fetchone():
+            raise Error(f"season {season} is already archived")
+        stem = os.path.splitext(os.path.basename(_mainFile(_conn)))[0]
+        name = f"{stem}.{season}.sqlite" if per_season else f"{stem}.{season // 10 * 10}s.sqlite"
+
+        _detachArchives(_conn)
+        _conn.execute("ATTACH DATABASE ? AS archive_new;", (_archivePath(_conn, name),))
+        archive = "archive_new"
+        cur = _conn.cursor()
+        # Copy first and commit the archive on its own: until the season is
+        # registered below, the views ignore whatever the archive holds for it
+        cur.execute("BEGIN;")
+        moved = 0
+        for table in migrations.PARTITIONED_TABLES:
+            _copySchema(cur, table, archive)
+            columns = _columns(cur, table)
+            cur.execute(f"DELETE FROM {archive}.{table} WHERE season = ?;", (season,))
+            cur.execute(f"INSERT INTO {archive}.{table} ({columns}) "
+                        f"SELECT {columns} FROM main.{table} WHERE season = ?;", (season,))
+            moved += cur.rowcount
+        _conn.commit()
+
+        # Then drop the rows from the main file and register the season, as
+        # one transaction on the main file
+        cur.execute("BEGIN IMMEDIATE;")
+        with _unloggedChanges(cur):
+            with _preservingRows(cur, migrations.SEASON_DERIVED_TABLES, "season = ?", (season,)):
+                for table in migrations.PARTITIONED_TABLES:
+                    cur.execute(f"DELETE FROM main.{table} WHERE season = ?;", (season,))
+        cur.execute("""
+            INSERT INTO archived_seasons (season, file, archived_at)
+            VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER));""", (season, name))
+        _conn.commit()
+        logger.info("Archived season %s to %s (%d rows)", season, name, moved)
+        return True
+    except Error as e:
+        if _conn.in_transaction:
+            _conn.rollback()
+        logger.error("Error in archiveSeason: %s", e)
+        return False
+    finally:
+        if archive:
+            _conn.execute(f"DETACH DATABASE {archive};")
+        _refreshPartitions(_conn)
+
+@metrics.timed
+@invalidatesCache
+def restoreSeason(_conn, season):
+    """Moves an archived season's rows back into the main file and makes it writable again."""
+    archive = None
+    try:
+        row = _conn.execute("SELECT file FROM archived_seasons WHERE season = ?;", (season,)).fetchone()
+        if row is None:
+            raise Error(f"season {season} is not archived")
+
+        _detachArchives(_conn)
+        _conn.execute("ATTACH DATABASE ? AS archive_new;", (_archivePath(_conn, row["file"]),))
+        archive = "archive_new"
+        cur = _conn.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        # Unregistered first, so the archived-season guards let the rows in
+        cur.execute("DELETE FROM archived_seasons WHERE season = ?;", (season,))
+        moved = 0
+        with _unloggedChanges(cur):
+            with _preservingRows(cur, migrations.SEASON_DERIVED_TABLES, "season = ?", (season,)):
+                # The rows kept at archive time would collide with the ones
+                # the insert triggers add; they are put back afterwards
+                for table in migrations.SEASON_DERIVED_TABLES:
+                    cur.execute(f"DELETE FROM main.{table} WHERE season = ?;", (season,))
+                for table in migrations.PARTITIONED_TABLES:
+                    columns = _columns(cur, table)
+                    cur.execute(f"INSERT INTO main.{table} ({columns}) "
+                                f"SELECT {columns} FROM {archive}.{table} WHERE season = ?;", (season,))
+                    moved += cur.rowcount
+        _conn.commit()
+
+        # The archive's copy is invisible from here on; tidy it away
+        cur.execute("BEGIN;")
+        for table in migrations.PARTITIONED_TABLES:
+            cur.execute(f"DELETE FROM {archive}.{table} WHERE season = ?;", (season,))
+        _conn.commit()
+        logger.info("Restored season %s from %s (%d rows)", season, row["file"], moved)
+        return True
+    except Error as e:
+        if _conn.in_transaction:
+            _conn.rollback()
+        logger.error("Error in restoreSeason: %s", e)
+        return False
+    finally:
+        if archive:
+            _conn.execute(f"DETACH DATABASE {archive};")
+        _refreshPartitions(_conn)
+
+@metrics.timed
+def getArchivedSeasons(_conn):
+    """archived_seasons rows (season, file, archived_at), oldest season first."""
+    sql = "SELECT season, file, archived_at FROM archived_seasons ORDER BY season;"
+    try:
+        cur = _conn.cursor()
+        cur.execute(sql)
+        rows = cur.fetchall()
+        return rows
+    except Error as e:
+        logger.error("Error in getArchivedSeasons: %s", e)
+        return []
+
+# ==========================================
+# DERIVED TABLE MAINTENANCE
+# ==========================================
+
+# Archived seasons' derived rows cannot be recomputed from the main file:
+# rebuilds keep them and checks skip them.
+ARCHIVED = "season IN (SELECT season FROM archived_seasons)"
+
+@metrics.timed
+@invalidatesCache
+def rebuildPlayerSeasonTotals(_conn):
+    """
+    Recomputes player_season_totals from scratch. The triggers on
+    player_game_stats keep it current; this is for repairs and backfills.
+    """
+    try:
+        cur = _conn.cursor()
+        with _preservingRows(cur, ["player_season_totals"], ARCHIVED):
+            for sql in migrations.PLAYER_SEASON_TOTALS_REBUILD:
+                cur.execute(sql)
+        # Served results may change, so HTTP validators have to as well
+        cur.execute(migrations.BUMP_DATA_GENERATION)
+        _conn.commit()
+        logger.info("Rebuilt player_season_totals")
+        return True
+    except Error as e:
+        logger.error("Error in rebuildPlayerSeasonTotals: %s", e)
+        return False
+
+@metrics.timed
+def checkPlayerSeasonTotals(_conn):
+    """
+    Compares player_season_totals with a fresh aggregate of
+    player_game_stats. Returns a list of (player_id, season) keys that
+    differ; an empty list means the table is consistent.
+    """
+    try:
+        return _diffDerivedTable(_conn, "player_season_totals",
+                                 migrations.PLAYER_SEASON_TOTALS_SELECT,
+                                 ["player_id", "season"], ["player_name"],
+                                 ("games_played",) + migrations.STAT_COLUMNS)
+    except Error as e:
+        logger.error("Error in checkPlayerSeasonTotals: %s", e)
+        return []
+
+@metrics.timed
+@invalidatesCache
+def rebuildPlayerCareerTotals(_conn):
+    """
+    Recomputes player_career_totals from player_season_totals (archived
+    seasons included). The triggers on player_season_totals keep it
+    current; this is for repairs and backfills.
+    """
+    try:
+        cur = _conn.cursor()
+        for sql in migrations.PLAYER_CAREER_TOTALS_REBUILD:
+            cur.execute(sql)
+        # Served results may change, so HTTP validators have to as well
+        cur.execute(migrations.BUMP_DATA_GENERATION)
+        _conn.commit()
+        logger.info("Rebuilt player_career_totals")
+        return True
+    except Error as e:
+        logger.error("Error in rebuildPlayerCareerTotals: %s", e)
+        return False
+
+@metrics.timed
+def checkPlayerCareerTotals(_conn):
+    """
+    Compares player_career_totals with running sums of
+    player_season_totals. Returns a list of (player_id, season) keys that
+    differ.
+    """
+    try:
+        return _diffDerivedTable(_conn, "player_career_totals",
+                                 f"SELECT * FROM ({migrations.PLAYER_CAREER_TOTALS_SELECT}) WHERE NOT {ARCHIVED}",
+                                 ["player_id", "season"], [],
+                                 ("games_played",) + migrations.STAT_COLUMNS)
+    except Error as e:
+        logger.error("Error in checkPlayerCareerTotals: %s", e)
+        return []
+
+@metrics.timed
+@invalidatesCache
+def rebuildTeamSeasonRecords(_conn):
+    """
+    Recomputes team_season_records from scratch. The triggers on games
+    keep it current; this is for repairs and backfills.
+    """
+    try:
+        cur = _conn.cursor()
+        with _preservingRows(cur, ["team_season_records"], ARCHIVED):
+            for sql in migrations.TEAM_SEASON_RECORDS_REBUILD:
+                cur.execute(sql)
+        # Served results may change, so HTTP validators have to as well
+        cur.execute(migrations.BUMP_DATA_GENERATION)
+        _conn.commit()
+        logger.info("Rebuilt team_season_records")
+        return True
+    except Error as e:
+        logger.error("Error in rebuildTeamSeasonRecords: %s", e)
+        return False
+
+@metrics.timed
+def checkTeamSeasonRecords(_conn):
+    """
+    Compares team_season_records with a fresh aggregate of games. Returns
+    a list of (team, season, season_type) keys that differ.
+    """
+    try:
+        return _diffDerivedTable(_conn, "team_season_records",
+                                 migrations.TEAM_SEASON_RECORDS_SELECT,
+                                 ["team", "season", "season_type"], [],
+                                 migrations.TEAM_RECORD_COLUMNS)
+    except Error as e:
+        logger.error("Error in checkTeamSeasonRecords: %s", e)
+        return []
+
+@metrics.timed
+@invalidatesCache
+def rebuildGameParticipants(_conn):
+    """
+    Recomputes game_participants from scratch. The triggers on games keep
+    it current; this is for repairs and backfills.
+    """
+    try:
+        cur = _conn.cursor()
+        with _preservingRows(cur, ["game_participants"], ARCHIVED):
+            for sql in migrations.GAME_PARTICIPANTS_REBUILD:
+                cur.execute(sql)
+        # Served results may change, so HTTP validators have to as well
+        cur.execute(migrations.BUMP_DATA_GENERATION)
+        _conn.commit()
+        logger.info("Rebuilt game_participants")
+        return True
+    except Error as e:
+        logger.error("Error in rebuildGameParticipants: %s", e)
+        return False
+
+@metrics.timed
+def checkGameParticipants(_conn):
+    """
+    Compares game_participants with both sides of every games row. Returns
+    a list of (game_id, team) keys that differ.
+    """
+    try:
+        return _diffDerivedTable(_conn, "game_participants",
+                                 migrations.GAME_PARTICIPANTS_SELECT,
+                                 ["game_id", "team"], [],
+                                 migrations.GAME_PARTICIPANT_COLUMNS[2:])
+    except Error as e:
+        logger.error("Error in checkGameParticipants: %s", e)
+        return []
+
+def _diffDerivedTable(_conn, table, live_select, key_columns, extra_columns, value_columns):
+    """
+    Returns the keys whose row in `table` differs from `live_select` (which
+    yields key_columns, extra_columns, value_columns in that order). REAL
+    values are compared to 6 decimal places, everything else exactly.
+    Archived seasons are left out.
+    """
+    keys = ", ".join(key_columns)
+    live_columns = ", ".join(key_columns + extra_columns + list(value_columns))
+    compared = ", ".join(key_columns + [f"IIF(typeof({c}) = 'real', ROUND({c}, 6), {c})"
+                                        for c in value_columns])
+    sql = f"""
+    WITH live ({live_columns}) AS ({live_select}),
+    hot AS (SELECT * FROM {table} WHERE NOT {ARCHIVED}),
+    diff AS (
+        SELECT * FROM (SELECT {compared} FROM live EXCEPT SELECT {compared} FROM hot)
+        UNION ALL
+        SELECT * FROM (SELECT {compared} FROM hot EXCEPT SELECT {compared} FROM live)
+    )
+    SELECT DISTINCT {keys} FROM diff ORDER BY {keys};
+    """
+    cur = _conn.cursor()
+    cur.execute(sql)
+    return [tuple(row) for row in cur.fetchall()]
+
 # ==========================================
 # TEST FUNCTIONS
 # ==========================================
@@ -0,0 +1,108 @@
+"""
+Streaming bulk loader for weekly player_game_stats and games files.
+
+Reads CSV or JSON Lines (one object per line) with column names matching
+the table, and feeds the rows to addPlayerGameStatsBulk / addGamesBulk in
+fixed-size chunks, so memory stays flat however large the file is.
+
+    python ingest.py stats week_01.csv
+    python ingest.py games 2025_schedule.jsonl --chunk-size 2000
+    python ingest.py stats backfill.csv --db other.sqlite --no-upsert
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import sys
+import time
+
+import database_functions as db
+import migrations
+
+logger = logging.getLogger(__name__)
+
+INTEGER_COLUMNS = {"season", "week", "home_win", "home_score", "away_score"}
+REAL_COLUMNS = set(migrations.STAT_COLUMNS)
+
+
+def readRows(path):
+    """Yields one dict per record of a .csv or .jsonl file."""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def cleanRow(row):
+    """Casts numeric columns and drops empty values so defaults apply."""
+    clean = {}
+    for key, value in row.items():
+        if value is None or value == "":
+            continue
+        if key in INTEGER_COLUMNS:
+            value = int(float(value))
+        elif key in REAL_COLUMNS:
+            value = float(value)
+        clean[key] = value
+    return clean
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ingest(_conn, kind, path, chunk_size=1000, upsert=True):
+    """
+    Loads `path` into the table for `kind` ("stats" or "games"). Returns
+    (rows loaded, seconds taken, whether every chunk succeeded); stops at
+    the first chunk that fails.
+    """
+    load = db.addPlayerGameStatsBulk if kind == "stats" else db.addGamesBulk
+    loaded = 0
+    start = time.perf_counter()
+
+    for chunk in chunked((cleanRow(row) for row in readRows(path)), chunk_size):
+        if not load(_conn, chunk, upsert=upsert):
+            logger.error("Stopped after %d rows: chunk starting at row %d failed", loaded, loaded + 1)
+            return loaded, time.perf_counter() - start, False
+        loaded += len(chunk)
+
+    return loaded, time.perf_counter() - start, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load player_game_stats or games rows.")
+    parser.add_argument("kind", choices=["stats", "games"])
+    parser.add_argument("path", help=".csv or .jsonl file")
+    parser.add_argument("--db", default="nfl_stats.sqlite")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--no-upsert", action="store_true", help="fail on existing keys instead of replacing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    conn = db.openConnection(args.db)
+    if not conn:
+        sys.exit(1)
+    # Per-statement tracing (for slow-call reports) costs more than the
+    # inserts themselves on a bulk load, so a one-shot loader skips it.
+    conn.set_trace_callback(None)
+    loaded, seconds, completed = ingest(conn, args.kind, args.path, args.chunk_size, not args.no_upsert)
+    db.closeConnection(conn, args.db)
+
+    rate = loaded / seconds if seconds else 0
+    print(f"Loaded {loaded} {args.kind} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+    if not completed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+In-process call metrics for database_functions.
+
+Every decorated function records its call count, total time, a latency
+histogram over BUCKETS (cumulative since startup, as Prometheus expects)
+and a sliding window of recent latencies for the p50/p95/p99 that
+snapshot() returns and /metrics serves as a gauge per quantile.
+Calls slower than SLOW_CALL_SECONDS are logged together with the SQL they
+ran, which is captured through the connection's trace callback. render()
+produces the Prometheus text exposition format served by the /metrics
+route.
+startCollecting() / stopCollecting() add up the calls one thread makes in
+between, e.g. during one HTTP request, for its Server-Timing header.
+"""
+import bisect
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SLOW_CALL_SECONDS = 0.1
+WINDOW_SIZE = 1024          # latencies kept per function for quantiles
+STATEMENTS_KEPT = 10        # trailing SQL statements kept for a slow call
+QUANTILES = (0.5, 0.95, 0.99)
+# Histogram bucket upper bounds in seconds; +Inf is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class CallStats:
+    """Counters, a latency histogram and recent latencies for one function."""
+
+    def __init__(self):
+        self.count = 0
+        self.exceptions = 0
+        self.slow = 0
+        self.seconds = 0.0
+        # Calls per bucket, the last one for those slower than BUCKETS[-1]
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.window = deque(maxlen=WINDOW_SIZE)
+
+    def cumulativeBuckets(self):
+        """[(upper bound, calls at or under it)], ending with ('+Inf', count)."""
+        total = 0
+        result = []
+        for bound, calls in zip(BUCKETS + ("+Inf",), self.buckets):
+            total += calls
+            result.append((bound, total))
+        return result
+
+    def quantiles(self):
+        ordered = sorted(self.window)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+class Timings:
+    """The outermost timed calls made on one thread while collecting."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.functions = {}  # name -> [calls, seconds]
+
+    def add(self, name, seconds, calls=1):
+        self.calls += calls
+        self.seconds += seconds
+        entry = self.functions.setdefault(name, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+    def merge(self, other):
+        """Adds in the calls collected on another thread (e.g. a worker the request waited on)."""
+        for name, (calls, seconds) in other.functions.items():
+            self.add(name, seconds, calls)
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+# The most recent slow calls, newest last.
+slowCalls = deque(maxlen=50)
+
+def traceStatement(statement):
+    """sqlite3 trace callback: remembers SQL run inside a timed call."""
+    statements = getattr(_local, "statements", None)
+    if statements is not None:
+        statements.append(statement)
+
+
+def record(name, seconds, raised=False):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = CallStats()
+        stats.count += 1
+        stats.seconds += seconds
+        stats.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        stats.window.append(seconds)
+        if raised:
+            stats.exceptions += 1
+        if seconds >= SLOW_CALL_SECONDS:
+            stats.slow += 1
+
+def timed(func):
+    """Records the latency of every call to func under its name."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outermost = getattr(_local, "statements", None) is None
+        if outermost:
+            _local.statements = deque(maxlen=STATEMENTS_KEPT)
+        start = time.perf_counter()
+        raised = True
+        try:
+            result = func(*args, **kwargs)
+            raised = False
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            record(func.__name__, seconds, raised)
+            if outermost:
+                statements, _local.statements = _local.statements, None
+                if seconds >= SLOW_CALL_SECONDS:
+                    _slowCall(func.__name__, seconds, statements)
+                # Nested calls are part of the outer one's time already
+                timings = getattr(_local, "timings", None)
+                if timings is not None:
+                    timings.add(func.__name__, seconds)
+    return wrapper
+
+def startCollecting():
+    """Starts adding up this thread's timed calls; returns the Timings they go to."""
+    _local.timings = Timings()
+    return _local.timings
+
+def stopCollecting():
+    """Stops collecting on this thread; returns what was collected, or None."""
+    timings, _local.timings = getattr(_local, "timings", None), None
+    return timings
+
+@contextlib.contextmanager
+def collecting():
+    """startCollecting() for the block, restoring whatever this thread collected before."""
+    outer = getattr(_local, "timings", None)
+    timings = startCollecting()
+    try:
+        yield timings
+    finally:
+        _local.timings = outer
+
+def _slowCall(name, seconds, statements):
+    slowCalls.append({
+        "function": name,
+        "seconds": round(seconds, 6),
+        "at": time.time(),
+        "statements": list(statements),
+    })
+    logger.warning("Slow call %s took %.1f ms: %s", name, seconds * 1000,
+                   " | ".join(" ".join(s.split()) for s in list(statements)[-3:]))
+
+def snapshot():
+    """Returns {function: {count, seconds, exceptions, slow, buckets, p50, p95, p99}}."""
+    with _lock:
+        result = {}
+        for name, stats in _stats.items():
+            entry = {
+                "count": stats.count,
+                "seconds": stats.seconds,
+                "exceptions": stats.exceptions,
+                "slow": stats.slow,
+                "buckets": stats.cumulativeBuckets(),
+            }
+            for q, value in stats.quantiles().items():
+                entry[f"p{int(q * 100)}"] = value
+            result[name] = entry
+        return result
+
+def reset():
+    with _lock:
+        _stats.clear()
+    slowCalls.clear()
+
+def render(gauges=None, counters=None):
+    """
+    Prometheus text format for every recorded function, plus any extra
+    gauges and counters given as {metric name: value}. Counters only ever
+    go up (a restart starts them over); gauges can go either way.
+    """
+    lines = [
+        "# HELP nfl_db_call_duration_seconds Latency of database_functions calls.",
+        "# TYPE nfl_db_call_duration_seconds histogram",
+    ]
+    slow, recent = [], []
+    for name, entry in sorted(snapshot().items()):
+        label = f'function="{name}"'
+        for bound, calls in entry["buckets"]:
+            lines.append(f'nfl_db_call_duration_seconds_bucket{{{label},le="{bound}"}} {calls}')
+        lines.append(f"nfl_db_call_duration_seconds_sum{{{label}}} {entry['seconds']:.9f}")
+        lines.append(f"nfl_db_call_duration_seconds_count{{{label}}} {entry['count']}")
+        slow.append(f"nfl_db_slow_calls_total{{{label}}} {entry['slow']}")
+        for q in QUANTILES:
+            recent.append(f'nfl_db_call_duration_recent_seconds{{{label},quantile="{q}"}} '
+                          f'{entry[f"p{int(q * 100)}"]:.9f}')
+
+    lines.append(f"# HELP nfl_db_slow_calls_total Calls slower than {SLOW_CALL_SECONDS}s.")
+    lines.append("# TYPE nfl_db_slow_calls_total counter")
+    lines.extend(slow)
+
+    lines.append(f"# HELP nfl_db_call_duration_recent_seconds Latency quantiles over the last "
+                 f"{WINDOW_SIZE} calls.")
+    lines.append("# TYPE nfl_db_call_duration_recent_seconds gauge")
+    lines.extend(recent)
+
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        for metric, value in sorted((values or {}).items()):
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
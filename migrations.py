@@ -0,0 +1,938 @@
+"""
+Versioned schema migrations for the NFL stats database.
+
+Each migration is applied exactly once, in order, and the current schema
+version is stored in the database itself (PRAGMA user_version).
+openConnection() runs any pending migrations automatically; the same
+steps can be run by hand:
+
+    python migrations.py [migrate] [db]    # apply pending migrations + ANALYZE
+    python migrations.py analyze [db]      # refresh planner statistics only
+    python migrations.py check-plans [db]  # fail if a query still full-scans
+    python migrations.py rebuild-totals [db]
+    python migrations.py check-totals [db]
+    python migrations.py archive SEASON [db] [--per-season]  # move a closed season out
+    python migrations.py restore SEASON [db]                 # and back in
+    python migrations.py partitions [db]                     # archived seasons, file sizes
+    python migrations.py compact-changes [db]                # keep each row's newest change_log entry
+"""
+import inspect
+import logging
+import re
+import sqlite3
+import sys
+from sqlite3 import Error
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# DERIVED TABLES
+# ==========================================
+
+# Every summable column of player_game_stats.
+STAT_COLUMNS = (
+    "receptions", "interception", "rush_touchdown", "pass_touchdown",
+    "receiving_touchdown", "passing_yards", "rushing_yards",
+    "receiving_yards", "fumble", "fumble_lost", "safety",
+)
+
+_STATS = ", ".join(STAT_COLUMNS)
+
+# player_season_totals: one row per (player, season) holding the season
+# sums of every stat plus games played. Kept current by triggers on
+# player_game_stats so every write path (including raw SQL) maintains it.
+PLAYER_SEASON_TOTALS_SELECT = f"""
+    SELECT player_id, season, MAX(player_name), COUNT(*),
+           {", ".join(f"SUM({c})" for c in STAT_COLUMNS)}
+    FROM player_game_stats
+    GROUP BY player_id, season
+"""
+
+PLAYER_SEASON_TOTALS_REBUILD = [
+    "DELETE FROM player_season_totals;",
+    f"""INSERT INTO player_season_totals (player_id, season, player_name, games_played, {_STATS})
+    {PLAYER_SEASON_TOTALS_SELECT};""",
+]
+
+
+def _addGameRowToTotals(row):
+    """Trigger body that folds one player_game_stats row into the totals."""
+    return f"""
+        INSERT INTO player_season_totals (player_id, season, player_name, games_played, {_STATS})
+        VALUES ({row}.player_id, {row}.season, {row}.player_name, 1,
+                {", ".join(f"COALESCE({row}.{c}, 0)" for c in STAT_COLUMNS)})
+        ON CONFLICT (player_id, season) DO UPDATE SET
+            player_name = excluded.player_name,
+            games_played = games_played + 1,
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in STAT_COLUMNS)};"""
+
+
+def _removeGameRowFromTotals(row):
+    """Trigger body that takes one player_game_stats row out of the totals."""
+    return f"""
+        UPDATE player_season_totals SET
+            games_played = games_played - 1,
+            {", ".join(f"{c} = {c} - COALESCE({row}.{c}, 0)" for c in STAT_COLUMNS)}
+        WHERE player_id = {row}.player_id AND season = {row}.season;
+        DELETE FROM player_season_totals
+        WHERE player_id = {row}.player_id AND season = {row}.season AND games_played <= 0;"""
+
+
+# player_career_totals: for every (player, season) in player_season_totals,
+# the player's running totals through the end of that season. Any season
+# range is then the row at its last season minus the row before its first,
+# two primary-key lookups whatever the span. Kept current by triggers on
+# player_season_totals, so it follows every path that one does.
+_CAREER = ("games_played",) + STAT_COLUMNS
+
+PLAYER_CAREER_TOTALS_SELECT = f"""
+    SELECT player_id, season,
+           {", ".join(f"SUM({c}) OVER career" for c in _CAREER)}
+    FROM player_season_totals
+    WINDOW career AS (PARTITION BY player_id ORDER BY season)
+"""
+
+PLAYER_CAREER_TOTALS_REBUILD = [
+    "DELETE FROM player_career_totals;",
+    f"""INSERT INTO player_career_totals (player_id, season, {", ".join(_CAREER)})
+    {PLAYER_CAREER_TOTALS_SELECT};""",
+]
+
+
+def _addSeasonToCareer(row):
+    """Trigger body that adds one player_season_totals row to the running totals."""
+    return f"""
+        INSERT INTO player_career_totals (player_id, season, {", ".join(_CAREER)})
+        SELECT {row}.player_id, {row}.season, {", ".join(f"COALESCE(prev.{c}, 0)" for c in _CAREER)}
+        FROM (SELECT 1) LEFT JOIN player_career_totals prev
+            ON prev.player_id = {row}.player_id
+            AND prev.season = (SELECT MAX(season) FROM player_career_totals
+                               WHERE player_id = {row}.player_id AND season < {row}.season);
+        UPDATE player_career_totals SET
+            {", ".join(f"{c} = {c} + {row}.{c}" for c in _CAREER)}
+        WHERE player_id = {row}.player_id AND season >= {row}.season;"""
+
+
+def _removeSeasonFromCareer(row):
+    """Trigger body that takes one player_season_totals row out of the running totals."""
+    return f"""
+        UPDATE player_career_totals SET
+            {", ".join(f"{c} = {c} - {row}.{c}" for c in _CAREER)}
+        WHERE player_id = {row}.player_id AND season > {row}.season;
+        DELETE FROM player_career_totals
+        WHERE player_id = {row}.player_id AND season = {row}.season;"""
+
+
+# team_season_records: one row per (team, season, season_type) with the
+# win/loss record and its home/away split. Kept current by triggers on
+# games. A tie (home_win = 0) counts as a home loss, as everywhere else.
+TEAM_RECORD_COLUMNS = (
+    "games_played", "wins", "losses", "home_wins", "home_losses",
+    "away_wins", "away_losses", "super_bowl_wins",
+)
+
+_RECORDS = ", ".join(TEAM_RECORD_COLUMNS)
+
+TEAM_SEASON_RECORDS_SELECT = """
+    WITH sides AS (
+        SELECT home_team AS team, season, season_type, week, 1 AS is_home,
+               COALESCE(home_win = 1, 0) AS won, COALESCE(home_win = 0, 0) AS lost
+        FROM games
+        UNION ALL
+        SELECT away_team, season, season_type, week, 0,
+               COALESCE(home_win = 0, 0), COALESCE(home_win = 1, 0)
+        FROM games
+    )
+    SELECT team, season, season_type, COUNT(*), SUM(won), SUM(lost),
+           SUM(is_home * won), SUM(is_home * lost),
+           SUM((1 - is_home) * won), SUM((1 - is_home) * lost),
+           SUM(week = 22 AND won)
+    FROM sides
+    GROUP BY team, season, season_type
+"""
+
+# made_playoffs is set on all of a team's rows for a season once it has
+# any POST games that season.
+_REFRESH_PLAYOFF_FLAG = """
+        UPDATE team_season_records SET made_playoffs = EXISTS (
+            SELECT 1 FROM team_season_records p
+            WHERE p.team = team_season_records.team
+              AND p.season = team_season_records.season
+              AND p.season_type = 'POST')"""
+
+TEAM_SEASON_RECORDS_REBUILD = [
+    "DELETE FROM team_season_records;",
+    f"""INSERT INTO team_season_records (team, season, season_type, {_RECORDS})
+    {TEAM_SEASON_RECORDS_SELECT};""",
+    _REFRESH_PLAYOFF_FLAG + ";",
+]
+
+
+def _recordValues(row, team):
+    """
+    SQL expressions for one side ("home_team" or "away_team") of a games
+    row, in TEAM_RECORD_COLUMNS order.
+    """
+    home_won = f"COALESCE({row}.home_win = 1, 0)"
+    home_lost = f"COALESCE({row}.home_win = 0, 0)"
+    if team == "home_team":
+        won, lost, split = home_won, home_lost, [home_won, home_lost, "0", "0"]
+    else:
+        won, lost, split = home_lost, home_won, ["0", "0", home_lost, home_won]
+    return ["1", won, lost, *split, f"({row}.week = 22 AND {won})"]
+
+
+def _addGameToRecords(row):
+    """Trigger body that folds one games row into team_season_records."""
+    body = ""
+    for team in ("home_team", "away_team"):
+        body += f"""
+        INSERT INTO team_season_records (team, season, season_type, {_RECORDS})
+        VALUES ({row}.{team}, {row}.season, {row}.season_type, {", ".join(_recordValues(row, team))})
+        ON CONFLICT (team, season, season_type) DO UPDATE SET
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in TEAM_RECORD_COLUMNS)};"""
+    return body + _refreshPlayoffFlag(row)
+
+
+def _removeGameFromRecords(row):
+    """Trigger body that takes one games row out of team_season_records."""
+    body = ""
+    for team in ("home_team", "away_team"):
+        values = _recordValues(row, team)
+        body += f"""
+        UPDATE team_season_records SET
+            {", ".join(f"{c} = {c} - {v}" for c, v in zip(TEAM_RECORD_COLUMNS, values))}
+        WHERE team = {row}.{team} AND season = {row}.season AND season_type = {row}.season_type;"""
+    body += f"""
+        DELETE FROM team_season_records
+        WHERE team IN ({row}.home_team, {row}.away_team) AND season = {row}.season
+          AND season_type = {row}.season_type AND games_played <= 0;"""
+    return body + _refreshPlayoffFlag(row)
+
+
+def _refreshPlayoffFlag(row):
+    return f"""{_REFRESH_PLAYOFF_FLAG}
+        WHERE season = {row}.season AND team IN ({row}.home_team, {row}.away_team);"""
+
+
+# game_participants: two rows per game, one from each team's side, so a
+# team's games (and their opponent and result) are reachable with an
+# equality join on (season, week, team) instead of an OR over
+# home_team / away_team. Kept current by triggers on games.
+GAME_PARTICIPANT_COLUMNS = ("game_id", "team", "season", "week", "season_type",
+                            "opponent", "is_home", "won")
+
+def _participantValues(row, team):
+    """SQL expressions for one side of a games row, in column order."""
+    opponent = "away_team" if team == "home_team" else "home_team"
+    is_home = "1" if team == "home_team" else "0"
+    won = f"{row}.home_win" if team == "home_team" else f"1 - {row}.home_win"
+    return [f"{row}.game_id", f"{row}.{team}", f"{row}.season", f"{row}.week",
+            f"{row}.season_type", f"{row}.{opponent}", is_home, won]
+
+
+GAME_PARTICIPANTS_SELECT = f"""
+    SELECT {", ".join(_participantValues("g", "home_team"))} FROM games g
+    UNION ALL
+    SELECT {", ".join(_participantValues("g", "away_team"))} FROM games g
+"""
+
+GAME_PARTICIPANTS_REBUILD = [
+    "DELETE FROM game_participants;",
+    f"""INSERT INTO game_participants ({", ".join(GAME_PARTICIPANT_COLUMNS)})
+    {GAME_PARTICIPANTS_SELECT};""",
+]
+
+
+def _addGameToParticipants(row):
+    """Trigger body that adds both sides of one games row."""
+    return "".join(f"""
+        INSERT INTO game_participants ({", ".join(GAME_PARTICIPANT_COLUMNS)})
+        VALUES ({", ".join(_participantValues(row, team))});""" for team in ("home_team", "away_team"))
+
+
+def _removeGameFromParticipants(row):
+    return f"""
+        DELETE FROM game_participants WHERE game_id = {row}.game_id;"""
+
+
+# player_versions: a counter per player, bumped by triggers whenever that
+# player's bio, team history or game stats change. The '*' row counts
+# changes to the tables every profile reads through matchups (games,
+# teams, coaches, coach_history). A cached profile snapshot is current
+# while the sum of its player's and the '*' counters is unchanged.
+PLAYER_VERSION_TABLES = ("players", "player_history", "player_game_stats")
+SHARED_VERSION_TABLES = ("games", "teams", "coaches", "coach_history")
+
+
+def _bumpPlayerVersion(player_id):
+    return f"""
+        INSERT INTO player_versions (player_id, version) VALUES ({player_id}, 1)
+        ON CONFLICT (player_id) DO UPDATE SET version = version + 1;"""
+
+
+def _playerVersionTriggers():
+    triggers = []
+    for table in PLAYER_VERSION_TABLES + SHARED_VERSION_TABLES:
+        shared = table in SHARED_VERSION_TABLES
+        for event, rows in (("insert", ["new"]), ("delete", ["old"]), ("update", ["old", "new"])):
+            if shared:
+                body = _bumpPlayerVersion("'*'")
+            else:
+                body = "".join(_bumpPlayerVersion(f"{row}.player_id") for row in rows)
+            triggers.append(f"""CREATE TRIGGER trg_{table}_version_{event} AFTER {event.upper()} ON {table}
+        BEGIN {body}
+        END;""")
+    return triggers
+
+
+# data_generation: a single row counting every write to the base tables,
+# with the time of the last one. `epoch` is random per database file, so
+# a rebuilt database never repeats an earlier (epoch, generation) pair.
+# The HTTP layer turns it into ETag / Last-Modified validators.
+BASE_TABLES = ("players", "player_history", "player_game_stats", "games",
+               "teams", "coaches", "coach_history")
+
+BUMP_DATA_GENERATION = """
+        UPDATE data_generation
+        SET generation = generation + 1, modified_at = CAST(strftime('%s', 'now') AS INTEGER);"""
+
+
+def _dataGenerationTriggers():
+    return [f"""CREATE TRIGGER trg_{table}_generation_{event} AFTER {event.upper()} ON {table}
+        BEGIN {BUMP_DATA_GENERATION}
+        END;""" for table in BASE_TABLES for event in ("insert", "delete", "update")]
+
+
+# player_search / player_trigrams: full-text indexes over player names,
+# keyed on players.rowid. player_search (word tokens, case and accent
+# folded) serves prefix search; player_trigrams serves the fuzzy fallback
+# for misspellings. alt_name is the name with its punctuation dropped, so
+# "TJ Hockenson", "Jamarr Chase" and "SmithSchuster" also match.
+def _altName(name):
+    return f"replace(replace(replace(replace({name}, '.', ''), '''', ''), '’', ''), '-', '')"
+
+
+def _addPlayerToSearch(row):
+    """Trigger body that indexes one players row."""
+    return f"""
+        INSERT INTO player_search (rowid, player_name, alt_name)
+        VALUES ({row}.rowid, {row}.player_name, {_altName(f"{row}.player_name")});
+        INSERT INTO player_trigrams (rowid, player_name)
+        VALUES ({row}.rowid, {row}.player_name);"""
+
+
+def _removePlayerFromSearch(row):
+    """Trigger body that drops one players row from the name indexes."""
+    return f"""
+        DELETE FROM player_search WHERE rowid = {row}.rowid;
+        DELETE FROM player_trigrams WHERE rowid = {row}.rowid;"""
+
+
+PLAYER_SEARCH_REBUILD = [
+    "DELETE FROM player_search;",
+    "DELETE FROM player_trigrams;",
+    f"""INSERT INTO player_search (rowid, player_name, alt_name)
+    SELECT rowid, player_name, {_altName("player_name")} FROM players;""",
+    "INSERT INTO player_trigrams (rowid, player_name) SELECT rowid, player_name FROM players;",
+]
+
+
+# change_log: one row per row written to a tracked table, so consumers of
+# derived data (caches, exports, search indexes) can follow what changed
+# since the last sequence number they saw instead of recomputing
+# everything. row_key is a JSON array of the CHANGE_LOG_KEYS columns; an
+# update that moves a row to another key or season is logged as a delete
+# of the old one and an insert of the new one. seq is AUTOINCREMENT, so it
+# never goes backwards even after compaction deletes the newest entries.
+CHANGE_LOG_KEYS = {
+    "players": ("player_id",),
+    "player_history": ("player_id", "season", "week"),
+    "player_game_stats": ("season", "week", "player_id"),
+    "games": ("game_id",),
+    "coaches": ("coach_id",),
+    "coach_history": ("season", "coach_id"),
+}
+
+# Tables whose rows belong to one season; change_log.season is NULL for
+# the others, whose rows can show up in any season.
+CHANGE_LOG_SEASONS = {"player_history", "player_game_stats", "games", "coach_history"}
+
+
+def _changeLogKey(table, row):
+    return f"json_array({', '.join(f'{row}.{column}' for column in CHANGE_LOG_KEYS[table])})"
+
+
+def _changeLogMoved(table):
+    """SQL condition: the update gave the row another key (or season)."""
+    columns = CHANGE_LOG_KEYS[table] + (("season",) if table in CHANGE_LOG_SEASONS else ())
+    return " OR ".join(f"old.{column} IS NOT new.{column}" for column in dict.fromkeys(columns))
+
+
+def _logChange(table, row, op, when=None):
+    """Trigger body that appends one change_log entry for `row`."""
+    season = f"{row}.season" if table in CHANGE_LOG_SEASONS else "NULL"
+    values = f"'{table}', {_changeLogKey(table, row)}, {op}, {season}"
+    if when:
+        return f"""
+        INSERT INTO change_log (table_name, row_key, op, season) SELECT {values} WHERE {when};"""
+    return f"""
+        INSERT INTO change_log (table_name, row_key, op, season) VALUES ({values});"""
+
+
+def _changeLogTriggers():
+    triggers = []
+    for table in CHANGE_LOG_KEYS:
+        moved = _changeLogMoved(table)
+        bodies = {
+            "insert": _logChange(table, "new", "'I'"),
+            "delete": _logChange(table, "old", "'D'"),
+            "update": _logChange(table, "old", "'D'", when=moved)
+                      + _logChange(table, "new", f"CASE WHEN {moved} THEN 'I' ELSE 'U' END"),
+        }
+        for event, body in bodies.items():
+            triggers.append(f"""CREATE TRIGGER trg_{table}_change_{event} AFTER {event.upper()} ON {table}
+        BEGIN {body}
+        END;""")
+    return triggers
+
+
+# Log compaction: only the newest entry per row is kept. A consumer at
+# any sequence number still ends up with every row it has to refresh,
+# just once, at that row's latest change.
+COMPACT_CHANGE_LOG = """
+    DELETE FROM change_log
+    WHERE seq < (SELECT MAX(later.seq) FROM change_log AS later
+                 WHERE later.table_name = change_log.table_name
+                   AND later.row_key = change_log.row_key);"""
+
+
+# ==========================================
+# SEASON PARTITIONS
+# ==========================================
+# Closed seasons of the large per-game tables can be moved out of the main
+# file into archive files (see database_functions.archiveSeason), which
+# every connection ATTACHes. archived_seasons records which season lives in
+# which file. The derived tables keep the archived seasons' rows, so
+# leaderboards and standings never touch an archive; queries that read the
+# per-game rows go through the temporary <table>_all views, which UNION
+# ALL the main table with each archive.
+PARTITIONED_TABLES = ("games", "player_game_stats", "player_history")
+SEASON_DERIVED_TABLES = ("player_season_totals", "team_season_records", "game_participants")
+
+
+def _archivedSeasonGuards():
+    """Archived seasons are read-only: writes to them must restore them first."""
+    return [f"""CREATE TRIGGER trg_{table}_archived_{event} BEFORE {event.upper()} ON {table}
+        WHEN NEW.season IN (SELECT season FROM archived_seasons)
+        BEGIN SELECT RAISE(ABORT, 'season is archived'); END;"""
+            for table in PARTITIONED_TABLES for event in ("insert", "update")]
+
+
+def partitionViewSql(table, columns, archives):
+    """
+    CREATE TEMP VIEW for <table>_all. `archives` is [(schema, seasons)];
+    each archive only contributes the seasons registered to it, so rows a
+    half-finished archive or restore left behind stay invisible.
+    """
+    select = ", ".join(columns) if columns else "*"
+    parts = [f"SELECT {select} FROM main.{table}"]
+    for schema, seasons in archives:
+        parts.append(f"SELECT {select} FROM {schema}.{table} "
+                     f"WHERE season IN ({', '.join(str(int(s)) for s in seasons)})")
+    return f"CREATE TEMP VIEW {table}_all AS {' UNION ALL '.join(parts)};"
+
+
+# ==========================================
+# MIGRATIONS
+# ==========================================
+# (version, description, [statements]) -- append only, never edit a
+# migration that has already shipped.
+
+MIGRATIONS = [
+    (1, "secondary indexes for the hot query paths", [
+        # Per-player lookups: career totals, matchup history, deletePlayer.
+        # Carries the game keys so the join to games needs no table lookup.
+        """CREATE INDEX IF NOT EXISTS idx_pgs_player
+           ON player_game_stats (player_id, season, week, team);""",
+        # Season leaderboards group one season's rows by player.
+        """CREATE INDEX IF NOT EXISTS idx_pgs_season_player
+           ON player_game_stats (season, player_id);""",
+        # deletePlayerGameStats() deletes by name rather than by id.
+        """CREATE INDEX IF NOT EXISTS idx_pgs_player_name
+           ON player_game_stats (player_name, season, week);""",
+        # One index per side of the home_team/away_team OR filters so the
+        # planner can answer them with a MULTI-INDEX OR instead of a scan.
+        """CREATE INDEX IF NOT EXISTS idx_games_home
+           ON games (home_team, season, season_type, week);""",
+        """CREATE INDEX IF NOT EXISTS idx_games_away
+           ON games (away_team, season, season_type, week);""",
+        # Joins from player_game_stats to games on (season, week).
+        """CREATE INDEX IF NOT EXISTS idx_games_season_week
+           ON games (season, week);""",
+        """CREATE INDEX IF NOT EXISTS idx_players_name
+           ON players (player_name);""",
+        """CREATE INDEX IF NOT EXISTS idx_coach_history_team_season
+           ON coach_history (team, season);""",
+        """CREATE INDEX IF NOT EXISTS idx_coach_history_coach
+           ON coach_history (coach_id);""",
+    ]),
+    (2, "player_season_totals aggregate for leaderboards", [
+        f"""CREATE TABLE player_season_totals (
+            player_id    TEXT NOT NULL,
+            season       INTEGER NOT NULL,
+            player_name  TEXT,
+            games_played INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"{c} REAL NOT NULL DEFAULT 0.0" for c in STAT_COLUMNS)},
+            PRIMARY KEY (player_id, season)
+        );""",
+        # Indexed top-N: walk one season's index range in stat order.
+        "CREATE INDEX idx_pst_season_passing ON player_season_totals (season, passing_yards);",
+        "CREATE INDEX idx_pst_season_rushing ON player_season_totals (season, rushing_yards);",
+        "CREATE INDEX idx_pst_season_receiving ON player_season_totals (season, receiving_yards);",
+        f"""CREATE TRIGGER trg_pgs_totals_insert AFTER INSERT ON player_game_stats
+        BEGIN {_addGameRowToTotals("new")}
+        END;""",
+        f"""CREATE TRIGGER trg_pgs_totals_delete AFTER DELETE ON player_game_stats
+        BEGIN {_removeGameRowFromTotals("old")}
+        END;""",
+        f"""CREATE TRIGGER trg_pgs_totals_update AFTER UPDATE ON player_game_stats
+        BEGIN {_removeGameRowFromTotals("old")} {_addGameRowToTotals("new")}
+        END;""",
+        *PLAYER_SEASON_TOTALS_REBUILD,
+    ]),
+    (3, "team_season_records standings table", [
+        f"""CREATE TABLE team_season_records (
+            team          TEXT NOT NULL,
+            season        INTEGER NOT NULL,
+            season_type   TEXT NOT NULL,
+            {", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in TEAM_RECORD_COLUMNS)},
+            made_playoffs INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (team, season, season_type)
+        );""",
+        "CREATE INDEX idx_tsr_season ON team_season_records (season, team);",
+        f"""CREATE TRIGGER trg_games_records_insert AFTER INSERT ON games
+        BEGIN {_addGameToRecords("new")}
+        END;""",
+        f"""CREATE TRIGGER trg_games_records_delete AFTER DELETE ON games
+        BEGIN {_removeGameFromRecords("old")}
+        END;""",
+        f"""CREATE TRIGGER trg_games_records_update AFTER UPDATE ON games
+        BEGIN {_removeGameFromRecords("old")} {_addGameToRecords("new")}
+        END;""",
+        *TEAM_SEASON_RECORDS_REBUILD,
+    ]),
+    (4, "player_search full-text name indexes", [
+        """CREATE VIRTUAL TABLE player_search USING fts5(
+            player_name, alt_name,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );""",
+        """CREATE VIRTUAL TABLE player_trigrams USING fts5(
+            player_name,
+            tokenize = 'trigram'
+        );""",
+        f"""CREATE TRIGGER trg_players_search_insert AFTER INSERT ON players
+        BEGIN {_addPlayerToSearch("new")}
+        END;""",
+        f"""CREATE TRIGGER trg_players_search_delete AFTER DELETE ON players
+        BEGIN {_removePlayerFromSearch("old")}
+        END;""",
+        f"""CREATE TRIGGER trg_players_search_update AFTER UPDATE OF player_name ON players
+        BEGIN {_removePlayerFromSearch("old")} {_addPlayerToSearch("new")}
+        END;""",
+        *PLAYER_SEARCH_REBUILD,
+    ]),
+    (5, "game_participants table for equality joins on games", [
+        """CREATE TABLE game_participants (
+            game_id     TEXT NOT NULL,
+            team        TEXT NOT NULL,
+            season      INTEGER NOT NULL,
+            week        INTEGER NOT NULL,
+            season_type TEXT NOT NULL,
+            opponent    TEXT NOT NULL,
+            is_home     INTEGER NOT NULL,
+            won         INTEGER,               -- NULL while home_win is unknown
+            PRIMARY KEY (game_id, team)
+        );""",
+        # Joined from player_game_stats rows; carries the columns the
+        # matchup queries read so the join never touches the table.
+        """CREATE INDEX idx_gp_season_week_team
+            ON game_participants (season, week, team, opponent, won);""",
+        f"""CREATE TRIGGER trg_games_participants_insert AFTER INSERT ON games
+        BEGIN {_addGameToParticipants("new")}
+        END;""",
+        f"""CREATE TRIGGER trg_games_participants_delete AFTER DELETE ON games
+        BEGIN {_removeGameFromParticipants("old")}
+        END;""",
+        f"""CREATE TRIGGER trg_games_participants_update AFTER UPDATE ON games
+        BEGIN {_removeGameFromParticipants("old")} {_addGameToParticipants("new")}
+        END;""",
+        *GAME_PARTICIPANTS_REBUILD,
+    ]),
+    (6, "player_versions counters for profile snapshots", [
+        """CREATE TABLE player_versions (
+            player_id TEXT PRIMARY KEY NOT NULL,   -- or '*' for shared tables
+            version   INTEGER NOT NULL
+        );""",
+        *_playerVersionTriggers(),
+    ]),
+    (7, "data_generation write counter for HTTP validators", [
+        """CREATE TABLE data_generation (
+            id          INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch       TEXT NOT NULL,
+            generation  INTEGER NOT NULL,
+            modified_at INTEGER NOT NULL         -- unix seconds of the last write
+        );""",
+        """INSERT INTO data_generation (id, epoch, generation, modified_at)
+        VALUES (1, lower(hex(randomblob(4))), 0, CAST(strftime('%s', 'now') AS INTEGER));""",
+        *_dataGenerationTriggers(),
+    ]),
+    (8, "archived_seasons registry for season partitions", [
+        """CREATE TABLE archived_seasons (
+            season      INTEGER PRIMARY KEY NOT NULL,
+            file        TEXT NOT NULL,              -- relative to the main database file
+            archived_at INTEGER NOT NULL            -- unix seconds
+        );""",
+        *_archivedSeasonGuards(),
+    ]),
+    (9, "player_career_totals running totals for season ranges", [
+        f"""CREATE TABLE player_career_totals (
+            player_id    TEXT NOT NULL,
+            season       INTEGER NOT NULL,
+            games_played INTEGER NOT NULL DEFAULT 0,
+            {", ".join(f"{c} REAL NOT NULL DEFAULT 0.0" for c in STAT_COLUMNS)},
+            PRIMARY KEY (player_id, season)
+        ) WITHOUT ROWID;""",
+        f"""CREATE TRIGGER trg_pst_career_insert AFTER INSERT ON player_season_totals
+        BEGIN {_addSeasonToCareer("new")}
+        END;""",
+        f"""CREATE TRIGGER trg_pst_career_delete AFTER DELETE ON player_season_totals
+        BEGIN {_removeSeasonFromCareer("old")}
+        END;""",
+        f"""CREATE TRIGGER trg_pst_career_update AFTER UPDATE ON player_season_totals
+        BEGIN {_removeSeasonFromCareer("old")} {_addSeasonToCareer("new")}
+        END;""",
+        *PLAYER_CAREER_TOTALS_REBUILD,
+    ]),
+    (10, "change_log feed for incremental consumers", [
+        """CREATE TABLE change_log (
+            seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key    TEXT NOT NULL,           -- JSON array of the CHANGE_LOG_KEYS columns
+            op         TEXT NOT NULL,           -- 'I', 'U' or 'D'
+            season     INTEGER                  -- NULL for tables not split by season
+        );""",
+        "CREATE INDEX idx_change_log_row ON change_log (table_name, row_key, seq);",
+        *_changeLogTriggers(),
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def getSchemaVersion(_conn):
+    return _conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def analyze(_conn):
+    """Refreshes the planner statistics (sqlite_stat1) for every table."""
+    try:
+        _conn.execute("ANALYZE;")
+        _conn.commit()
+        return True
+    except Error as e:
+        logger.error("Error in analyze: %s", e)
+        return False
+
+
+def migrate(_conn):
+    """
+    Applies every migration newer than the database's user_version, each
+    in its own transaction, then runs ANALYZE if anything changed.
+    Returns the number of migrations applied.
+    """
+    current = getSchemaVersion(_conn)
+    applied = 0
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            _conn.execute("BEGIN;")
+            for statement in statements:
+                _conn.execute(statement)
+            _conn.execute(f"PRAGMA user_version = {version};")
+            _conn.commit()
+        except Error as e:
+            _conn.rollback()
+            logger.error("Error in migration %s (%s): %s", version, description, e)
+            break
+        logger.info("Applied migration %s: %s", version, description)
+        applied += 1
+
+    if applied:
+        analyze(_conn)
+    return applied
+
+
+# ==========================================
+# QUERY PLAN CHECK
+# ==========================================
+
+# Tables big enough that a full SCAN on a request path is a bug.
+LARGE_TABLES = {"player_game_stats", "games", "player_history"}
+
+# All-time aggregates that have to read every row by definition. Empty
+# while every aggregate is served from a derived table.
+FULL_AGGREGATES = set()
+
+# Functions in database_functions that are not query paths.
+NOT_PROBED = {
+    "openConnection", "closeConnection", "addDummyPlayer", "main", "ConnectionPool",
+    "ResultCache", "cachedQuery", "invalidatesCache", "metrics",
+    "addWriteListener", "removeWriteListener", "Checkpointer", "writerStats",
+    "Connection", "transaction", "TransactionError", "readOnly", "archiveSeason", "restoreSeason",
+    "rebuildPlayerSeasonTotals", "checkPlayerSeasonTotals",
+    "rebuildPlayerCareerTotals", "checkPlayerCareerTotals",
+    "rebuildTeamSeasonRecords", "checkTeamSeasonRecords",
+    "rebuildGameParticipants", "checkGameParticipants", "compactChangeLog",
+}
+
+
+def probeCalls(_conn):
+    """
+    Representative (function name, args) for every database function, reads
+    first. Shared by checkQueryPlans and benchmark.py.
+    """
+    player = _conn.execute("""
+        SELECT s.player_id, s.player_name, s.season, s.week, s.team
+        FROM player_game_stats s
+        JOIN players p ON s.player_id = p.player_id
+        WHERE p.position = 'QB'
+        ORDER BY s.season DESC, s.week DESC
+        LIMIT 1;
+    """).fetchone()
+    pid, name, season, week, team = player
+    opponent = "BUF" if team == "KC" else "KC"
+    game_id = _conn.execute("SELECT game_id FROM games LIMIT 1;").fetchone()[0]
+    coach_id = _conn.execute("SELECT coach_id FROM coach_history LIMIT 1;").fetchone()[0]
+
+    # Reads first, then writes (which destroy the sample data).
+    return [
+        ("getPlayerIdByName", (name,)),
+        ("getPlayerNameById", (pid,)),
+        ("searchPlayers", (name[:4],)),
+        ("searchPlayers", (name[:2] + "x" + name[3:],)),
+        ("getTop5QBsByPassingYards", (season,)),
+        ("getTop5RBsByRushingYards", (season,)),
+        ("getTop5WRsByReceivingYards", (season,)),
+        ("getTopPlayersAllTimeByTouchdowns", ()),
+        ("getLeaders", ("scrimmage_yards", None, season - 2, season, "RB")),
+        ("getLeaders", ("passing_yards", None, season - 2, season, "QB", "NFC", "West")),
+        ("getQBsLowestInterceptionAvgMinTD", ()),
+        ("getPlayersLowestInterceptionsAvg", ()),
+        ("playerQBCareerStats", (pid,)),
+        ("getPlayerRangeTotals", (pid, season - 2, season)),
+        ("getTeamSchedule", (team, season)),
+        ("getTeamSchedule", (team, season, 5, 4)),
+        ("getSeasons", ()),
+        ("iterPlayerGameLog", (pid,)),
+        ("iterSeasonGameStats", (season,)),
+        ("get_team_record", (team, season)),
+        ("get_conference_passing_leaders", (season, "NFC", "West")),
+        ("get_qb_stats_vs_opponent", (pid, opponent)),
+        ("get_player_matchup_history", (pid,)),
+        ("get_player_matchup_history", (pid, (season, week), 20)),
+        ("getDivisionWinners", (season,)),
+        ("best_coach", ()),
+        ("getPlayerCareerDetails", (pid, True, True, True, True)),
+        ("getPlayerProfile", (pid,)),
+        ("getDataVersion", ()),
+        ("getArchivedSeasons", ()),
+        ("getChangesSince", (0,)),
+        ("getChangeSeq", ()),
+        ("addGame", ("PLAN_CHECK", season, 1, "REG", opponent, team, 1)),
+        ("deleteGame", (game_id,)),
+        ("addPlayer", ("PLAN_CHECK", "Plan Check", team, 2000, 2022, 1, 72, 200, "QB", season)),
+        ("addPlayerGameStats", (season, "PLAN_CHECK", "Plan Check", 99, team)),
+        ("addPlayerGameStatsBulk", ([{"season": season, "player_id": pid, "player_name": name,
+                                      "week": week, "team": "KC", "passing_yards": 1.0}],)),
+        ("addGamesBulk", ([{"season": season, "week": 98, "season_type": "REG",
+                            "away_team": opponent, "home_team": team, "home_win": 1}],)),
+        ("updatePlayerTeam", (pid, "KC", season + 1)),
+        ("updatePlayerPosition", (pid, "QB")),
+        ("updatePlayerWeight", (pid, 220)),
+        ("updatePlayerName", (pid, name)),
+        ("addCoach", ("Plan Check", 99999, team, season)),
+        ("deleteCoach", (coach_id,)),
+        ("updateTeamCity", (team, "Plan Check")),
+        ("updateTeamName", (team, "Plan Check")),
+        ("deletePlayerGameStats", (name, week, season)),
+        ("deletePlayer", (pid,)),
+    ]
+
+
+def _tableAliases(statement):
+    """Maps every alias (and bare table name) in a statement to its table."""
+    aliases = {}
+    pattern = r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?"
+    for table, alias in re.findall(pattern, statement, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in ("ON", "WHERE", "SET", "GROUP", "ORDER", "LIMIT", "VALUES", "JOIN", "LEFT"):
+            aliases[alias] = table
+    return aliases
+
+
+def checkQueryPlans(_dbFile):
+    """
+    Runs every function in database_functions against an in-memory copy of
+    _dbFile, captures the SQL it issues and returns a list of
+    (function, table, plan detail) for each full SCAN of a LARGE_TABLES
+    table. An empty list means every query path is indexed.
+    """
+    import database_functions as db
+
+    source = sqlite3.connect(_dbFile)
+    # Set up like an app connection (row factory, SQL functions)
+    conn = db._connect(":memory:")
+    source.backup(conn)
+    source.close()
+    migrate(conn)
+
+    # Every call has to reach SQLite for its statements to be traced.
+    cache_enabled = db.resultCache.enabled
+    db.resultCache.enabled = False
+    # The probe writes would otherwise log a success line each
+    db_logger = logging.getLogger(db.__name__)
+    log_level = db_logger.level
+    db_logger.setLevel(logging.WARNING)
+
+    failures = []
+    probes = probeCalls(conn)
+
+    probed = {name for name, _ in probes}
+    for name in dir(db):
+        func = getattr(db, name)
+        if (callable(func) and getattr(func, "__module__", None) == db.__name__
+                and not name.startswith("_") and name not in probed | NOT_PROBED):
+            logger.warning("%s has no query plan probe", name)
+
+    for name, args in probes:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        result = getattr(db, name)(conn, *args)
+        if inspect.isgenerator(result):
+            for _ in result:
+                pass
+        conn.set_trace_callback(None)
+
+        for statement in statements:
+            if not re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", statement, re.IGNORECASE):
+                continue
+            aliases = _tableAliases(statement)
+            for row in conn.execute("EXPLAIN QUERY PLAN " + statement):
+                detail = row[3]
+                # Through a <table>_all view the plan names the table itself,
+                # qualified with its schema (main / archive_N)
+                match = re.match(r"SCAN (?:(\w+)\.)?(\w+)", detail)
+                if not match:
+                    continue
+                table = match.group(2) if match.group(1) else aliases.get(match.group(2))
+                if table in LARGE_TABLES and name not in FULL_AGGREGATES:
+                    failures.append((name, table, detail))
+
+    conn.close()
+    db.resultCache.enabled = cache_enabled
+    db_logger.setLevel(log_level)
+    return failures
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    database = sys.argv[2] if len(sys.argv) > 2 else r"nfl_stats.sqlite"
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+
+    if command == "check-plans":
+        failures = checkQueryPlans(database)
+        for name, table, detail in failures:
+            print(f"FULL SCAN in {name}: {table} ({detail})")
+        if failures:
+            sys.exit(1)
+        print("All query paths use indexes.")
+        return
+
+    if command in ("archive", "restore", "partitions"):
+        import os
+        import database_functions as db
+        args = [a for a in sys.argv[2:] if not a.startswith("--")]
+        if command != "partitions":
+            season = int(args.pop(0))
+        database = args[0] if args else r"nfl_stats.sqlite"
+        conn = db.openConnection(database)
+        if command == "archive":
+            ok = db.archiveSeason(conn, season, per_season="--per-season" in sys.argv)
+            if ok:
+                # Hand the freed pages back so the main file actually shrinks
+                conn.execute("VACUUM;")
+        elif command == "restore":
+            ok = db.restoreSeason(conn, season)
+        else:
+            ok = True
+        files = {os.path.basename(database): None}
+        for row in db.getArchivedSeasons(conn):
+            files.setdefault(row["file"], []).append(row["season"])
+        db.closeConnection(conn, database)
+        for name, seasons in files.items():
+            path = os.path.join(os.path.dirname(database), name)
+            size = os.path.getsize(path) / 1e6 if os.path.exists(path) else 0
+            label = "main" if seasons is None else "seasons " + ", ".join(map(str, seasons))
+            print(f"{name:32} {size:8.2f} MB  {label}")
+        if not ok:
+            sys.exit(1)
+        return
+
+    if command == "compact-changes":
+        import database_functions as db
+        conn = db.openConnection(database)
+        before = db.getChangeSeq(conn)
+        removed = db.compactChangeLog(conn)
+        kept = conn.execute("SELECT COUNT(*) FROM change_log;").fetchone()[0]
+        db.closeConnection(conn, database)
+        if removed is None:
+            sys.exit(1)
+        print(f"change_log: {removed} entries removed, {kept} kept, sequence at {before}")
+        return
+
+    if command in ("rebuild-totals", "check-totals"):
+        import database_functions as db
+        conn = db.openConnection(database)
+        if command == "rebuild-totals":
+            db.rebuildPlayerSeasonTotals(conn)
+            db.rebuildPlayerCareerTotals(conn)
+            db.rebuildTeamSeasonRecords(conn)
+            db.rebuildGameParticipants(conn)
+            db.closeConnection(conn, database)
+            return
+        stale = [("player_season_totals", key) for key in db.checkPlayerSeasonTotals(conn)]
+        stale += [("player_career_totals", key) for key in db.checkPlayerCareerTotals(conn)]
+        stale += [("team_season_records", key) for key in db.checkTeamSeasonRecords(conn)]
+        stale += [("game_participants", key) for key in db.checkGameParticipants(conn)]
+        db.closeConnection(conn, database)
+        for table, key in stale:
+            print(f"{table} out of date: {' '.join(map(str, key))}")
+        if stale:
+            sys.exit(1)
+        print("Derived tables are consistent.")
+        return
+
+    conn = sqlite3.connect(database)
+    if command == "analyze":
+        analyze(conn)
+    else:
+        applied = migrate(conn)
+        print(f"Schema at version {getSchemaVersion(conn)} ({applied} applied)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Per-worker in-memory replica of the database, for reads.
+
+The whole dataset is a few MB, so every worker process can hold its own
+copy: Replica copies nfl_stats.sqlite, and the archive files next to it,
+into shared-cache in-memory databases with the sqlite3 backup API, and
+hands out read-only connections to the copy through the same acquire() /
+release() as ConnectionPool. Reads never touch the file; writes still go
+to it through the regular pool.
+
+The copy follows the file. Right after a write made through
+database_functions in this process the copy is refreshed before the
+write returns, so a worker reads its own writes. A background check every
+`interval` seconds picks up the commits of other processes, seen as a
+change in PRAGMA data_version. A refresh builds the new copy next to the
+old one and then swaps it in, so readers never wait on a refresh or see
+half of one. Connections already reading the old copy finish on it, and
+it is dropped once the last of them is released.
+
+The backup API copies whole databases, so every refresh copies the main
+file in full (about 12 ms for 7 MB here). Archive files only change when a
+season is archived or restored, and are copied again only then.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import database_functions as db
+import metrics
+import migrations
+
+logger = logging.getLogger(__name__)
+
+def _memoryUri(name):
+    return f"file:{name}?mode=memory&cache=shared"
+
+def _databaseBytes(conn):
+    page_count = conn.execute("PRAGMA page_count;").fetchone()[0]
+    return page_count * conn.execute("PRAGMA page_size;").fetchone()[0]
+
+class _ReplicaPool(db.ConnectionPool):
+    """ConnectionPool over one in-memory copy: read-only connections, no migrations."""
+
+    def __init__(self, uri, archivePaths, size, timeout):
+        super().__init__(uri, size=size, timeout=timeout)
+        self.archivePaths = archivePaths
+        self._migrated = True  # a copy of a migrated file
+
+    def _open(self):
+        conn = db._connect(self.dbFile, check_same_thread=False, archivePaths=self.archivePaths)
+        # Only now: _connect creates TEMP views, which query_only forbids too
+        conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+class _Generation:
+    """
+    One copy of the database. An in-memory database lives as long as a
+    connection to it is open: `anchor` keeps the main copy alive until the
+    generation is retired and its last connection released, the anchors in
+    `archives` (archive file name -> (URI, anchor)) until no live
+    generation uses them.
+    """
+
+    def __init__(self, number, uri, anchor, layout, archives, pool):
+        self.number = number
+        self.uri = uri
+        self.anchor = anchor
+        self.layout = layout
+        self.archives = archives
+        self.pool = pool
+        self.bytes = _databaseBytes(anchor)
+        self.archiveBytes = sum(_databaseBytes(archive) for _, archive in archives.values())
+        self.created = time.time()
+        self.in_use = 0
+        self.retired = False
+
+class Replica:
+    """
+    Read-only connections to an in-memory copy of `dbFile`, `size` at most
+    per copy. Call start() before the first acquire().
+    """
+
+    def __init__(self, dbFile, size=8, timeout=5.0, interval=1.0):
+        self.dbFile = dbFile
+        self.size = size
+        self.timeout = timeout
+        self.interval = interval
+        self.name = f"nfl_replica_{os.getpid()}_{id(self):x}"
+        self.reads = 0
+        self.checks = 0
+        self.failed = 0
+        self.refreshes = Counter()
+        self.refreshSeconds = 0.0
+        self.maxRefreshSeconds = 0.0
+        self.archiveCopies = 0
+        self.last = None
+        self._dataVersion = None
+        self._numbers = 0
+        self._current = None
+        self._live = []
+        self._source = None
+        # One refresh at a time; _swap guards _current, _live and in_use
+        self._refreshLock = threading.Lock()
+        self._swap = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Copies the database into memory and starts following its writes."""
+        if not self.refresh("startup"):
+            raise sqlite3.OperationalError(f"could not copy {self.dbFile} into memory")
+        db.addWriteListener(self._onWrite)
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name="replica-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops following writes and drops the copy once nothing reads it."""
+        db.removeWriteListener(self._onWrite)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._refreshLock:
+            with self._swap:
+                current, self._current = self._current, None
+                if current is not None:
+                    self._retire(current)
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.refresh("poll")
+
+    def _onWrite(self, func, args, kwargs):
+        # Writes to other files leave data_version alone and cost one PRAGMA
+        self.refresh("write")
+
+    # ---------------------------------------------------------------------
+    # Refreshing
+    # ---------------------------------------------------------------------
+
+    def _openSource(self):
+        conn = db._connect(self.dbFile, check_same_thread=False)
+        # The copy has to have the current schema, as the pool's connections do
+        with db._writerLock(conn):
+            migrations.migrate(conn)
+        db._refreshPartitions(conn)
+        return conn
+
+    def refresh(self, reason="manual", force=False):
+        """
+        Copies the database into memory again if it has changed since the
+        last copy (or if `force`). Returns True when a new copy was swapped
+        in; a failed refresh is logged and the old copy stays.
+        """
+        with self._refreshLock:
+            try:
+                if self._source is None:
+                    self._source = self._openSource()
+                # Read before copying: a commit in between only makes the
+                # copy newer than its version, so the next check copies again
+                version = self._source.execute("PRAGMA data_version;").fetchone()[0]
+                self.checks += 1
+                if not force and self._current is not None and version == self._dataVersion:
+                    return False
+                start = time.perf_counter()
+                generation = self._copy()
+            except db.Error as e:
+                self.failed += 1
+                logger.error("Error in replica refresh: %s", e)
+                return False
+            seconds = time.perf_counter() - start
+            self._dataVersion = version
+            with self._swap:
+                old, self._current = self._current, generation
+                self._live.append(generation)
+                if old is not None:
+                    self._retire(old)
+            self.refreshes[reason] += 1
+            self.refreshSeconds += seconds
+            self.maxRefreshSeconds = max(self.maxRefreshSeconds, seconds)
+            self.last = {"reason": reason, "generation": generation.number, "seconds": round(seconds, 6),
+                         "bytes": generation.bytes, "at": generation.created}
+        metrics.record("replicaRefresh", seconds)
+        # Results a reader cached from the old copy meanwhile would outlive it
+        db.resultCache.bumpGeneration()
+        logger.debug("Replica %d of %s copied in %.1f ms (%s)", generation.number, self.dbFile,
+                     seconds * 1000, reason)
+        return True
+
+    def _copy(self):
+        self._numbers += 1
+        uri = _memoryUri(f"{self.name}.{self._numbers}")
+        anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        archives = None
+        try:
+            self._source.backup(anchor)
+            layout = db._partitionLayout(anchor)
+            archives = self._copyArchives(layout)
+            pool = _ReplicaPool(uri, {name: path for name, (path, _) in archives.items()},
+                                self.size, self.timeout)
+            return _Generation(self._numbers, uri, anchor, layout, archives, pool)
+        except BaseException:
+            anchor.close()
+            if archives is not None and (self._current is None or archives is not self._current.archives):
+                for _, archive in archives.values():
+                    archive.close()
+            raise
+
+    def _copyArchives(self, layout):
+        """The in-memory copies of the archive files in `layout`; the current ones if it has not changed."""
+        if self._current is not None and layout == self._current.layout:
+            return self._current.archives
+        directory = os.path.dirname(os.path.abspath(self.dbFile))
+        archives = {}
+        try:
+            for name in dict.fromkeys(name for _, name in layout):
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    raise db.Error(f"archive file {path} is missing")
+                uri = _memoryUri(f"{self.name}.{self._numbers}.{name}")
+                archives[name] = (uri, sqlite3.connect(uri, uri=True, check_same_thread=False))
+                source = sqlite3.connect(path)
+                try:
+                    source.backup(archives[name][1])
+                finally:
+                    source.close()
+                self.archiveCopies += 1
+        except BaseException:
+            for _, archive in archives.values():
+                archive.close()
+            raise
+        return archives
+
+    def _retire(self, generation):
+        # Under _swap
+        generation.retired = True
+        if not generation.in_use:
+            self._drop(generation)
+
+    def _drop(self, generation):
+        # Under _swap, once a retired generation has no connection out
+        generation.pool.close()
+        generation.anchor.close()
+        self._live.remove(generation)
+        if not any(live.archives is generation.archives for live in self._live):
+            for _, archive in generation.archives.values():
+                archive.close()
+
+    # ---------------------------------------------------------------------
+    # Connections
+    # ---------------------------------------------------------------------
+
+    def acquire(self):
+        """A read-only connection to the current copy; see ConnectionPool.acquire."""
+        with self._swap:
+            generation = self._current
+            if generation is None:
+                raise sqlite3.OperationalError("the replica is not started")
+            generation.in_use += 1
+        try:
+            conn = generation.pool.acquire()
+        except BaseException:
+            self._done(generation)
+            raise
+        conn.replicaGeneration = generation
+        self.reads += 1
+        return conn
+
+    def release(self, conn):
+        """Returns a connection; the last one out of a replaced copy drops it."""
+        generation = conn.replicaGeneration
+        with self._swap:
+            generation.pool.release(conn)
+        self._done(generation)
+
+    def _done(self, generation):
+        with self._swap:
+            generation.in_use -= 1
+            if generation.retired and not generation.in_use:
+                self._drop(generation)
+
+    def stats(self):
+        """Copy size and age, refresh counts and cost, for /cache/stats."""
+        with self._swap:
+            current = self._current
+            copies = len(self._live)
+            in_use = sum(generation.in_use for generation in self._live)
+        refreshes = sum(self.refreshes.values())
+        return {
+            "database": self.dbFile,
+            "generation": current.number if current else None,
+            "bytes": current.bytes if current else 0,
+            "archive_bytes": current.archiveBytes if current else 0,
+            "age_seconds": round(time.time() - current.created, 3) if current else None,
+            "copies_in_memory": copies,
+            "in_use": in_use,
+            "reads": self.reads,
+            "checks": self.checks,
+            "refreshes": dict(self.refreshes),
+            "failed": self.failed,
+            "archive_copies": self.archiveCopies,
+            "refresh_seconds_total": round(self.refreshSeconds, 6),
+            "refresh_seconds_avg": round(self.refreshSeconds / refreshes, 6) if refreshes else None,
+            "refresh_seconds_max": round(self.maxRefreshSeconds, 6),
+            "last_refresh": self.last,
+        }
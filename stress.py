@@ -0,0 +1,215 @@
+"""
+Concurrency stress test for database_functions across processes.
+
+Copies the database to a scratch file and runs N reader and M writer
+processes against it at once, the way the app's workers share one file.
+Readers loop over leaderboard, range, profile and version queries with
+the result cache off; each writer adds its own player's stat lines, in
+turn one call at a time, in bulk and inside db.transaction(). A
+Checkpointer runs in the parent meanwhile.
+
+    python stress.py                                  # 4 readers, 4 writers, 200 writes each
+    python stress.py --readers 8 --writers 6 --writes 500 --source nfl_stats.sqlite
+
+Passes (exit 0) when no process logged a lock error or a failed call,
+every write is in the database afterwards, the derived tables agree with
+it and the WAL is back under --wal-limit once the load stops.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import database_functions as db
+import metrics
+
+SOURCE_DB = "nfl_stats.sqlite"
+
+# Stress rows live in seasons of their own, spread over a few so the
+# per-season and running totals see inserts in every position.
+STRESS_SEASONS = (2090, 2091, 2092)
+
+# Writes per call mode: one call each, one bulk call, one transaction()
+CHUNK = 5
+
+def _stressPlayer(writer):
+    return f"STRESS{writer:03d}"
+
+def _stressRows(writer, writes):
+    player_id = _stressPlayer(writer)
+    for i in range(writes):
+        yield {"season": STRESS_SEASONS[i % len(STRESS_SEASONS)], "week": i // len(STRESS_SEASONS) + 1,
+               "player_id": player_id, "player_name": f"Stress {writer}", "team": "KC",
+               "passing_yards": 100.0, "pass_touchdown": 1.0}
+
+class _ErrorLog(logging.Handler):
+    """Keeps every ERROR record a worker process logs."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def _worker(role, index, dbFile, writes, writers, stop, results):
+    errors = _ErrorLog()
+    logging.basicConfig(level=logging.WARNING, format=f"{role}{index} %(message)s")
+    logging.getLogger().addHandler(errors)
+    # Slow calls are expected under contention; only failures matter here
+    logging.getLogger(metrics.__name__).setLevel(logging.ERROR)
+    db.resultCache.enabled = False
+    conn = db.openConnection(dbFile)
+    calls = failed = 0
+
+    if role == "writer":
+        rows = list(_stressRows(index, writes))
+        player_id = _stressPlayer(index)
+        calls += 1
+        failed += not db.addPlayer(conn, player_id, f"Stress {index}", "KC", 2000, 2022, 1, 72, 200,
+                                   "QB", STRESS_SEASONS[0])
+        for start in range(0, len(rows), CHUNK):
+            chunk = rows[start:start + CHUNK]
+            mode = start // CHUNK % 3
+            if mode == 0:
+                for row in chunk:
+                    calls += 1
+                    failed += not db.addPlayerGameStats(conn, **row)
+            elif mode == 1:
+                calls += 1
+                failed += not db.addPlayerGameStatsBulk(conn, chunk)
+            else:
+                calls += 1
+                try:
+                    with db.transaction(conn):
+                        for row in chunk:
+                            db.addPlayerGameStats(conn, **row)
+                except db.Error as e:
+                    errors.messages.append(f"transaction: {e}")
+                    failed += 1
+    else:
+        while not stop.is_set():
+            player_id = _stressPlayer(calls % max(writers, 1))
+            reads = (
+                db.getLeaders(conn, "passing_yards", season=STRESS_SEASONS[calls % len(STRESS_SEASONS)]),
+                db.getLeaders(conn, "touchdowns", season_from=STRESS_SEASONS[0]),
+                db.getPlayerRangeTotals(conn, player_id, STRESS_SEASONS[1]),
+                db.getPlayerProfile(conn, player_id),
+                db.getDataVersion(conn),
+            )
+            calls += len(reads)
+
+    db.closeConnection(conn, dbFile)
+    results.put({"role": role, "index": index, "calls": calls, "failed": failed,
+                 "errors": errors.messages, "busy_retries": db.busyRetries})
+
+def runStress(_sourceFile, readers=4, writers=4, writes=200, checkpoint_interval=0.5,
+              wal_limit=8 * 1024 * 1024):
+    """
+    Runs the stress test on a scratch copy of _sourceFile, with a
+    Checkpointer truncating the WAL past wal_limit bytes. Returns (report
+    dict, list of failures); no failures means it passed.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="nfl_stress_")
+    dbFile = os.path.join(scratch_dir, "stress.sqlite")
+    shutil.copyfile(_sourceFile, dbFile)
+    conn = db.openConnection(dbFile)  # migrated once, up front
+    db.closeConnection(conn, dbFile)
+
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    results = ctx.Queue()
+    checkpointer = db.Checkpointer(dbFile, interval=checkpoint_interval, max_bytes=wal_limit)
+    checkpointer.start()
+    processes = [ctx.Process(target=_worker, args=("reader", i, dbFile, writes, writers, stop, results))
+                 for i in range(readers)]
+    writer_processes = [ctx.Process(target=_worker, args=("writer", i, dbFile, writes, writers, stop, results))
+                        for i in range(writers)]
+    start = time.perf_counter()
+    for process in processes + writer_processes:
+        process.start()
+
+    max_wal = 0
+    while any(process.is_alive() for process in writer_processes):
+        max_wal = max(max_wal, checkpointer.walBytes())
+        time.sleep(0.05)
+    seconds = time.perf_counter() - start
+    stop.set()
+    reports = [results.get() for _ in range(readers + writers)]
+    for process in processes + writer_processes:
+        process.join()
+    checkpointer.stop()
+    # With everyone gone the next checkpoint has to get the WAL back down
+    conn = db.openConnection(dbFile)
+    checkpointer.checkpoint(conn)
+    db.closeConnection(conn, dbFile)
+    final_wal = checkpointer.walBytes()
+
+    failures = []
+    for report in reports:
+        if report["failed"] or report["errors"]:
+            failures.append(f"{report['role']} {report['index']}: {report['failed']} failed calls, "
+                            f"errors: {report['errors'][:3]}")
+
+    conn = db.openConnection(dbFile)
+    for writer in range(writers):
+        player_id = _stressPlayer(writer)
+        stored = conn.execute("SELECT COUNT(*) FROM player_game_stats WHERE player_id = ?;",
+                              (player_id,)).fetchone()[0]
+        totals = db.getPlayerRangeTotals(conn, player_id)
+        counted = totals["games_played"] if totals else 0
+        if stored != writes or counted != writes:
+            failures.append(f"writer {writer}: {writes} writes, {stored} stored, {counted} in the totals")
+    stale = db.checkPlayerSeasonTotals(conn) + db.checkPlayerCareerTotals(conn)
+    if stale:
+        failures.append(f"derived tables out of date for {len(stale)} player-seasons")
+    db.closeConnection(conn, dbFile)
+    if final_wal > wal_limit:
+        failures.append(f"WAL still {final_wal} bytes after a final checkpoint (limit {wal_limit})")
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    reads = sum(r["calls"] for r in reports if r["role"] == "reader")
+    write_calls = sum(r["calls"] for r in reports if r["role"] == "writer")
+    report = {
+        "readers": readers,
+        "writers": writers,
+        "seconds": round(seconds, 3),
+        "reads": reads,
+        "write_calls": write_calls,
+        "rows_written": writers * writes,
+        "busy_retries": sum(r["busy_retries"] for r in reports),
+        "max_wal_bytes": max_wal,
+        "final_wal_bytes": final_wal,
+        "checkpoints": checkpointer.stats(),
+    }
+    return report, failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress database_functions with concurrent processes.")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=200, help="stat lines per writer")
+    parser.add_argument("--source", default=SOURCE_DB)
+    parser.add_argument("--wal-limit", type=int, default=8 * 1024 * 1024,
+                        help="bytes past which the checkpointer truncates the WAL")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logging.getLogger(metrics.__name__).setLevel(logging.ERROR)
+
+    report, failures = runStress(args.source, args.readers, args.writers, args.writes,
+                                 wal_limit=args.wal_limit)
+    for key, value in report.items():
+        print(f"{key:15} {value}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print("No lock errors, no lost writes.")
+
+
+if __name__ == '__main__':
+    main()
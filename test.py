@@ -1,7 +1,9 @@
 import database_functions as db
+import logging
 import sqlite3
 
 def run_comprehensive_test():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     database = "nfl_stats.sqlite"
     conn = db.openConnection(database)
 
@@ -0,0 +1,466 @@
+"""
+Tests for the Flask app's routes, each against a scratch copy of
+nfl_stats.sqlite (see test_database.py).
+"""
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app as app_module
+import database_functions as db
+import metrics
+from test_database import scratchDatabase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class AppTestCase(unittest.TestCase):
+    """self.client on a fresh scratch database; background work off unless a test turns it on."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nfl_app_test_")
+        self.dbFile = scratchDatabase(self.directory)
+        app_module.DATABASE = self.dbFile
+        self.config = {key: app_module.app.config[key]
+                       for key in ('WARM_CACHE', 'CHECKPOINT_SECONDS', 'REPLICA', 'ACCESS_LOG')}
+        app_module.app.config.update(WARM_CACHE=False, CHECKPOINT_SECONDS=0, REPLICA=False, ACCESS_LOG=False)
+        db.resultCache.clear()
+        db.profileCache.clear()
+        app_module.fragmentCache.clear()
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.stop_background()
+        app_module.app.config.update(self.config)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def connection(self):
+        """A connection from the app's own pool, for writes the listeners must hear about."""
+        return app_module.get_pool().acquire()
+
+    def release(self, conn):
+        app_module.get_pool().release(conn)
+
+
+class PageTest(AppTestCase):
+
+    def test_dashboard_and_stats_tables_render(self):
+        self.assertEqual(self.client.get('/').status_code, 200)
+        page = self.client.get('/stats/top_qbs?season=2024')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b"Top 5 QBs by Passing Yards (2024)", page.data)
+        page = self.client.get('/stats/leaders?stat=receptions&position=te&season_from=2020&season_to=2024')
+        self.assertIn(b"Top 5 TEs by Receptions (2020-2024)", page.data)
+        # A bad leaderboard request is flashed on the dashboard
+        response = self.client.get('/stats/leaders?stat=bogus', follow_redirects=True)
+        self.assertIn(b"Unknown stat &#39;bogus&#39;", response.data)
+
+    def test_lookups_render_their_tab(self):
+        page = self.client.post('/team_lookup', data={'team_ticker': 'sf', 'season': '2024'})
+        record = self.client.get('/api/team/SF/record/2024').get_json()
+        self.assertIn(f"{record['wins']} - {record['losses']}".encode(), page.data)
+        page = self.client.post('/player_lookup', data={'player_name': 'Patrick Mahomes'})
+        self.assertIn(b"Patrick Mahomes", page.data)
+        page = self.client.post('/player_lookup', data={'player_name': 'Patrik Mahommes'})
+        self.assertIn(b"Showing results for &#39;Patrick Mahomes&#39;", page.data)
+        response = self.client.post('/player_lookup', data={'player_name': 'Qqqqq'}, follow_redirects=True)
+        self.assertIn(b"No player found", response.data)
+
+    def test_writes_show_up_on_the_next_read(self):
+        self.assertEqual(self.client.get('/api/team/SF/record/2030').get_json(), {'wins': 0, 'losses': 0})
+        self.client.post('/add_game', data={'season': '2030', 'week': '1', 'season_type': 'reg',
+                                            'away_team': 'sf', 'home_team': 'la',
+                                            'away_score': '24', 'home_score': '17'})
+        self.assertEqual(self.client.get('/api/team/SF/record/2030').get_json(), {'wins': 1, 'losses': 0})
+
+        form = {'player_id': 'TEST_001', 'player_name': 'Testy McTesterson', 'team': 'SF', 'position': 'QB'}
+        self.client.post('/add_player', data=form)
+        self.assertEqual(self.client.get('/api/player/TEST_001').get_json()['bio']['weight'], 200)
+        self.assertIn(b"Weight:</strong> 200", self.client.get('/fragment/player/TEST_001').data)
+
+        self.client.post('/update_player', data={'player_id': 'TEST_001', 'update_action': 'weight',
+                                                 'new_value': '215'})
+        self.assertEqual(self.client.get('/api/player/TEST_001').get_json()['bio']['weight'], 215)
+        self.assertIn(b"Weight:</strong> 215", self.client.get('/fragment/player/TEST_001').data)
+
+        response = self.client.post('/add_player', data=form, follow_redirects=True)
+        self.assertIn(b"Failed to add player", response.data)
+        self.client.post('/delete_player', data={'player_id': 'TEST_001'})
+        self.assertEqual(self.client.get('/api/player/TEST_001').status_code, 404)
+
+
+class PlayerRouteTest(AppTestCase):
+
+    def busiestPlayer(self):
+        conn = self.connection()
+        try:
+            return conn.execute("SELECT player_id FROM player_game_stats GROUP BY player_id "
+                                "ORDER BY COUNT(*) DESC, player_id LIMIT 1;").fetchone()[0]
+        finally:
+            self.release(conn)
+
+    def test_load_more_pages_through_every_game(self):
+        player_id = self.busiestPlayer()
+        profile = self.client.get(f'/api/player/{player_id}').get_json()
+        page = self.client.get(f'/fragment/player/{player_id}').get_data(as_text=True)
+        self.assertIn(f'data-next="{profile["matchups_next"]}"', page)
+
+        games = {(m['season'], m['week']) for m in profile['matchups']}
+        cursor = profile['matchups_next']
+        while cursor:
+            body = self.client.get(f'/api/player/{player_id}/games?before={cursor}'
+                                   f'&limit={app_module.PAGE_SIZE}').get_json()
+            page_games = {(m['season'], m['week']) for m in body['games']}
+            self.assertFalse(games & page_games)
+            games |= page_games
+            cursor = body['next']
+        played = self.client.get(f'/api/player/{player_id}/totals').get_json()['games_played']
+        self.assertEqual(len(games), played)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/player/NO_SUCH_PLAYER').status_code, 404)
+        response = self.client.get('/api/player/TEST_001/games?before=last-week')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("SEASON-WEEK", response.get_json()['error'])
+
+
+class PagingAndExportTest(AppTestCase):
+
+    def count(self, sql, *params):
+        conn = self.connection()
+        try:
+            return conn.execute(sql, params).fetchone()[0]
+        finally:
+            self.release(conn)
+
+    def test_schedule_pages_add_up_to_the_whole_season(self):
+        whole = self.client.get('/api/team/sf/schedule/2024').get_json()
+        self.assertIsNone(whole['next'])
+        games, after = [], None
+        while True:
+            page = self.client.get('/api/team/sf/schedule/2024?limit=5'
+                                   + (f'&after={after}' if after else '')).get_json()
+            games += page['games']
+            after = page['next']
+            if after is None:
+                break
+        self.assertEqual(games, whole['games'])
+        self.assertEqual(len(games), self.count("SELECT COUNT(*) FROM games WHERE season = 2024 "
+                                                "AND season_type = 'REG' AND 'SF' IN (home_team, away_team);"))
+
+    def test_season_export_streams_every_row(self):
+        response = self.client.get('/export/season/2023')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         'attachment; filename=player_game_stats_2023.csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        response.close()
+        self.assertEqual(len(rows), self.count("SELECT COUNT(*) FROM player_game_stats WHERE season = 2023;"))
+        keys = [(int(row['week']), row['player_id']) for row in rows]
+        self.assertEqual(keys, sorted(keys))
+        # The export's own connection went back to the pool
+        self.assertEqual(app_module.get_pool().stats()['in_use'], 0)
+
+    def test_player_export_as_json_lines(self):
+        player_id = self.client.get('/api/players/search?q=patrick+mahomes').get_json()[0]['player_id']
+        response = self.client.get(f'/export/player/{player_id}?format=jsonl')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        games = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        response.close()
+        self.assertEqual(len(games), self.client.get(f'/api/player/{player_id}/totals').get_json()['games_played'])
+        self.assertEqual(games, sorted(games, key=lambda game: (game['season'], game['week'])))
+        self.assertEqual({game['result'] for game in games} - {None}, {'Win', 'Loss'})
+        self.assertEqual(self.client.get('/export/season/2023?format=xml').status_code, 400)
+
+
+class ConditionalGetTest(AppTestCase):
+
+    def test_unchanged_data_is_not_sent_or_queried_again(self):
+        first = self.client.get('/api/stats/top_qbs?season=2024')
+        self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+        etag = first.headers['ETag']
+        self.assertEqual(etag, '"%s"' % self.client.get('/api/version').get_json()['etag'])
+
+        metrics.reset()
+        again = self.client.get('/api/stats/top_qbs?season=2024', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b"")
+        self.assertEqual(again.headers['ETag'], etag)
+        self.assertNotIn("getLeaders", metrics.snapshot())
+        since = self.client.get('/api/stats/top_qbs?season=2024',
+                                headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+    def test_a_write_changes_the_tag(self):
+        game = {'season': '2030', 'week': '1', 'season_type': 'reg', 'away_team': 'sf',
+                'home_team': 'la', 'away_score': '24', 'home_score': '17'}
+        etag = self.client.get('/api/team/SF/record/2030').headers['ETag']
+        self.client.post('/add_game', data=game, follow_redirects=True)
+        after = self.client.get('/api/team/SF/record/2030', headers={'If-None-Match': etag})
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after.headers['ETag'], etag)
+        self.assertEqual(after.get_json(), {'wins': 1, 'losses': 0})
+
+        # Until the page shows it, a flash message is one-off content: no tag, no 304
+        self.client.post('/add_game', data=game)
+        flashed = self.client.get('/api/team/SF/record/2030', headers={'If-None-Match': after.headers['ETag']})
+        self.assertEqual(flashed.status_code, 200)
+        self.assertNotIn('ETag', flashed.headers)
+
+    def test_errors_carry_no_tag(self):
+        response = self.client.get('/api/stats/no_such_table')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response.headers)
+
+
+class ReplicaRouteTest(AppTestCase):
+
+    def test_reads_come_from_the_replica_and_see_the_writes(self):
+        app_module.app.config.update(REPLICA=True)
+        self.assertEqual(self.client.get('/api/team/SF/record/2030').get_json(), {'wins': 0, 'losses': 0})
+        self.client.post('/add_game', data={'season': '2030', 'week': '1', 'season_type': 'reg',
+                                            'away_team': 'sf', 'home_team': 'la',
+                                            'away_score': '24', 'home_score': '17'})
+        self.assertEqual(self.client.get('/api/team/SF/record/2030').get_json(), {'wins': 1, 'losses': 0})
+        stats = self.client.get('/cache/stats').get_json()['replica']
+        self.assertEqual(stats['refreshes'], {'startup': 1, 'write': 1})
+        self.assertEqual(stats['in_use'], 0)
+
+
+class DashboardTest(AppTestCase):
+
+    def test_panels_match_their_tables(self):
+        body = self.client.get('/dashboard/2023').get_json()
+        self.assertEqual(sorted(body['panels']), sorted(app_module.DASHBOARD_PANELS))
+        for stat_type, panel in body['panels'].items():
+            with self.subTest(stat_type):
+                table = self.client.get(f'/api/stats/{stat_type}?season=2023').get_json()
+                self.assertEqual(panel['rows'], table['rows'])
+                self.assertEqual(panel['title'], table['title'])
+        self.assertEqual(app_module.get_pool().stats()['in_use'], 0)
+
+    def test_a_failing_panel_does_not_take_the_others_down(self):
+        with mock.patch.object(db, "best_coach", side_effect=db.Error("no coaches")):
+            body = self.client.get('/dashboard/2024').get_json()
+        self.assertEqual(body['panels']['best_coach'], {'error': "no coaches"})
+        self.assertEqual(len(body['panels']['top_qbs']['rows']), 5)
+
+    def test_panels_cannot_write(self):
+        def write(conn, *args):
+            return db.updatePlayerWeight(conn, "00-0033873", 1)
+
+        with mock.patch.object(db, "best_coach", write):
+            body = self.client.get('/dashboard/2024').get_json()
+        self.assertIn('error', body['panels']['best_coach'])
+        weight = self.client.get('/api/player/00-0033873').get_json()['bio']['weight']
+        self.assertNotEqual(weight, 1)
+
+
+class RequestTimingTest(AppTestCase):
+
+    def timing(self, response):
+        return {name: (float(dur), desc) for name, dur, desc in
+                re.findall(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response.headers['Server-Timing'])}
+
+    def test_server_timing_splits_the_request(self):
+        timing = self.timing(self.client.get('/stats/top_qbs?season=2024'))
+        self.assertEqual(set(timing), {'db', 'render', 'total'})
+        self.assertRegex(timing['db'][1], r"^[1-9]\d* calls$")
+        self.assertGreater(timing['render'][0], 0)
+        self.assertGreaterEqual(timing['total'][0], timing['db'][0] + timing['render'][0])
+        timing = self.timing(self.client.post('/team_lookup', data={'team_ticker': 'sf', 'season': '2024'}))
+        self.assertIn('form', timing)
+
+    def test_access_log_has_one_json_line_per_request(self):
+        app_module.app.config.update(ACCESS_LOG=True)
+        with self.assertLogs('access', 'INFO') as logged:
+            self.client.get('/api/stats/top_qbs?season=2024')
+        self.assertEqual(len(logged.records), 1)
+        line = json.loads(logged.records[0].getMessage())
+        self.assertEqual((line['method'], line['path'], line['query'], line['status']),
+                         ('GET', '/api/stats/top_qbs', 'season=2024', 200))
+        # The ETag's data version, then the table
+        self.assertEqual(line['db_calls'], 2)
+        self.assertEqual(list(line['functions']), ['getDataVersion', 'getLeaders'])
+
+    def test_profile_report_only_when_profiling_is_on(self):
+        response = self.client.get('/api/stats/top_qbs?season=2024&profile=1')
+        self.assertEqual(response.mimetype, 'application/json')
+        app_module.app.config.update(PROFILING=True)
+        try:
+            response = self.client.get('/api/stats/top_qbs?season=2024&profile=1&sort=tottime')
+        finally:
+            app_module.app.config.update(PROFILING=False)
+        self.assertEqual(response.mimetype, 'text/plain')
+        text = response.get_data(as_text=True)
+        self.assertIn("Ordered by: internal time", text)
+        self.assertIn("Server-Timing: db;dur=", text)
+
+
+class FragmentTest(AppTestCase):
+
+    def test_fragment_is_the_panel_the_page_embeds(self):
+        fragment = self.client.get('/fragment/stats/top_qbs?season=2023').get_data(as_text=True)
+        self.assertNotIn("<html", fragment)
+        self.assertIn("Top 5 QBs by Passing Yards (2023)", fragment)
+        page = self.client.get('/stats/top_qbs?season=2023').get_data(as_text=True)
+        self.assertIn(fragment, page)
+
+    def test_rendered_panels_are_reused_until_the_data_changes(self):
+        self.client.get('/')
+        hits = app_module.fragmentCache.hits
+        # The data-free partials of the other tabs are rendered once for good
+        self.client.get('/')
+        self.assertEqual(app_module.fragmentCache.hits, hits + len(app_module.TAB_PARTIALS))
+
+        before = self.client.get('/fragment/team/SF/2030').get_data(as_text=True)
+        hits = app_module.fragmentCache.hits
+        self.assertEqual(self.client.get('/fragment/team/SF/2030').get_data(as_text=True), before)
+        self.assertEqual(app_module.fragmentCache.hits, hits + 1)
+
+        self.client.post('/add_game', data={'season': '2030', 'week': '1', 'season_type': 'reg',
+                                            'away_team': 'sf', 'home_team': 'la',
+                                            'away_score': '24', 'home_score': '17'}, follow_redirects=True)
+        after = self.client.get('/fragment/team/SF/2030').get_data(as_text=True)
+        self.assertIn("1 - 0", after)
+        self.assertNotIn("1 - 0", before)
+
+    def test_fragment_errors_are_plain_text(self):
+        response = self.client.get('/fragment/player/NO_SUCH_PLAYER')
+        self.assertEqual((response.status_code, response.mimetype), (404, 'text/plain'))
+        response = self.client.get('/fragment/stats/leaders?stat=bogus')
+        self.assertEqual((response.status_code, response.mimetype), (400, 'text/plain'))
+        self.assertIn("Unknown stat 'bogus'", response.get_data(as_text=True))
+
+
+class ChangeFeedTest(AppTestCase):
+
+    def changes(self, query):
+        response = self.client.get(f'/api/changes?{query}')
+        return response.status_code, response.get_json()
+
+    def test_caught_up_consumers_wait_for_the_next_write(self):
+        _, body = self.changes('since=0&limit=1')
+        head = body['head']
+        self.assertEqual(self.changes(f'since={head}'), (200, {'changes': [], 'next': head, 'head': head}))
+
+        def write():
+            time.sleep(0.2)
+            conn = self.connection()
+            try:
+                db.updatePlayerWeight(conn, '00-0033873', 250)
+            finally:
+                self.release(conn)
+
+        writer = threading.Thread(target=write)
+        started = time.monotonic()
+        writer.start()
+        status, body = self.changes(f'since={head}&wait=5')
+        writer.join()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(status, 200)
+        self.assertEqual([(c['table'], c['key'], c['op']) for c in body['changes']],
+                         [('players', ['00-0033873'], 'U')])
+        self.assertEqual(body['next'], body['changes'][-1]['seq'])
+
+    def test_bad_sequence_numbers(self):
+        _, body = self.changes('since=0&limit=1')
+        status, error = self.changes(f"since={body['head'] + 10}")
+        self.assertEqual((status, error['head']), (409, body['head']))
+        self.assertEqual(self.changes('since=-1')[0], 400)
+        self.assertEqual(self.changes('since=0&limit=0')[0], 400)
+
+
+class MetricsRouteTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        metrics.slowCalls.clear()
+
+    def test_metrics_cover_the_calls_made(self):
+        self.client.get('/stats/top_qbs?season=2024')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('nfl_db_call_duration_seconds_bucket{function="getLeaders",le="+Inf"} 1', text)
+        self.assertIn('nfl_db_call_duration_seconds_count{function="getLeaders"} 1', text)
+        self.assertIn('nfl_db_call_duration_recent_seconds{function="getLeaders",quantile="0.95"}', text)
+        self.assertIn("nfl_db_pool_open 1", text)
+        self.assertIn("# TYPE nfl_db_cache_misses_total counter", text)
+        self.assertIn("# TYPE nfl_db_cache_entries gauge", text)
+
+    def test_slow_calls_keep_their_sql(self):
+        with mock.patch.object(metrics, "SLOW_CALL_SECONDS", 0):
+            self.client.get('/api/team/SF/record/2024')
+        calls = self.client.get('/metrics/slow').get_json()
+        record = [call for call in calls if call['function'] == 'get_team_record']
+        self.assertEqual(len(record), 1)
+        self.assertTrue(any("team_season_records" in sql for sql in record[0]['statements']))
+
+
+class BackgroundStartTest(AppTestCase):
+
+    def test_import_opens_nothing_and_starts_no_threads(self):
+        directory = tempfile.mkdtemp(prefix="nfl_import_")
+        try:
+            script = ("import threading, app; "
+                      "print(sorted(t.name for t in threading.enumerate()))")
+            output = subprocess.run([sys.executable, "-c", script], cwd=directory, check=True,
+                                    capture_output=True, text=True,
+                                    env={**os.environ, "PYTHONPATH": HERE}).stdout
+            self.assertEqual(output.strip(), "['MainThread']")
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def test_first_request_starts_the_background_work_once(self):
+        app_module.app.config.update(WARM_CACHE=True, CHECKPOINT_SECONDS=30)
+        self.assertIsNone(app_module._warmer)
+        self.assertEqual(self.client.get('/health').status_code, 200)
+        warmer, checkpointer = app_module._warmer, app_module._checkpointer
+        self.assertIsNotNone(warmer)
+        self.assertIsNotNone(checkpointer)
+        self.client.get('/health')
+        self.assertIs(app_module._warmer, warmer)
+        self.assertIs(app_module._checkpointer, checkpointer)
+
+    def test_first_lookups_wait_for_the_warm_up_to_be_scheduled(self):
+        app_module.app.config.update(WARM_CACHE=True)
+        getSeasons = db.getSeasons
+
+        def slowly(*args):
+            time.sleep(0.2)
+            return getSeasons(*args)
+
+        with mock.patch.object(db, "getSeasons", slowly):
+            self.assertEqual(self.client.get('/api/stats/top_qbs?season=2024').status_code, 200)
+        self.assertEqual(app_module._warmer.stats()['misses'], 0)
+
+    def test_warm_tables_follow_writes(self):
+        app_module.app.config.update(WARM_CACHE=True)
+        self.client.get('/health')
+        before = self.client.get('/api/stats/top_qbs?season=2024').get_json()['rows']
+        conn = self.connection()
+        try:
+            db.addPlayer(conn, "TEST_001", "Testy McTesterson", "SF", 2000, 2022, 1, 72, 200, "QB", 2024)
+            db.addPlayerGameStats(conn, 2024, "TEST_001", "Testy McTesterson", 1, "SF",
+                                  passing_yards=99999.0)
+        finally:
+            self.release(conn)
+        after = self.client.get('/api/stats/top_qbs?season=2024').get_json()['rows']
+        self.assertNotEqual(before[0]['player_id'], "TEST_001")
+        self.assertEqual(after[0]['player_id'], "TEST_001")
+        self.assertEqual(app_module._warmer.stats()['misses'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
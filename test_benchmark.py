@@ -0,0 +1,78 @@
+"""Tests for benchmark: synthetic databases, the timing run and report comparison."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import database_functions as db
+from test_database import migratedTemplate, scratchDatabase
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nfl_benchmark_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_synthetic_database_holds_shifted_copies(self):
+        path = os.path.join(self.directory, "nfl_x2.sqlite")
+        benchmark.generateDatabase(migratedTemplate(), path, 2)
+        source, scaled = benchmark.rowCounts(migratedTemplate()), benchmark.rowCounts(path)
+        for table in ("players", "games", "player_game_stats", "player_history"):
+            self.assertEqual(scaled[table], 2 * source[table], table)
+        self.assertEqual(scaled["teams"], source["teams"])
+
+        seasons = "SELECT COUNT(DISTINCT season) FROM games;"
+        conn = db.openConnection(path)
+        try:
+            source = db.openConnection(migratedTemplate())
+            self.assertEqual(conn.execute(seasons).fetchone()[0], 2 * source.execute(seasons).fetchone()[0])
+            source.close()
+            self.assertEqual(db.checkPlayerSeasonTotals(conn), [])
+            self.assertEqual(db.checkTeamSeasonRecords(conn), [])
+        finally:
+            conn.close()
+
+    def test_every_probe_is_timed_and_the_source_is_left_alone(self):
+        path = scratchDatabase(self.directory)
+        before = benchmark.rowCounts(path)
+        results = benchmark.benchmarkDatabase(path, repeats=1)
+        self.assertEqual(benchmark.rowCounts(path), before)
+        reads = [entry for entry in results.values() if entry["kind"] == "read"]
+        writes = [name for name, entry in results.items() if entry["kind"] == "write"]
+        self.assertIn("getLeaders", results)
+        self.assertTrue(all(entry["cold"] >= 0 and entry["cached"] >= 0 for entry in reads))
+        self.assertTrue(any(name.startswith("transaction(") for name in writes))
+        self.assertFalse(os.path.exists(path + ".scratch"))
+
+    def test_only_the_cached_runs_hit_a_cache(self):
+        path = scratchDatabase(self.directory)
+        db.profileCache.enabled = False
+        try:
+            hits = db.profileCache.stats()["hits"]
+            benchmark.benchmarkDatabase(path, repeats=2)
+            # getPlayerProfile's snapshots count as a cache, so cold and warm miss them too
+            self.assertEqual(db.profileCache.stats()["hits"] - hits, 2)
+            self.assertFalse(db.profileCache.enabled)
+            self.assertTrue(db.resultCache.enabled)
+        finally:
+            db.profileCache.enabled = True
+
+    def test_compare_reports_only_real_slowdowns(self):
+        def report(**functions):
+            return {"scales": {"1": {"functions": functions}}}
+
+        before = report(fast={"kind": "read", "cold": 0.010, "warm": 0.005, "cached": 0.0001},
+                        write={"kind": "write", "seconds": 0.010})
+        after = report(fast={"kind": "read", "cold": 0.020, "warm": 0.0055, "cached": 0.0003},
+                       write={"kind": "write", "seconds": 0.0105},
+                       new={"kind": "write", "seconds": 1.0})
+        # cached tripled, but by less than MIN_REGRESSION_SECONDS
+        self.assertEqual(benchmark.compareReports(before, after), [("1", "fast", "cold", 0.010, 0.020)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""The columnar engine against the SQL it stands in for, before and after writes."""
+import unittest
+
+import columnar
+import database_functions as db
+from test_database import DatabaseTestCase
+
+
+@unittest.skipUnless(columnar.AVAILABLE, "numpy is not installed")
+class ColumnarTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db.resultCache.enabled = False
+        self.engine = columnar.ColumnarStats()
+        self.engine.load(self.conn)
+
+    def tearDown(self):
+        db.resultCache.enabled = True
+        super().tearDown()
+
+    def assertSameRows(self, name, kwargs):
+        expected = columnar._rowsOf(getattr(db, name)(self.conn, **kwargs))
+        actual = columnar._rowsOf(getattr(self.engine, name)(self.conn, **kwargs))
+        self.assertEqual(actual, expected)
+
+    def test_every_query_matches_the_sql(self):
+        for name, kwargs in columnar.verificationCalls(self.conn):
+            with self.subTest(name, **kwargs):
+                self.assertSameRows(name, kwargs)
+
+    def test_queries_match_after_each_kind_of_write(self):
+        self.assertEqual(columnar.verifyWrites(self.conn, self.engine), [])
+
+    def test_writes_are_applied_without_a_reload(self):
+        self.engine.attach()
+        try:
+            loads = self.engine.full_loads
+            self.assertTrue(self.addStatLine())
+            leaders = self.engine.getLeaders(self.conn, "passing_yards", season=2024)
+            self.assertEqual(leaders[0]["player_id"], "TEST_001")
+            self.assertSameRows("getLeaders", dict(stat="passing_yards", season=2024, top_n=10))
+            self.assertSameRows("get_conference_passing_leaders",
+                                dict(season=2024, conference="NFC", division="West"))
+            self.assertEqual(self.engine.full_loads, loads)
+        finally:
+            self.engine.detach()
+
+    def test_writes_from_elsewhere_are_picked_up(self):
+        # Not through database_functions, so only the data version tells
+        self.conn.execute("UPDATE player_game_stats SET rushing_yards = rushing_yards + 5000 "
+                          "WHERE season = 2023 AND week = 1 AND player_id = "
+                          "(SELECT MIN(player_id) FROM player_game_stats WHERE season = 2023 AND week = 1);")
+        self.conn.commit()
+        self.assertSameRows("getLeaders", dict(stat="rushing_yards", season=2023, top_n=10))
+
+
+if __name__ == "__main__":
+    unittest.main()
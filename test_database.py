@@ -0,0 +1,650 @@
+"""
+Tests for database_functions, each run against a scratch copy of
+nfl_stats.sqlite (the file itself is never written):
+
+    python -m pytest -q        # or: python -m unittest
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import database_functions as db
+import metrics
+
+SOURCE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nfl_stats.sqlite")
+
+_template = None
+
+def migratedTemplate():
+    """A migrated copy of SOURCE_DB, made once per test run."""
+    global _template
+    if _template is None:
+        directory = tempfile.mkdtemp(prefix="nfl_template_")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "nfl_stats.sqlite")
+        shutil.copyfile(SOURCE_DB, path)
+        conn = db.openConnection(path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        conn.close()
+        _template = path
+    return _template
+
+def scratchDatabase(directory, name="nfl_stats.sqlite"):
+    """Copies the migrated template into `directory`; returns its path."""
+    path = os.path.join(directory, name)
+    shutil.copyfile(migratedTemplate(), path)
+    return path
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Gives every test self.conn on a fresh scratch database, with empty caches."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nfl_test_")
+        self.dbFile = scratchDatabase(self.directory)
+        self.conn = db.openConnection(self.dbFile)
+        db.resultCache.clear()
+        db.profileCache.clear()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def addTestPlayer(self, player_id="TEST_001", position="QB", season=2024):
+        return db.addPlayer(self.conn, player_id, "Testy McTesterson", "SF", 2000, 2022, 1, 72, 200,
+                            position, season)
+
+    def addStatLine(self, player_id="TEST_001", season=2024, week=1, **stats):
+        """One game for a test player (added first if need be), 99999 passing yards by default."""
+        if not db.getPlayerNameById(self.conn, player_id):
+            self.addTestPlayer(player_id, season=season)
+        stats.setdefault("passing_yards", 99999.0)
+        return db.addPlayerGameStats(self.conn, season, player_id, "Testy McTesterson", week, "SF", **stats)
+
+
+class ConnectionPoolTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = db.ConnectionPool(self.dbFile, size=2, timeout=0.05)
+
+    def tearDown(self):
+        self.pool.close()
+        super().tearDown()
+
+    def test_connections_are_reused_and_tuned(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous;").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA temp_store;").fetchone()[0], 2)
+        self.assertEqual(self.pool.stats()["open"], 1)
+        self.pool.release(conn)
+
+    def test_exhausted_pool_times_out_until_a_connection_comes_back(self):
+        first, second = self.pool.acquire(), self.pool.acquire()
+        self.assertEqual(self.pool.stats()["in_use"], 2)
+        with self.assertRaises(db.Error):
+            self.pool.acquire()
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(), first)
+        self.pool.release(first)
+        self.pool.release(second)
+
+    def test_release_discards_uncommitted_work_and_replaces_broken_connections(self):
+        conn = self.pool.acquire()
+        conn.execute("UPDATE players SET weight = 1;")
+        self.pool.release(conn)
+        conn = self.pool.acquire()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM players WHERE weight = 1;").fetchone()[0], 0)
+        conn.close()
+        self.pool.release(conn)
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.pool.release(replacement)
+        self.assertTrue(self.pool.healthCheck()["ok"])
+
+
+class ConcurrentWriteTest(DatabaseTestCase):
+
+    def test_writers_on_many_connections_all_get_through(self):
+        self.assertTrue(self.addTestPlayer())
+        results = []
+
+        def write(thread):
+            conn = db.openConnection(self.dbFile)
+            try:
+                for week in range(1, 11):
+                    results.append(db.addPlayerGameStats(conn, 2000 + thread, "TEST_001", "Testy McTesterson",
+                                                         week, "SF", passing_yards=1.0))
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 40)
+        self.assertEqual(db.getPlayerRangeTotals(self.conn, "TEST_001")["games_played"], 40)
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+
+    def test_writer_lock_holds_off_other_processes(self):
+        script = ("import sys, time, database_functions as db; "
+                  "lock = db._WriterLock(sys.argv[1]); lock.acquire(); "
+                  "print('held', flush=True); sys.stdin.read()")
+        child = subprocess.Popen([sys.executable, "-c", script, self.dbFile], cwd=os.path.dirname(SOURCE_DB),
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(child.stdout.readline().strip(), "held")
+            lock = db._writerLock(self.conn)
+            with self.assertRaises(db.Error):
+                lock.acquire(timeout=0.2)
+        finally:
+            child.communicate("")
+        lock.acquire(timeout=5)
+        lock.release()
+
+    def test_checkpointer_empties_an_oversized_wal(self):
+        checkpointer = db.Checkpointer(self.dbFile, max_bytes=0)
+        self.assertTrue(self.addStatLine())
+        self.assertGreater(checkpointer.walBytes(), 0)
+        checkpointer.checkpoint(self.conn)
+        self.assertEqual(checkpointer.walBytes(), 0)
+        self.assertEqual(checkpointer.stats()["truncations"], 1)
+        # Under the limit it only copies back what it can
+        checkpointer.max_bytes = db.WAL_SIZE_LIMIT
+        self.assertTrue(self.addStatLine(week=2))
+        self.assertEqual(checkpointer.checkpoint(self.conn)[0], 0)
+        self.assertEqual(checkpointer.stats()["truncations"], 1)
+
+
+class ResultCacheTest(DatabaseTestCase):
+
+    def test_write_invalidates_cached_results(self):
+        hits = db.resultCache.hits
+        before = db.getLeaders(self.conn, "passing_yards", season=2024)
+        self.assertEqual(before, db.getLeaders(self.conn, "passing_yards", season=2024))
+        self.assertEqual(db.resultCache.hits, hits + 1)
+
+        self.assertTrue(self.addStatLine())
+        after = db.getLeaders(self.conn, "passing_yards", season=2024)
+        self.assertEqual(after[0]["player_id"], "TEST_001")
+        self.assertNotEqual(before, after)
+
+    def test_results_do_not_cross_databases(self):
+        other = db.openConnection(scratchDatabase(self.directory, "other.sqlite"))
+        try:
+            # Behind database_functions' back, so nothing is invalidated
+            other.execute("UPDATE player_season_totals SET passing_yards = 99999 "
+                          "WHERE season = 2024 AND player_id = "
+                          "(SELECT MIN(player_id) FROM player_season_totals WHERE season = 2024);")
+            other.commit()
+            mine = db.getLeaders(self.conn, "passing_yards", season=2024)
+            theirs = db.getLeaders(other, "passing_yards", season=2024)
+            self.assertNotEqual(mine[0]["player_id"], theirs[0]["player_id"])
+            self.assertEqual(theirs[0]["total_passing_yards"], 99999)
+        finally:
+            other.close()
+
+    def test_reads_inside_a_transaction_are_not_cached(self):
+        before = db.getLeaders(self.conn, "passing_yards", season=2024)
+        reader = db.openConnection(self.dbFile)
+        try:
+            with self.assertRaises(RuntimeError):
+                with db.transaction(self.conn):
+                    self.addStatLine()
+                    inside = db.getLeaders(self.conn, "passing_yards", season=2024)
+                    self.assertEqual(inside[0]["player_id"], "TEST_001")
+                    # Not committed: another connection must not be served it
+                    self.assertEqual(db.getLeaders(reader, "passing_yards", season=2024), before)
+                    raise RuntimeError("roll back")
+        finally:
+            reader.close()
+        self.assertEqual(db.getLeaders(self.conn, "passing_yards", season=2024), before)
+
+    def test_profile_snapshots_do_not_cross_databases(self):
+        player_id = db.getLeaders(self.conn, "passing_yards", season=2024)[0]["player_id"]
+        other = db.openConnection(scratchDatabase(self.directory, "other.sqlite"))
+        try:
+            version = "SELECT COALESCE(SUM(version), 0) FROM player_versions WHERE player_id IN (?, '*');"
+            before = other.execute(version, (player_id,)).fetchone()[0]
+            other.execute("UPDATE players SET weight = 1 WHERE player_id = ?;", (player_id,))
+            # Put the version back: same version in both files, different data
+            other.execute("UPDATE player_versions SET version = version - (" + version.rstrip(";")
+                          + ") + ? WHERE player_id = ?;", (player_id, before, player_id))
+            other.commit()
+            self.assertNotEqual(db.getPlayerProfile(self.conn, player_id)["bio"]["weight"], 1)
+            self.assertEqual(db.getPlayerProfile(other, player_id)["bio"]["weight"], 1)
+        finally:
+            other.close()
+
+
+class PlayerSeasonTotalsTest(DatabaseTestCase):
+
+    def totals(self, player_id="TEST_001", season=2024):
+        return self.conn.execute("SELECT games_played, passing_yards, rushing_yards FROM player_season_totals "
+                                 "WHERE player_id = ? AND season = ?;", (player_id, season)).fetchone()
+
+    def test_totals_follow_every_write_path(self):
+        self.assertTrue(self.addStatLine(week=1, rushing_yards=10.0))
+        self.assertTrue(self.addStatLine(week=2, passing_yards=1.0))
+        self.assertEqual(tuple(self.totals()), (2, 100000.0, 10.0))
+
+        # Raw SQL goes through the triggers too
+        self.conn.execute("UPDATE player_game_stats SET rushing_yards = 25 "
+                          "WHERE player_id = 'TEST_001' AND week = 2;")
+        self.conn.commit()
+        self.assertEqual(tuple(self.totals()), (2, 100000.0, 35.0))
+
+        self.assertTrue(db.deletePlayerGameStats(self.conn, "Testy McTesterson", 1, 2024))
+        self.assertEqual(tuple(self.totals()), (1, 1.0, 25.0))
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+
+        self.assertTrue(db.deletePlayer(self.conn, "TEST_001"))
+        self.assertIsNone(self.totals())
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+
+    def test_check_finds_drift_and_rebuild_repairs_it(self):
+        self.assertTrue(self.addStatLine())
+        self.conn.execute("UPDATE player_season_totals SET passing_yards = 1 WHERE player_id = 'TEST_001';")
+        self.conn.commit()
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [("TEST_001", 2024)])
+        self.assertTrue(db.rebuildPlayerSeasonTotals(self.conn))
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+        self.assertEqual(self.totals()["passing_yards"], 99999.0)
+
+        self.conn.execute("UPDATE player_season_totals SET games_played = games_played + 7 "
+                          "WHERE player_id = 'TEST_001';")
+        self.conn.commit()
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [("TEST_001", 2024)])
+        self.assertTrue(db.rebuildPlayerSeasonTotals(self.conn))
+        self.assertEqual(self.totals()["games_played"], 1)
+
+
+class TeamSeasonRecordsTest(DatabaseTestCase):
+
+    def playoffs(self, team, season=2024):
+        return self.conn.execute("SELECT made_playoffs FROM team_season_records "
+                                 "WHERE team = ? AND season = ? AND season_type = 'REG';",
+                                 (team, season)).fetchone()[0]
+
+    def test_records_follow_added_and_deleted_games(self):
+        sf, ari = db.get_team_record(self.conn, "SF", 2024), db.get_team_record(self.conn, "ARI", 2024)
+        # ARI at home loses, so SF (away) wins
+        self.assertTrue(db.addGame(self.conn, "2024_19_SF_ARI", 2024, 19, "POST", "SF", "ARI", 0))
+        self.assertEqual(db.get_team_record(self.conn, "SF", 2024),
+                         {'wins': sf['wins'] + 1, 'losses': sf['losses']})
+        self.assertEqual(db.get_team_record(self.conn, "ARI", 2024),
+                         {'wins': ari['wins'], 'losses': ari['losses'] + 1})
+        self.assertEqual((self.playoffs("SF"), self.playoffs("ARI")), (1, 1))
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [])
+
+        self.assertTrue(db.deleteGame(self.conn, "2024_19_SF_ARI"))
+        self.assertEqual(db.get_team_record(self.conn, "SF", 2024), sf)
+        self.assertEqual(db.get_team_record(self.conn, "ARI", 2024), ari)
+        self.assertEqual((self.playoffs("SF"), self.playoffs("ARI")), (0, 0))
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [])
+
+    def test_check_finds_drift_and_rebuild_repairs_it(self):
+        self.conn.execute("UPDATE team_season_records SET wins = wins + 1 "
+                          "WHERE team = 'SF' AND season = 2024 AND season_type = 'REG';")
+        self.conn.commit()
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [("SF", 2024, "REG")])
+        self.assertTrue(db.rebuildTeamSeasonRecords(self.conn))
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [])
+
+
+class GameParticipantsTest(DatabaseTestCase):
+
+    def sides(self, game_id):
+        rows = self.conn.execute("SELECT team, opponent, is_home, won FROM game_participants "
+                                 "WHERE game_id = ? ORDER BY is_home;", (game_id,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def test_both_sides_follow_game_writes(self):
+        self.assertTrue(db.addGame(self.conn, "2024_19_SF_ARI", 2024, 19, "POST", "SF", "ARI", 1))
+        self.assertEqual(self.sides("2024_19_SF_ARI"), [("SF", "ARI", 0, 0), ("ARI", "SF", 1, 1)])
+        self.conn.execute("UPDATE games SET home_win = 0 WHERE game_id = '2024_19_SF_ARI';")
+        self.conn.commit()
+        self.assertEqual(self.sides("2024_19_SF_ARI"), [("SF", "ARI", 0, 1), ("ARI", "SF", 1, 0)])
+        self.assertEqual(db.checkGameParticipants(self.conn), [])
+        self.assertTrue(db.deleteGame(self.conn, "2024_19_SF_ARI"))
+        self.assertEqual(self.sides("2024_19_SF_ARI"), [])
+        self.assertEqual(db.checkGameParticipants(self.conn), [])
+
+    def test_opponent_stats_match_the_or_join(self):
+        # get_qb_stats_vs_opponent as it was before game_participants
+        sql = """
+        SELECT p.player_name, COUNT(g.game_id), AVG(s.passing_yards), AVG(s.pass_touchdown),
+               AVG(s.interception)
+        FROM player_game_stats s
+        JOIN players p ON s.player_id = p.player_id
+        JOIN games g ON s.season = g.season AND s.week = g.week
+        WHERE s.player_id = ?
+          AND ((g.home_team = s.team AND g.away_team = ?) OR (g.away_team = s.team AND g.home_team = ?));"""
+        player_id = db.getPlayerIdByName(self.conn, "Patrick Mahomes")[0]["player_id"]
+        for opponent in ("LV", "DEN", "SF"):
+            with self.subTest(opponent):
+                expected = self.conn.execute(sql, (player_id, opponent, opponent)).fetchall()
+                actual = db.get_qb_stats_vs_opponent(self.conn, player_id, opponent)
+                self.assertEqual([tuple(row) for row in actual], [tuple(row) for row in expected])
+
+
+class CareerTotalsTest(DatabaseTestCase):
+
+    def rawTotals(self, player_id, season_from, season_to):
+        row = self.conn.execute("""
+            SELECT COUNT(*), SUM(passing_yards), SUM(rushing_yards) FROM player_game_stats
+            WHERE player_id = ? AND season BETWEEN ? AND ?;""",
+            (player_id, season_from or 0, season_to or 9999)).fetchone()
+        return tuple(row) if row[0] else None
+
+    def rangeTotals(self, player_id, season_from, season_to):
+        row = db.getPlayerRangeTotals(self.conn, player_id, season_from, season_to)
+        return (row["games_played"], row["passing_yards"], row["rushing_yards"]) if row else None
+
+    def test_range_totals_match_a_sum_of_the_games(self):
+        player_id = db.getPlayerIdByName(self.conn, "Patrick Mahomes")[0]["player_id"]
+        for season_from, season_to in ((None, None), (2020, 2022), (2019, 2019), (None, 2018), (2030, None)):
+            with self.subTest(season_from=season_from, season_to=season_to):
+                self.assertEqual(self.rangeTotals(player_id, season_from, season_to),
+                                 self.rawTotals(player_id, season_from, season_to))
+
+    def test_range_leaders_match_a_sum_of_the_games(self):
+        expected = self.conn.execute("""
+            SELECT player_id, SUM(receiving_yards) AS total FROM player_game_stats
+            WHERE season BETWEEN 2019 AND 2021
+            GROUP BY player_id ORDER BY total DESC, player_id LIMIT 10;""").fetchall()
+        leaders = db.getLeaders(self.conn, "receiving_yards", season_from=2019, season_to=2021, top_n=10)
+        self.assertEqual([(row["player_id"], row["total_receiving_yards"]) for row in leaders],
+                         [tuple(row) for row in expected])
+
+    def test_gaps_and_writes_in_earlier_seasons(self):
+        self.assertTrue(self.addStatLine(season=2020, rushing_yards=5.0))
+        self.assertTrue(self.addStatLine(season=2023, rushing_yards=7.0))
+        self.assertIsNone(self.rangeTotals("TEST_001", 2021, 2022))
+        self.assertEqual(self.rangeTotals("TEST_001", 2021, None), (1, 99999.0, 7.0))
+        # An earlier season's write moves every later running total
+        self.assertTrue(self.addStatLine(season=2020, week=2, rushing_yards=1.0))
+        self.assertEqual(self.rangeTotals("TEST_001", None, None), (3, 3 * 99999.0, 13.0))
+        self.assertEqual(self.rangeTotals("TEST_001", 2021, None), (1, 99999.0, 7.0))
+        self.assertEqual(db.checkPlayerCareerTotals(self.conn), [])
+
+        self.conn.execute("UPDATE player_career_totals SET rushing_yards = 0 "
+                          "WHERE player_id = 'TEST_001' AND season = 2023;")
+        self.conn.commit()
+        self.assertEqual(db.checkPlayerCareerTotals(self.conn), [("TEST_001", 2023)])
+        self.assertTrue(db.rebuildPlayerCareerTotals(self.conn))
+        self.assertEqual(db.checkPlayerCareerTotals(self.conn), [])
+
+
+class ChangeLogTest(DatabaseTestCase):
+
+    def changes(self, since):
+        return [(c["table"], c["key"], c["op"], c["season"]) for c in db.getChangesSince(self.conn, since)]
+
+    def test_every_write_path_is_logged(self):
+        start = db.getChangeSeq(self.conn)
+        self.assertTrue(self.addStatLine())
+        self.assertEqual(self.changes(start), [
+            ("players", ["TEST_001"], "I", None),
+            ("player_history", ["TEST_001", 2024, 1], "I", 2024),
+            ("player_game_stats", [2024, 1, "TEST_001"], "I", 2024),
+        ])
+        seq = db.getChangeSeq(self.conn)
+        self.assertTrue(db.updatePlayerWeight(self.conn, "TEST_001", 250))
+        # Raw SQL too; a row moved to another key is the old one gone and a new one
+        self.conn.execute("UPDATE player_game_stats SET week = 2 WHERE player_id = 'TEST_001';")
+        self.conn.commit()
+        self.assertTrue(db.deletePlayerGameStats(self.conn, "Testy McTesterson", 2, 2024))
+        self.assertEqual(self.changes(seq), [
+            ("players", ["TEST_001"], "U", None),
+            ("player_game_stats", [2024, 1, "TEST_001"], "D", 2024),
+            ("player_game_stats", [2024, 2, "TEST_001"], "I", 2024),
+            ("player_game_stats", [2024, 2, "TEST_001"], "D", 2024),
+        ])
+
+    def test_batches_and_compaction(self):
+        start = db.getChangeSeq(self.conn)
+        for week in range(1, 4):
+            self.assertTrue(self.addStatLine(week=week))
+        for weight in (201, 202, 203):
+            self.assertTrue(db.updatePlayerWeight(self.conn, "TEST_001", weight))
+        everything = db.getChangesSince(self.conn, start)
+        self.assertEqual(len(everything), 1 + 1 + 3 + 3)
+        first = db.getChangesSince(self.conn, start, limit=5)
+        self.assertEqual(first + db.getChangesSince(self.conn, first[-1]["seq"]), everything)
+
+        self.assertEqual(db.compactChangeLog(self.conn), 3)
+        compacted = self.changes(start)
+        self.assertEqual(compacted[0], ("player_history", ["TEST_001", 2024, 1], "I", 2024))
+        self.assertEqual(compacted[-1], ("players", ["TEST_001"], "U", None))
+        self.assertEqual(len(compacted), len({(table, tuple(key)) for table, key, _, _ in compacted}))
+        self.assertEqual(db.getChangeSeq(self.conn), everything[-1]["seq"])
+
+
+class TransactionTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.heard = []
+        self.listener = lambda func, args, kwargs: self.heard.append(func.__name__)
+        db.addWriteListener(self.listener)
+
+    def tearDown(self):
+        db.removeWriteListener(self.listener)
+        super().tearDown()
+
+    def stored(self, player_id="TEST_001"):
+        """What a second connection sees: only committed work."""
+        reader = db.openConnection(self.dbFile)
+        try:
+            return reader.execute("SELECT COUNT(*) FROM player_game_stats WHERE player_id = ?;",
+                                  (player_id,)).fetchone()[0]
+        finally:
+            reader.close()
+
+    def test_unit_commits_once_and_listeners_hear_after_it(self):
+        with db.transaction(self.conn):
+            self.addStatLine(week=1)
+            self.addStatLine(week=2)
+            self.assertEqual(self.heard, [])
+            self.assertEqual(self.stored(), 0)
+        self.assertEqual(self.stored(), 2)
+        self.assertEqual(self.heard, ["addPlayer", "addPlayerGameStats", "addPlayerGameStats"])
+
+    def test_failing_call_raises_and_rolls_the_unit_back(self):
+        with self.assertRaises(db.TransactionError):
+            with db.transaction(self.conn):
+                self.addStatLine()
+                # Already there: addPlayer returns False, which must not pass silently
+                self.addTestPlayer()
+        self.assertFalse(self.conn.in_transaction)
+        self.assertFalse(db.getPlayerNameById(self.conn, "TEST_001"))
+        self.assertEqual(self.stored(), 0)
+        self.assertEqual(self.heard, [])
+
+    def test_other_exceptions_roll_back_too(self):
+        with self.assertRaises(KeyError):
+            with db.transaction(self.conn):
+                self.addStatLine()
+                raise KeyError("boom")
+        self.assertEqual(self.stored(), 0)
+        # Outside a unit a failure is still just False
+        self.assertTrue(self.addTestPlayer())
+        self.assertFalse(self.addTestPlayer())
+
+    def test_failed_inner_unit_undoes_only_its_own_work(self):
+        with db.transaction(self.conn):
+            self.addStatLine(week=1)
+            with self.assertRaises(db.TransactionError):
+                with db.transaction(self.conn):
+                    self.addStatLine(week=2)
+                    self.addTestPlayer()
+            self.addStatLine(week=3)
+        weeks = self.conn.execute("SELECT week FROM player_game_stats WHERE player_id = 'TEST_001' "
+                                  "ORDER BY week;").fetchall()
+        self.assertEqual([row[0] for row in weeks], [1, 3])
+        self.assertEqual(self.heard, ["addPlayer", "addPlayerGameStats", "addPlayerGameStats"])
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+
+
+class LeaderboardTest(DatabaseTestCase):
+
+    def test_leaders_match_an_aggregate_of_the_game_rows(self):
+        expected = self.conn.execute("""
+            SELECT s.player_id, SUM(s.rushing_yards) AS total
+            FROM player_game_stats s JOIN players p ON s.player_id = p.player_id
+            WHERE s.season = 2023 AND p.position = 'RB'
+            GROUP BY s.player_id ORDER BY total DESC, s.player_id LIMIT 5;""").fetchall()
+        leaders = db.getLeaders(self.conn, "rushing_yards", season=2023, position="RB")
+        self.assertEqual([(row["player_id"], row["total_rushing_yards"]) for row in leaders],
+                         [tuple(row) for row in expected])
+        self.assertEqual(db.getTop5RBsByRushingYards(self.conn, 2023), leaders)
+
+    def test_conference_leaders_keep_their_columns(self):
+        rows = db.get_conference_passing_leaders(self.conn, 2024, "NFC", "West")
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0].keys(), ["player_name", "team_name", "total_yards"])
+        yards = [row["total_yards"] for row in rows]
+        self.assertEqual(yards, sorted(yards, reverse=True))
+
+    def test_wrappers_are_timed_once(self):
+        metrics.reset()
+        db.getTop5QBsByPassingYards(self.conn, 2024)
+        calls = metrics.snapshot()
+        self.assertEqual(calls["getLeaders"]["count"], 1)
+        self.assertNotIn("getTop5QBsByPassingYards", calls)
+
+
+class ArchiveTest(DatabaseTestCase):
+
+    def snapshot(self, conn):
+        return (len(list(db.iterSeasonGameStats(conn, 2018))),
+                [tuple(row) for row in db.getLeaders(conn, "passing_yards", season=2018)],
+                db.get_team_record(conn, "SF", 2018),
+                [tuple(row) for row in db.getTeamSchedule(conn, "SF", 2018)])
+
+    def mainRows(self):
+        return self.conn.execute("SELECT COUNT(*) FROM main.player_game_stats WHERE season = 2018;").fetchone()[0]
+
+    def test_archived_season_reads_the_same_and_refuses_writes(self):
+        self.assertTrue(self.addTestPlayer())
+        before, seq = self.snapshot(self.conn), db.getChangeSeq(self.conn)
+        self.assertTrue(db.archiveSeason(self.conn, 2018))
+        # Moving rows is not a change to them: the feed has nothing to report
+        self.assertEqual(db.getChangesSince(self.conn, seq), [])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "nfl_stats.2010s.sqlite")))
+        self.assertEqual(self.mainRows(), 0)
+        self.assertEqual(self.snapshot(self.conn), before)
+        self.assertEqual([row["season"] for row in db.getArchivedSeasons(self.conn)], [2018])
+        self.assertIn(2018, [row["season"] for row in db.getSeasons(self.conn)])
+        self.assertFalse(db.archiveSeason(self.conn, 2018))
+
+        # A connection opened afterwards attaches the archive too
+        other = db.openConnection(self.dbFile)
+        try:
+            self.assertEqual(self.snapshot(other), before)
+        finally:
+            other.close()
+
+        self.assertFalse(self.addStatLine(season=2018))
+        self.assertFalse(db.addGame(self.conn, "2018_30_SF_LA", 2018, 30, "POST", "SF", "LA", 1))
+        self.assertEqual(self.snapshot(self.conn), before)
+
+    def test_restored_season_is_back_in_the_main_file(self):
+        before = self.snapshot(self.conn)
+        rows = self.mainRows()
+        self.assertTrue(db.archiveSeason(self.conn, 2018, per_season=True))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "nfl_stats.2018.sqlite")))
+        self.assertTrue(db.restoreSeason(self.conn, 2018))
+        self.assertEqual(self.mainRows(), rows)
+        self.assertEqual(self.snapshot(self.conn), before)
+        self.assertEqual(db.getArchivedSeasons(self.conn), [])
+        self.assertFalse(db.restoreSeason(self.conn, 2018))
+
+        self.assertTrue(self.addStatLine(season=2018))
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [])
+        self.assertEqual(db.checkGameParticipants(self.conn), [])
+
+
+class SearchTest(DatabaseTestCase):
+
+    def names(self, query, **kwargs):
+        return [row["player_name"] for row in db.searchPlayers(self.conn, query, **kwargs)]
+
+    def test_prefixes_of_name_words_match(self):
+        self.assertEqual(self.names("pat mah")[0], "Patrick Mahomes")
+        # Punctuation is folded on both sides
+        self.assertEqual(self.names("jamarr")[0], "Ja'Marr Chase")
+        self.assertEqual(db.searchPlayers(self.conn, "ja'marr chase")[0]["score"], 1.0)
+        self.assertEqual(self.names("  "), [])
+        self.assertLessEqual(len(self.names("a", top_k=3)), 3)
+
+    def test_misspellings_fall_back_to_the_closest_names(self):
+        self.assertEqual(self.names("Patrik Mahommes")[0], "Patrick Mahomes")
+        self.assertEqual(self.names("Patrik Mahommes", fuzzy=False), [])
+
+    def test_index_follows_renames_and_deletes(self):
+        self.assertTrue(self.addTestPlayer())
+        self.assertEqual(self.names("testy mc"), ["Testy McTesterson"])
+        self.assertTrue(db.updatePlayerName(self.conn, "TEST_001", "Quentin Zzyzx"))
+        self.assertEqual(self.names("testy mc", fuzzy=False), [])
+        self.assertEqual(self.names("zzyz"), ["Quentin Zzyzx"])
+        self.assertTrue(db.deletePlayer(self.conn, "TEST_001"))
+        self.assertEqual(self.names("zzyz", fuzzy=False), [])
+
+
+class ProfileTest(DatabaseTestCase):
+
+    def busiestPlayer(self):
+        return self.conn.execute("SELECT player_id FROM player_game_stats GROUP BY player_id "
+                                 "ORDER BY COUNT(*) DESC, player_id LIMIT 1;").fetchone()[0]
+
+    def test_snapshot_holds_the_first_page_and_a_cursor_past_it(self):
+        player_id = self.busiestPlayer()
+        profile = db.getPlayerProfile(self.conn, player_id)
+        games = {(m["season"], m["week"]) for m in profile["matchups"]}
+        self.assertEqual(len(games), db.PROFILE_MATCHUP_GAMES)
+        self.assertEqual(profile["matchups_next"], "%d-%d" % min(games))
+
+        full = db.get_player_matchup_history(self.conn, player_id)
+        rows = [dict(m) for m in profile["matchups"]]
+        cursor = profile["matchups_next"]
+        while cursor:
+            page = db.get_player_matchup_history(self.conn, player_id,
+                                                 before=tuple(map(int, cursor.split("-"))),
+                                                 limit=db.PROFILE_MATCHUP_GAMES)
+            rows += [dict(m) for m in page]
+            last = {(m["season"], m["week"]) for m in page}
+            cursor = "%d-%d" % min(last) if len(last) == db.PROFILE_MATCHUP_GAMES else None
+        key = lambda m: (m["season"], m["week"], m["opponent"], m["opposing_coach"] or "")
+        self.assertEqual(sorted(map(key, rows)), sorted(key(dict(m)) for m in full))
+
+    def test_short_careers_have_no_cursor(self):
+        self.assertTrue(self.addStatLine())
+        profile = db.getPlayerProfile(self.conn, "TEST_001")
+        self.assertIsNone(profile["matchups_next"])
+        self.assertEqual(profile["career_stats"]["total_passing_yards"], 99999)
+
+    def test_snapshot_follows_writes_to_the_player(self):
+        player_id = self.busiestPlayer()
+        hits = db.profileCache.hits
+        db.getPlayerProfile(self.conn, player_id)
+        db.getPlayerProfile(self.conn, player_id)
+        self.assertEqual(db.profileCache.hits, hits + 1)
+        self.assertTrue(db.updatePlayerWeight(self.conn, player_id, 321))
+        self.assertEqual(db.getPlayerProfile(self.conn, player_id)["bio"]["weight"], 321)
+        self.assertIsNone(db.getPlayerProfile(self.conn, "NO_SUCH_PLAYER"))
+
+
+if __name__ == "__main__":
+    unittest.main()
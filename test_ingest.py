@@ -0,0 +1,72 @@
+"""Tests for the bulk loaders: addPlayerGameStatsBulk / addGamesBulk and ingest.py."""
+import csv
+import json
+import os
+import unittest
+
+import database_functions as db
+import ingest
+from test_database import DatabaseTestCase
+
+
+class IngestTest(DatabaseTestCase):
+
+    def writeCsv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def statRows(self, passing_yards):
+        return [{"season": 2024, "player_id": "TEST_001", "player_name": "Testy McTesterson",
+                 "week": week, "team": team, "passing_yards": passing_yards, "rushing_yards": ""}
+                for week, team in ((1, "SF"), (2, "SF"), (3, "LA"))]
+
+    def test_stats_load_in_chunks_and_upsert(self):
+        self.assertTrue(self.addTestPlayer())
+        path = self.writeCsv("week.csv", self.statRows(100))
+        self.assertEqual(ingest.ingest(self.conn, "stats", path, chunk_size=2)[::2], (3, True))
+        totals = db.getPlayerRangeTotals(self.conn, "TEST_001", 2024, 2024)
+        self.assertEqual((totals["games_played"], totals["passing_yards"]), (3, 300))
+
+        # Loaded again with new numbers: replaced, not duplicated
+        path = self.writeCsv("week.csv", self.statRows(200))
+        self.assertEqual(ingest.ingest(self.conn, "stats", path)[::2], (3, True))
+        totals = db.getPlayerRangeTotals(self.conn, "TEST_001", 2024, 2024)
+        self.assertEqual((totals["games_played"], totals["passing_yards"]), (3, 600))
+        self.assertEqual(db.checkPlayerSeasonTotals(self.conn), [])
+
+        # addPlayer recorded SF in week 1; only the move to LA is new
+        teams = self.conn.execute("SELECT week, team FROM player_history WHERE player_id = 'TEST_001' "
+                                  "ORDER BY season, week;").fetchall()
+        self.assertEqual([tuple(row) for row in teams], [(1, "SF"), (3, "LA")])
+
+    def test_a_failed_chunk_is_rolled_back(self):
+        self.assertTrue(self.addStatLine(week=2))
+        path = self.writeCsv("week.csv", self.statRows(100))
+        loaded, _, completed = ingest.ingest(self.conn, "stats", path, upsert=False)
+        self.assertEqual((loaded, completed), (0, False))
+        weeks = self.conn.execute("SELECT week FROM player_game_stats WHERE player_id = 'TEST_001';").fetchall()
+        self.assertEqual([row[0] for row in weeks], [2])
+
+    def test_games_build_their_id_and_result(self):
+        before = db.get_team_record(self.conn, "SF", 2030)
+        path = os.path.join(self.directory, "games.jsonl")
+        with open(path, "w") as f:
+            for away, home, away_score, home_score in (("SF", "LA", 24, 17), ("LA", "SF", 10, 3)):
+                f.write(json.dumps({"season": 2030, "week": 1, "season_type": "REG", "away_team": away,
+                                    "home_team": home, "away_score": away_score, "home_score": home_score}))
+                f.write("\n")
+        self.assertEqual(ingest.ingest(self.conn, "games", path)[::2], (2, True))
+        games = self.conn.execute("SELECT game_id, home_win FROM games WHERE season = 2030 "
+                                  "ORDER BY game_id;").fetchall()
+        self.assertEqual([tuple(row) for row in games], [("2030_01_LA_SF", 0), ("2030_01_SF_LA", 0)])
+        self.assertEqual(before, {'wins': 0, 'losses': 0})
+        self.assertEqual(db.get_team_record(self.conn, "SF", 2030), {'wins': 1, 'losses': 1})
+        self.assertEqual(db.checkTeamSeasonRecords(self.conn), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
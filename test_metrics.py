@@ -0,0 +1,63 @@
+"""Tests for metrics: call stats, the /metrics histogram and per-thread collection."""
+import unittest
+
+import metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_histogram_is_cumulative_past_the_window(self):
+        for _ in range(metrics.WINDOW_SIZE + 10):
+            metrics.record("f", 0.003)
+        metrics.record("f", 10.0)
+        buckets = dict(metrics.snapshot()["f"]["buckets"])
+        self.assertEqual(buckets[0.0025], 0)
+        self.assertEqual(buckets[0.005], metrics.WINDOW_SIZE + 10)
+        self.assertEqual(buckets["+Inf"], metrics.WINDOW_SIZE + 11)
+
+    def test_render_emits_prometheus_histograms(self):
+        metrics.record("f", 0.0004)
+        metrics.record("f", 0.2)
+        text = metrics.render({"nfl_db_pool_size": 8}, {"nfl_db_cache_hits_total": 3})
+        self.assertIn("# TYPE nfl_db_call_duration_seconds histogram", text)
+        self.assertIn('nfl_db_call_duration_seconds_bucket{function="f",le="0.0005"} 1', text)
+        self.assertIn('nfl_db_call_duration_seconds_bucket{function="f",le="0.25"} 2', text)
+        self.assertIn('nfl_db_call_duration_seconds_bucket{function="f",le="+Inf"} 2', text)
+        self.assertIn('nfl_db_call_duration_seconds_count{function="f"} 2', text)
+        self.assertIn('nfl_db_slow_calls_total{function="f"} 1', text)
+        self.assertIn('nfl_db_call_duration_recent_seconds{function="f",quantile="0.5"} 0.200000000', text)
+        self.assertIn('nfl_db_call_duration_recent_seconds{function="f",quantile="0.99"} 0.200000000', text)
+        self.assertIn("# TYPE nfl_db_pool_size gauge\nnfl_db_pool_size 8", text)
+        self.assertIn("# TYPE nfl_db_cache_hits_total counter\nnfl_db_cache_hits_total 3", text)
+
+    def test_timed_counts_exceptions(self):
+        @metrics.timed
+        def fails():
+            raise ValueError("no")
+
+        with self.assertRaises(ValueError):
+            fails()
+        self.assertEqual(metrics.snapshot()["fails"]["exceptions"], 1)
+
+    def test_collecting_counts_only_outermost_calls(self):
+        @metrics.timed
+        def inner():
+            pass
+
+        @metrics.timed
+        def outer():
+            inner()
+
+        with metrics.collecting() as timings:
+            outer()
+            outer()
+        self.assertEqual(timings.calls, 2)
+        self.assertEqual(list(timings.functions), ["outer"])
+        self.assertEqual(metrics.snapshot()["inner"]["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Tests for migrations: the versioned schema steps and the query plan check."""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import migrations
+from test_database import SOURCE_DB, migratedTemplate
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="nfl_migration_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_baseline_database_migrates_once(self):
+        path = os.path.join(self.directory, "nfl_stats.sqlite")
+        shutil.copyfile(SOURCE_DB, path)
+        conn = sqlite3.connect(path)
+        try:
+            start = migrations.getSchemaVersion(conn)
+            self.assertEqual(migrations.migrate(conn), migrations.SCHEMA_VERSION - start)
+            self.assertEqual(migrations.getSchemaVersion(conn), migrations.SCHEMA_VERSION)
+            self.assertEqual(migrations.migrate(conn), 0)
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+            self.assertTrue({"idx_pgs_player", "idx_pgs_season_player", "idx_games_home",
+                             "idx_games_away"} <= indexes)
+            # ANALYZE ran, so the planner has statistics for the new indexes
+            analyzed = {row[0] for row in conn.execute("SELECT DISTINCT idx FROM sqlite_stat1;")}
+            self.assertIn("idx_pgs_player", analyzed)
+        finally:
+            conn.close()
+
+    def test_failed_migration_is_rolled_back_and_stops_the_run(self):
+        steps = [
+            (1, "works", ["CREATE TABLE one (x);"]),
+            (2, "fails half way", ["CREATE TABLE two (x);", "CREATE TABLE one (x);"]),
+            (3, "never reached", ["CREATE TABLE three (x);"]),
+        ]
+        conn = sqlite3.connect(":memory:")
+        try:
+            with mock.patch.object(migrations, "MIGRATIONS", steps):
+                self.assertEqual(migrations.migrate(conn), 1)
+            self.assertEqual(migrations.getSchemaVersion(conn), 1)
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                     "AND name NOT LIKE 'sqlite_%';")}
+            self.assertEqual(tables, {"one"})
+        finally:
+            conn.close()
+
+    def test_every_query_path_uses_an_index(self):
+        self.assertEqual(migrations.checkQueryPlans(migratedTemplate()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for replica: the in-memory copy follows the file and its readers keep a stable view."""
+import sqlite3
+import unittest
+
+import database_functions as db
+import replica
+from test_database import DatabaseTestCase
+
+
+class ReplicaTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.replica = replica.Replica(self.dbFile, size=2, interval=0)
+        self.replica.start()
+
+    def tearDown(self):
+        self.replica.stop()
+        super().tearDown()
+
+    def leader(self, conn=None):
+        reader = conn or self.replica.acquire()
+        try:
+            return db.getLeaders(reader, "passing_yards", season=2024)[0]["player_id"]
+        finally:
+            if conn is None:
+                self.replica.release(reader)
+
+    def test_reads_see_this_process_writes_at_once(self):
+        self.assertNotEqual(self.leader(), "TEST_001")
+        self.assertTrue(self.addStatLine())
+        self.assertEqual(self.leader(), "TEST_001")
+        self.assertEqual(self.replica.stats()["refreshes"]["write"], 2)
+
+    def test_other_writers_are_picked_up_by_the_check(self):
+        weight = "SELECT weight FROM players WHERE player_id = '00-0033873';"
+        # Another process, not through database_functions
+        other = sqlite3.connect(self.dbFile)
+        other.execute("UPDATE players SET weight = 1 WHERE player_id = '00-0033873';")
+        other.commit()
+        other.close()
+        reader = self.replica.acquire()
+        self.assertNotEqual(reader.execute(weight).fetchone()[0], 1)
+        self.replica.release(reader)
+
+        self.assertTrue(self.replica.refresh("poll"))
+        self.assertFalse(self.replica.refresh("poll"))
+        reader = self.replica.acquire()
+        self.assertEqual(reader.execute(weight).fetchone()[0], 1)
+        self.replica.release(reader)
+
+    def test_readers_finish_on_their_copy(self):
+        reader = self.replica.acquire()
+        before = self.leader(reader)
+        self.assertTrue(self.addStatLine())
+        db.resultCache.clear()
+        self.assertEqual(self.leader(reader), before)
+        self.assertEqual(self.leader(), "TEST_001")
+        self.assertEqual(self.replica.stats()["copies_in_memory"], 2)
+        self.replica.release(reader)
+        self.assertEqual(self.replica.stats()["copies_in_memory"], 1)
+
+    def test_connections_are_read_only_and_see_archives(self):
+        season = "SELECT COUNT(*) FROM player_game_stats_all WHERE season = 2018;"
+        rows = self.conn.execute(season).fetchone()[0]
+        self.assertTrue(db.archiveSeason(self.conn, 2018))
+        reader = self.replica.acquire()
+        try:
+            self.assertEqual(reader.execute(season).fetchone()[0], rows)
+            self.assertFalse(db.updatePlayerWeight(reader, "00-0033873", 1))
+        finally:
+            self.replica.release(reader)
+        self.assertEqual(self.replica.stats()["archive_copies"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+"""
+Background warm-up of the dashboard tables behind /stats/<stat_type>.
+
+Without it the first request for every (stat type, season) pays the full
+query cost, and right after a deploy every visitor does so at once.
+CacheWarmer lists the seasons at startup and computes every dashboard
+table on a small thread pool. Afterwards it keeps them current: a write
+made through database_functions recomputes only the tables of the seasons
+the write touched, plus the season-less ones, in the background. Writes
+by other processes are found in change_log, which names their seasons
+too.
+
+A request for a table that is still being computed waits for that one
+computation instead of starting its own, so a cold start costs each query
+once, not once per visitor.
+"""
+import concurrent.futures
+import inspect
+import logging
+import sqlite3
+import sys
+import threading
+import time
+
+import database_functions as db
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Writes whose effect is confined to the seasons named in their arguments
+# (a `season` argument, or the `season` of each bulk row). Any other write,
+# e.g. renaming a player, can change every season's tables.
+SEASON_WRITES = {
+    "addGame", "addGamesBulk",
+    "addPlayerGameStats", "addPlayerGameStatsBulk", "deletePlayerGameStats",
+}
+
+def seasonsWritten(func, args, kwargs):
+    """The seasons a database_functions write can have changed; None for all of them."""
+    if func.__name__ not in SEASON_WRITES:
+        return None
+    call = inspect.signature(func).bind(*args, **kwargs).arguments
+    if "rows" in call:
+        return {int(row["season"]) for row in call["rows"]}
+    return {int(call["season"])}
+
+def _sizeOf(value):
+    """Rough deep size in bytes of a cached result (lists / tuples / dicts / rows)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeOf(k) + _sizeOf(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, sqlite3.Row)):
+        size += sum(_sizeOf(v) for v in value)
+    return size
+
+
+class CacheWarmer:
+    """
+    Precomputed dashboard tables, keyed on (stat_type, season) with season
+    None for the tables that do not depend on one.
+
+    compute(conn, stat_type, season) returns the value to keep. Each table
+    is computed on a pooled connection by one of `workers` threads; keep
+    that well below the pool size so requests still get connections.
+    """
+
+    def __init__(self, pool, compute, season_stats, global_stats, workers=2, wait=10.0):
+        self.pool = pool
+        self.compute = compute
+        self.season_stats = tuple(season_stats)
+        self.global_stats = tuple(global_stats)
+        self.wait = wait
+        self.version = None
+        # The last change_log entry accounted for
+        self.changeSeq = None
+        self.hits = 0
+        self.misses = 0
+        self.computed = 0
+        self.failed = 0
+        self._entries = {}
+        self._futures = {}
+        # Bumped when a key is invalidated; a computation that started
+        # under an older stamp finishes without storing its result
+        self._stamps = {}
+        self._seasons = set()
+        self._started_at = None
+        # The initial listing of the seasons, until which nothing is scheduled
+        self._listing = None
+        self._batch_started = None
+        self._batch_seconds = None
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="cache-warmer")
+
+    def start(self):
+        """Lists the seasons and warms every table, in the background."""
+        self._started_at = time.time()
+        db.addWriteListener(self._onWrite)
+        self._listing = self._executor.submit(self._warmAll)
+
+    def stop(self):
+        db.removeWriteListener(self._onWrite)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _warmAll(self):
+        conn = self.pool.acquire()
+        try:
+            self.version = db.getDataVersion(conn)[0]
+            self.changeSeq = db.getChangeSeq(conn)
+            seasons = [row["season"] for row in db.getSeasons(conn)]
+        finally:
+            self.pool.release(conn)
+        self.refresh(seasons, everything=True)
+        logger.info("Warming %d dashboard tables for %d seasons",
+                    len(seasons) * len(self.season_stats) + len(self.global_stats), len(seasons))
+
+    def _keys(self, seasons):
+        return ([(stat, None) for stat in self.global_stats]
+                + [(stat, season) for season in sorted(seasons) for stat in self.season_stats])
+
+    def refresh(self, seasons, everything=False):
+        """
+        Drops and recomputes the season-less tables plus those of `seasons`
+        (every known season too if `everything`), in the background.
+        """
+        with self._lock:
+            seasons = set(seasons) | (self._seasons if everything else set())
+            self._seasons |= seasons
+            if everything:
+                self._entries.clear()
+            if not any(not f.done() for f in self._futures.values()):
+                self._batch_started = time.perf_counter()
+                self._batch_seconds = None
+            for key in self._keys(seasons):
+                self._entries.pop(key, None)
+                self._stamps[key] = self._stamps.get(key, 0) + 1
+                self._futures[key] = self._executor.submit(self._run, key, self._stamps[key])
+
+    def _run(self, key, stamp):
+        conn = self.pool.acquire()
+        try:
+            value = self.compute(conn, *key)
+        except Exception as e:
+            logger.error("Error warming %s for %s: %s", key[0], key[1] or "all seasons", e)
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            self.pool.release(conn)
+
+        with self._lock:
+            self.computed += 1
+            if self._stamps.get(key) == stamp:
+                self._entries[key] = value
+            pending = sum(1 for k, f in self._futures.items() if not f.done() and k != key)
+            if not pending and self._batch_seconds is None and self._batch_started is not None:
+                self._batch_seconds = time.perf_counter() - self._batch_started
+                logger.info("Dashboard tables warm: %d in %.2fs, %.0f KiB held",
+                            len(self._entries), self._batch_seconds, self._entriesSize() / 1024)
+        return value
+
+    def lookup(self, _conn, stat_type, season):
+        """
+        Returns (True, value) for a warm table. A table still being computed
+        is waited for (up to `wait` seconds); a table not scheduled at all, or
+        one that takes too long, is a miss, and the caller computes it itself.
+        """
+        key = (stat_type, season if stat_type in self.season_stats else None)
+        if self._listing is not None and not self._listing.done():
+            # Right after start(): the table is not scheduled yet, but will be
+            try:
+                self._listing.result(timeout=self.wait)
+            except Exception:
+                pass
+        version = db.getDataVersion(_conn)[0]
+        if version is not None and self.version is not None and version != self.version:
+            # Written by another process (or not through database_functions)
+            self.version = version
+            seasons = self._changedSeasons(_conn)
+            if seasons is None:
+                self.refresh((), everything=True)
+            else:
+                self.refresh(seasons)
+
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                return True, self._entries[key]
+            future = self._futures.get(key)
+        if future is not None:
+            try:
+                return True, future.result(timeout=self.wait)
+            except Exception:
+                pass
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def _onWrite(self, func, args, kwargs):
+        seasons = seasonsWritten(func, args, kwargs)
+        _conn = next(iter(inspect.signature(func).bind(*args, **kwargs).arguments.values()))
+        if seasons is None:
+            self.refresh((), everything=True)
+        else:
+            self.refresh(seasons)
+        # Best effort, as in columnar.py: another process writing between the
+        # write and this read is not noticed until its next write
+        self.version = db.getDataVersion(_conn)[0]
+        self.changeSeq = db.getChangeSeq(_conn)
+
+    def _changedSeasons(self, _conn):
+        """
+        The seasons of the change_log entries since changeSeq, which it moves
+        past them; None when that can be any season: a player or coach
+        changed, the write left no entries (e.g. a team), or there are more
+        than one batch.
+        """
+        changes = db.getChangesSince(_conn, self.changeSeq) if self.changeSeq is not None else []
+        if not changes or len(changes) == db.CHANGE_BATCH_SIZE:
+            # Everything is recomputed from here on anyway
+            self.changeSeq = db.getChangeSeq(_conn)
+            return None
+        self.changeSeq = changes[-1]["seq"]
+        seasons = {change["season"] for change in changes}
+        return None if None in seasons else seasons
+
+    def _entriesSize(self):
+        return sum(_sizeOf(value) for value in self._entries.values())
+
+    def stats(self):
+        """Progress and memory use, for /cache/stats."""
+        with self._lock:
+            pending = sum(1 for f in self._futures.values() if not f.done())
+            stats = {
+                "started_at": self._started_at,
+                "seasons": sorted(self._seasons),
+                "tables": len(self._futures),
+                "warm": len(self._entries),
+                "pending": pending,
+                "computed": self.computed,
+                "failed": self.failed,
+                "hits": self.hits,
+                "misses": self.misses,
+                "last_warm_seconds": self._batch_seconds,
+                "change_seq": self.changeSeq,
+                "bytes": self._entriesSize(),
+            }
+        if resource is not None:
+            # Peak resident set of the whole process (KiB on Linux)
+            stats["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return stats